@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+緊急度のマイクロバッチ判定ベンチマーク（スタブモデル使用）
+バーストレートごとに、1件ずつ判定する場合とまとめて判定する場合の
+API呼び出し回数・スループット・平均レイテンシを比較する
+
+    $ uv run python -m benchmarks.bench_batching --rates 5 20 50 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+from benchmarks.stubs import StubGeminiModel
+from managers.urgency import UrgencyClassifier
+
+TEMPLATES = [
+    "決済APIでエラーが発生しています #{n}",
+    "デプロイ #{n} が完了しました",
+    "アラート #{n}: レスポンスタイムが閾値を超えました",
+    "確認お願いします #{n}",
+]
+
+
+async def burst(rate: float, args, batch_window: float):
+    model = StubGeminiModel(latency=args.latency)
+    classifier = UrgencyClassifier(
+        gemini_model=model,
+        batch_window=batch_window,
+        batch_max=args.batch_max,
+    )
+    latencies = []
+
+    async def one(n: int):
+        started = time.perf_counter()
+        await classifier.classify(TEMPLATES[n % len(TEMPLATES)].format(n=n))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tasks = []
+        for n in range(args.messages):
+            tasks.append(asyncio.create_task(one(n)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return model.calls, args.messages / elapsed, sum(latencies) / len(latencies)
+
+
+async def run(args):
+    print(f"📊 {args.messages}メッセージ / モデル応答 {args.latency * 1000:.0f}ms / 窓 {args.window_ms:.0f}ms")
+    for rate in args.rates:
+        for label, window in (("single", 0.0), ("batch", args.window_ms / 1000)):
+            calls, throughput, latency = await burst(rate, args, window)
+            print(
+                f"  rate={rate:6.0f}/s {label:<6} calls={calls:4d} "
+                f"throughput={throughput:7.1f} msg/s avg_latency={latency * 1000:8.1f}ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", type=float, nargs="+", default=[5, 20, 50, 200])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="スタブモデルの応答時間 (秒)")
+    parser.add_argument("--window-ms", type=float, default=50)
+    parser.add_argument("--batch-max", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
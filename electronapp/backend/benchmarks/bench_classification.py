@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+緊急度判定の呼び出し回数・レイテンシ比較（スタブモデル使用）
+- direct  : slack_event で判定 → handle_message で同じ本文を再判定（従来）
+- pipeline: UrgencyResult をイベントと一緒に handle_message へ渡す
+
+    $ uv run python -m benchmarks.bench_classification --messages 50 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+from benchmarks.stubs import StubGeminiModel
+from managers.urgency import UrgencyClassifier
+
+SAMPLE_TEXTS = [
+    "本番サーバーで障害が発生しています、至急確認お願いします",
+    "明日の定例のアジェンダを共有します",
+    "おはようございます",
+    "決済APIでエラーが多発しています",
+    "資料のレビューをお願いできますか？",
+]
+
+
+async def direct_path(classifier: UrgencyClassifier, text: str):
+    result = await classifier.classify(text)
+    if result.is_urgent:
+        # handle_message 内での再判定
+        await classifier.classify(text)
+
+
+async def pipeline_path(classifier: UrgencyClassifier, text: str):
+    result = await classifier.classify(text)
+    if result.is_urgent:
+        # 判定済みの結果をそのまま使う
+        assert result.urgency == "高"
+
+
+async def measure(name, path, args):
+    model = StubGeminiModel(latency=args.latency)
+    classifier = UrgencyClassifier(gemini_model=model)
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n in range(args.messages):
+            started = time.perf_counter()
+            await path(classifier, SAMPLE_TEXTS[n % len(SAMPLE_TEXTS)])
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(
+        f"📊 {name:<8} calls={model.calls:4d} "
+        f"avg={sum(latencies) / len(latencies) * 1000:7.1f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="スタブモデルの応答時間 (秒)")
+    args = parser.parse_args()
+
+    asyncio.run(measure("direct", direct_path, args))
+    asyncio.run(measure("pipeline", pipeline_path, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+緊急度判定中のイベントループ応答性ベンチマーク（スタブモデル使用）
+同じループ上でping/pong（WebSocketのkeep-aliveを模したTCPエコー）を回しながら
+判定を並行実行し、pingの往復時間を比較する
+- blocking: 同期SDKをループ上で直接呼ぶ（従来の analyze_urgency）
+- executor: 同期SDKをスレッドで実行
+- async   : async版SDKを await
+後半では Gemini が遅い場合のOpenAIへのヘッジの効果を表示する
+
+    $ uv run python -m benchmarks.bench_event_loop --inflight 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+from benchmarks.stubs import (
+    AsyncStubGeminiModel,
+    AsyncStubOpenAIClient,
+    StubGeminiModel,
+)
+from managers.urgency import URGENCY_PROMPT, UrgencyClassifier
+
+
+async def echo(reader, writer):
+    while data := await reader.readline():
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def ping_loop(port: int, stop: asyncio.Event, rtts: list):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    while not stop.is_set():
+        started = time.perf_counter()
+        writer.write(b"ping\n")
+        await writer.drain()
+        await reader.readline()
+        rtts.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    writer.close()
+
+
+def classifier_for(mode: str, latency: float):
+    if mode == "blocking":
+        model = StubGeminiModel(latency=latency)
+
+        async def classify(text: str):
+            # 従来どおりループ上で同期SDKを呼ぶ
+            return model.generate_content(URGENCY_PROMPT.format(text=text))
+
+        return classify
+    model = AsyncStubGeminiModel(latency) if mode == "async" else StubGeminiModel(latency)
+    return UrgencyClassifier(gemini_model=model, gemini_concurrency=64).classify
+
+
+async def measure_loop(mode: str, args):
+    server = await asyncio.start_server(echo, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    stop = asyncio.Event()
+    rtts = []
+    pinger = asyncio.create_task(ping_loop(port, stop, rtts))
+    await asyncio.sleep(0.1)
+
+    classify = classifier_for(mode, args.latency)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.rounds):
+            await asyncio.gather(*(classify(f"確認お願いします {n}") for n in range(args.inflight)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await pinger
+    server.close()
+    rtts.sort()
+    print(
+        f"  {mode:<8} ping p50={statistics.median(rtts) * 1000:7.2f}ms "
+        f"p99={rtts[int(len(rtts) * 0.99) - 1] * 1000:8.2f}ms max={rtts[-1] * 1000:8.2f}ms "
+        f"判定 {args.rounds * args.inflight}件 {elapsed:.2f}s"
+    )
+
+
+async def measure_hedge(args):
+    for hedge_delay in (60.0, args.hedge_delay):
+        classifier = UrgencyClassifier(
+            gemini_model=AsyncStubGeminiModel(latency=args.slow_gemini),
+            openai_client=AsyncStubOpenAIClient(latency=args.latency),
+            hedge_delay=hedge_delay,
+        )
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = await asyncio.gather(*(classifier.classify(f"質問 {n}") for n in range(10)))
+        label = "ヘッジなし" if hedge_delay >= 60 else f"ヘッジ {hedge_delay}s"
+        providers = {r.provider for r in results}
+        print(f"  {label:<10} 10件 {time.perf_counter() - started:.2f}s providers={providers}")
+
+
+async def run(args):
+    print(f"📊 同時判定 {args.inflight}件 x {args.rounds}回 / モデル応答 {args.latency * 1000:.0f}ms")
+    for mode in ("blocking", "executor", "async"):
+        await measure_loop(mode, args)
+    print(f"📊 Gemini {args.slow_gemini}s / OpenAI {args.latency}s のときのヘッジ")
+    await measure_hedge(args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inflight", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slow-gemini", type=float, default=3.0)
+    parser.add_argument("--hedge-delay", type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Slackイベント取り込みキューの持続スループット計測
+合成イベントを一定レートで投入し、処理件数・拒否件数・キュー遅延を表示する
+
+    $ uv run python -m benchmarks.bench_event_queue --rate 500 --workers 8
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from managers.event_queue import SlackEventQueue
+
+
+def synthetic_event(n: int) -> dict:
+    """Slack message イベントを模した合成イベント"""
+    return {
+        "type": "message",
+        "channel": f"C{random.randint(0, 20):05d}",
+        "user": f"U{random.randint(0, 300):05d}",
+        "text": f"合成メッセージ #{n}",
+        "ts": f"{time.time():.6f}",
+        "channel_type": "channel",
+    }
+
+
+async def run(args):
+    async def handler(event: dict):
+        # 保存・判定・送信の待ち時間を模擬
+        await asyncio.sleep(random.expovariate(1 / args.work_ms) / 1000)
+
+    queue = SlackEventQueue(
+        handler,
+        maxsize=args.queue_size,
+        workers=args.workers,
+        enqueue_timeout=args.enqueue_timeout,
+    )
+    await queue.start()
+
+    interval = 1 / args.rate
+    started = time.perf_counter()
+    n = 0
+    while time.perf_counter() - started < args.duration:
+        await queue.submit(synthetic_event(n))
+        n += 1
+        # 投入レートを一定に保つ
+        await asyncio.sleep(max(0.0, started + n * interval - time.perf_counter()))
+    submitted_elapsed = time.perf_counter() - started
+
+    await queue.stop()
+    elapsed = time.perf_counter() - started
+    stats = queue.stats()
+
+    print(f"📊 投入: {n}件 / {submitted_elapsed:.1f}s (目標 {args.rate}/s)")
+    print(f"📊 処理: {stats['processed']}件 / {elapsed:.1f}s = {stats['processed'] / elapsed:.1f} events/s")
+    print(f"📊 拒否: {stats['rejected']}件  失敗: {stats['failed']}件")
+    print(
+        f"📊 キュー遅延 avg={stats['lag_avg_seconds'] * 1000:.1f}ms "
+        f"max={stats['lag_max_seconds'] * 1000:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=200, help="投入レート (events/s)")
+    parser.add_argument("--duration", type=float, default=10, help="投入時間 (秒)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--enqueue-timeout", type=float, default=0.5)
+    parser.add_argument("--work-ms", type=float, default=20, help="1イベントあたりの平均処理時間 (ms)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+チャンネルメッセージのFirestore保存ベンチマーク（ローカルエミュレータ用）
+receive_message をメンバー数だけ呼ぶ従来方式と fan_out_message の一括保存を比較する
+
+    $ firebase emulators:start --only firestore
+    $ FIRESTORE_EMULATOR_HOST=localhost:8080 uv run python -m benchmarks.bench_fanout
+"""
+
+import argparse
+import os
+import time
+
+from google.cloud import firestore
+
+from managers.firebase_manager import FirebaseManager
+
+
+def seed_users(manager: FirebaseManager, user_ids):
+    """登録済みユーザーを用意"""
+    batch = manager.db.batch()
+    for i, user_id in enumerate(user_ids, 1):
+        batch.set(manager.db.collection("users").document(user_id), {"user_id": user_id})
+        if i % 500 == 0:
+            batch.commit()
+            batch = manager.db.batch()
+    batch.commit()
+
+
+def run_legacy(manager: FirebaseManager, members, sender_id, message_id):
+    for receiver_id in members:
+        manager.receive_message(
+            receiver_id=receiver_id,
+            sender_id=sender_id,
+            message_id=message_id,
+            channel_id="CBENCH",
+            text="ベンチマーク用メッセージ",
+            is_see=receiver_id == sender_id,
+        )
+
+
+def run_fan_out(manager: FirebaseManager, members, sender_id, message_id):
+    manager.fan_out_message(
+        receiver_ids=members,
+        sender_id=sender_id,
+        message_id=message_id,
+        channel_id="CBENCH",
+        text="ベンチマーク用メッセージ",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=300, help="チャンネルメンバー数")
+    parser.add_argument("--registered", type=int, default=300, help="そのうちアプリ登録済みの人数")
+    parser.add_argument("--messages", type=int, default=20, help="計測するメッセージ数")
+    parser.add_argument("--project", default="demo-fk2505")
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("FIRESTORE_EMULATOR_HOST が未設定です（エミュレータ専用）")
+
+    manager = FirebaseManager(firestore.Client(project=args.project))
+    members = [f"UBENCH{i:05d}" for i in range(args.members)]
+    seed_users(manager, members[:args.registered])
+    sender_id = members[0]
+
+    print(f"👥 メンバー {args.members}人 / 登録済み {args.registered}人 / {args.messages}メッセージ")
+    for name, runner in (("receive_message x N", run_legacy), ("fan_out_message", run_fan_out)):
+        started = time.perf_counter()
+        for n in range(args.messages):
+            runner(manager, members, sender_id, f"{name[:4]}-{time.time_ns()}-{n}")
+        elapsed = time.perf_counter() - started
+        print(
+            f"📊 {name:<20} {elapsed / args.messages * 1000:8.1f} ms/msg  "
+            f"{args.messages / elapsed:8.1f} msg/s  "
+            f"{args.messages * args.registered / elapsed:10.1f} docs/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
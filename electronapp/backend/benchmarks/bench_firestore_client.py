@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+同期 / 非同期 Firestore クライアントのスループット比較（ローカルエミュレータ用）
+Slackイベント --requests 件を同時 --concurrency 件で処理し（1件 = メンバー --members 人への fan_out_message）、
+requests/sec とイベントループの遅れ（10ms ごとのタイマーの遅延）を比べる
+
+  sync-blocking : 同期版を async ハンドラから直接呼ぶ（イベントループが止まる）
+  sync-thread   : 同期版をスレッドプールで呼ぶ（FIRESTORE_CLIENT=sync）
+  async         : AsyncFirebaseManager（FIRESTORE_CLIENT=async）
+
+    $ firebase emulators:start --only firestore
+    $ FIRESTORE_EMULATOR_HOST=localhost:8080 uv run python -m benchmarks.bench_firestore_client --members 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from google.cloud import firestore
+
+from managers.async_firebase_manager import AsyncFirebaseManager
+from managers.firebase_manager import FirebaseManager
+
+
+def seed_users(db, user_ids):
+    batch = db.batch()
+    for i, user_id in enumerate(user_ids, 1):
+        batch.set(db.collection("users").document(user_id), {"user_id": user_id})
+        if i % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+async def loop_lag(stop: asyncio.Event, lags):
+    """10ms ごとに起きて、予定より遅れた時間を記録する"""
+    while not stop.is_set():
+        expected = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run(label: str, handle, users, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop, lags))
+
+    async def one(n: int):
+        async with semaphore:
+            await handle(dict(
+                receiver_ids=users,
+                sender_id=users[0],
+                message_id=f"{label}-{n:06d}",
+                channel_id="CBENCH",
+                text="本番環境で障害が発生しています。至急確認をお願いします。",
+                channel_type="channel",
+            ))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    print(
+        f"  {label:<14} {requests / elapsed:8.1f} req/s  "
+        f"ループ遅延 p50={statistics.median(lags or [0]) * 1000:7.1f}ms p99={p99 * 1000:7.1f}ms "
+        f"max={max(lags or [0]) * 1000:7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=50, help="1イベントあたりの保存先ユーザー数")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16, help="同時に処理するイベント数")
+    parser.add_argument("--fan-out-concurrency", type=int, default=4, help="async 版の同時 commit 数")
+    parser.add_argument("--project", default="demo-fk2505")
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("FIRESTORE_EMULATOR_HOST が未設定です（エミュレータ専用）")
+
+    db = firestore.Client(project=args.project)
+    users = [f"UBENCHCLIENT{i:05d}" for i in range(args.members)]
+    seed_users(db, users)
+    # 登録確認も Firestore に問い合わせる（インデックスなし）
+    sync_manager = FirebaseManager(db)
+
+    async def sync_blocking(kwargs):
+        sync_manager.fan_out_message(**kwargs)
+
+    async def sync_thread(kwargs):
+        await asyncio.to_thread(sync_manager.fan_out_message, **kwargs)
+
+    async def bench():
+        async_manager = AsyncFirebaseManager(
+            firestore.AsyncClient(project=args.project), concurrency=args.fan_out_concurrency
+        )
+
+        async def use_async(kwargs):
+            await async_manager.fan_out_message(**kwargs)
+
+        print(f"📊 メンバー {args.members}人 / {args.requests}イベント / 同時 {args.concurrency}件")
+        await run("sync-blocking", sync_blocking, users, args.requests, args.concurrency)
+        await run("sync-thread", sync_thread, users, args.requests, args.concurrency)
+        await run("async", use_async, users, args.requests, args.concurrency)
+        print(f"  async 版の同時 commit 最大: {async_manager.max_in_flight}")
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
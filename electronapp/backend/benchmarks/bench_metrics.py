@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+メトリクス記録のオーバーヘッド計測
+ヒストグラムの observe・with による計時・カウンタの加算1回あたりの時間と、
+Slackイベント1件分（計時7区間）のコスト、/metrics の出力にかかる時間を測る
+
+    $ uv run python -m benchmarks.bench_metrics --iterations 1000000
+"""
+
+import argparse
+import asyncio
+import time
+
+from managers.metrics import MetricsRegistry
+
+
+def per_call(label: str, fn, iterations: int):
+    started = time.perf_counter()
+    fn(iterations)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28} {elapsed / iterations * 1e9:8.1f} ns/回")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--series", type=int, default=200, help="/metrics に出すラベルの組み合わせ数")
+    args = parser.parse_args()
+
+    metrics = MetricsRegistry()
+    stages = metrics.histogram("stage_seconds", "段ごとの所要時間", ("stage",))
+    child = stages.labels("fan_out")
+    counter = metrics.counter("calls_total", "呼び出し回数", ("provider", "outcome"))
+    ok = counter.labels("gemini", "ok")
+
+    def baseline(n):
+        for _ in range(n):
+            pass
+
+    def observe(n):
+        for _ in range(n):
+            child.observe(0.012)
+
+    def observe_labels(n):
+        for _ in range(n):
+            stages.labels("fan_out").observe(0.012)
+
+    def timer(n):
+        for _ in range(n):
+            with child.time():
+                pass
+
+    def inc(n):
+        for _ in range(n):
+            ok.inc()
+
+    print(f"📊 {args.iterations}回")
+    per_call("空ループ", baseline, args.iterations)
+    per_call("observe（子を保持）", observe, args.iterations)
+    per_call("labels(...).observe", observe_labels, args.iterations)
+    per_call("with child.time()", timer, args.iterations)
+    per_call("counter inc", inc, args.iterations)
+
+    # process_slack_event と同じく1イベントで7区間を計時し、それぞれ await を挟む
+    labels = [stages.labels(stage) for stage in ("ack", "a", "b", "c", "d", "e", "total")]
+
+    async def event(instrumented: bool):
+        for stage in labels:
+            if instrumented:
+                with stage.time():
+                    await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(0)
+
+    async def events(instrumented: bool, n: int) -> float:
+        started = time.perf_counter()
+        for _ in range(n):
+            await event(instrumented)
+        return (time.perf_counter() - started) / n
+
+    n = max(1, args.iterations // 20)
+    plain = asyncio.run(events(False, n))
+    timed = asyncio.run(events(True, n))
+    print(f"  1イベント（7区間）            計時なし {plain * 1e6:6.2f}µs / あり {timed * 1e6:6.2f}µs (+{(timed - plain) * 1e6:.2f}µs)")
+
+    for i in range(args.series):
+        stages.labels(f"stage{i}").observe(0.01 * i)
+    started = time.perf_counter()
+    text = metrics.render({"event_queue": {"depth": 3, "lag_max_seconds": 0.2}})
+    elapsed = time.perf_counter() - started
+    print(f"  /metrics 出力 {len(text.splitlines())}行  {elapsed * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
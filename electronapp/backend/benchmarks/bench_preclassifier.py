@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+ルールベース事前判定のベンチマーク
+ラベル付きコーパス（fixtures/urgency_corpus.jsonl）に対して
+- 事前判定で確定した割合（LLM呼び出しを省けた割合）
+- 確定した判定とラベル / LLM判定との一致率
+- 1件あたりの判定時間
+を表示する。--live を付けると実際のGemini（GEMINI_API_KEY）と比較する
+
+    $ uv run python -m benchmarks.bench_preclassifier
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+from pathlib import Path
+
+from benchmarks.stubs import StubGeminiModel
+from managers.urgency import GEMINI_MODEL, UrgencyClassifier
+from managers.urgency_rules import UrgencyPreClassifier
+
+CORPUS = Path(__file__).parent / "fixtures" / "urgency_corpus.jsonl"
+
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def llm_model(live: bool):
+    if not live:
+        return StubGeminiModel(latency=0)
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+
+async def run(args):
+    corpus = load_corpus()
+    rules = UrgencyPreClassifier()
+    llm = UrgencyClassifier(gemini_model=llm_model(args.live))
+
+    # 事前判定の速度
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for row in corpus:
+            rules.classify(row["text"])
+    per_message = (time.perf_counter() - started) / (args.repeat * len(corpus))
+
+    decided = agree_label = agree_llm = 0
+    disagreements = []
+    for row in corpus:
+        result = UrgencyPreClassifier().classify(row["text"])
+        if result is None:
+            continue
+        decided += 1
+        with contextlib.redirect_stdout(io.StringIO()):
+            llm_result = await llm.classify(row["text"])
+        agree_label += result.urgency == row["label"]
+        agree_llm += result.urgency == llm_result.urgency
+        if result.urgency != row["label"]:
+            disagreements.append((row["text"], result.urgency, row["label"]))
+
+    print(f"📊 コーパス: {len(corpus)}件 / 事前判定で確定: {decided}件 ({decided / len(corpus):.0%})")
+    if decided:
+        print(f"📊 ラベルとの一致率: {agree_label / decided:.1%}")
+        print(f"📊 LLM判定との一致率: {agree_llm / decided:.1%} ({'live' if args.live else 'stub'})")
+    print(f"📊 事前判定 1件あたり: {per_message * 1e6:.1f}µs")
+    for text, got, label in disagreements:
+        print(f"⚠️ 不一致: '{text}' rules={got} label={label}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", action="store_true", help="実際のGemini APIと比較する")
+    parser.add_argument("--repeat", type=int, default=1000, help="速度計測の繰り返し回数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
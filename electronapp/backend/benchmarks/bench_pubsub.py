@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+ワーカー間配信（Pub/Sub）のベンチマーク
+ワーカープロセスを N 個起動し、それぞれが接続（擬似クライアント）を分担して持つ。
+発行プロセスから緊急メッセージを publish し、全ワーカー合計の配信数/秒と配信遅延を比べる
+redis バックエンドは同梱の RESP 互換サーバー（benchmarks/resp_server.py）に対して計測する
+
+    $ uv run python -m benchmarks.bench_pubsub --backend unix --workers 1,2,4
+    $ uv run python -m benchmarks.bench_pubsub --backend redis --workers 1,2,4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.resp_server import RespPubSubServer
+from managers.pubsub import RedisPubSub, UnixSocketPubSub
+from managers.ws_broadcaster import Broadcaster
+
+
+class FakeWebSocket:
+    """
+    受信したメッセージの sent_at から遅延を記録し、送信コストぶんCPUを使う擬似クライアント。
+    接続時の hello / resync_required（sent_at なし）は数えない
+    """
+
+    def __init__(self, send_cost: float, latencies: list):
+        self.send_cost = send_cost
+        self.latencies = latencies
+        self.received = 0
+
+    async def send_text(self, text: str):
+        sent_at = json.loads(text).get("sent_at")
+        if sent_at is None:
+            return
+        # フレーム組み立て・書き込みの代わりにCPUを使う
+        deadline = time.perf_counter() + self.send_cost
+        while time.perf_counter() < deadline:
+            pass
+        self.latencies.append(time.time() - sent_at)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_pubsub(backend: str, address):
+    if backend == "unix":
+        return UnixSocketPubSub(address)
+    return RedisPubSub(f"redis://127.0.0.1:{address}/0", "bench")
+
+
+def worker_main(backend, address, index, workers, clients, send_cost, ready, stop, delivered, results):
+    asyncio.run(worker(backend, address, index, workers, clients, send_cost, ready, stop, delivered, results))
+
+
+async def worker(backend, address, index, workers, clients, send_cost, ready, stop, delivered, results):
+    pubsub = make_pubsub(backend, address)
+    broadcaster = Broadcaster(max_queue=100_000, pubsub=pubsub)
+    await broadcaster.start()
+    latencies = []
+    sockets = []
+    for i in range(index, clients, workers):
+        ws = FakeWebSocket(send_cost, latencies)
+        broadcaster.connect(f"U{i:06d}", ws)
+        sockets.append(ws)
+    while backend == "redis" and not pubsub.subscribed:
+        await asyncio.sleep(0.01)
+    ready.put(index)
+
+    while not stop.is_set():
+        delivered[index] = sum(ws.received for ws in sockets)
+        await asyncio.sleep(0.01)
+
+    latencies.sort()
+    results.put({
+        "delivered": sum(ws.received for ws in sockets),
+        "latencies": latencies[:: max(1, len(latencies) // 10_000)],
+        "dropped": broadcaster.dropped + getattr(pubsub, "dropped", 0),
+    })
+    await broadcaster.stop()
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def run_once(args, backend: str, workers: int):
+    ctx = multiprocessing.get_context("spawn")
+    server = None
+    socket_dir = None
+    if backend == "redis":
+        server = RespPubSubServer()
+        address = await server.start(port=0)
+    else:
+        socket_dir = address = tempfile.mkdtemp(prefix="bench_pubsub_")
+
+    ready, results, stop = ctx.Queue(), ctx.Queue(), ctx.Event()
+    delivered = ctx.Array("q", workers)
+    procs = [
+        ctx.Process(
+            target=worker_main,
+            args=(backend, address, i, workers, args.clients, args.send_cost_us / 1e6, ready, stop, delivered, results),
+        )
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    for _ in range(workers):
+        await asyncio.to_thread(ready.get)
+
+    publisher = Broadcaster(pubsub=make_pubsub(backend, address))
+    users = [f"U{i:06d}" for i in range(args.clients)]
+    random.seed(0)
+    expected = 0
+    started = time.perf_counter()
+    for n in range(args.messages):
+        recipients = random.sample(users, args.recipients)
+        payload = {"type": "new_message", "data": {"id": f"msg-{n}", "text": "至急確認をお願いします"}, "sent_at": time.time()}
+        expected += await publisher.publish(recipients, payload)
+        await asyncio.sleep(1 / args.rate)
+
+    deadline = time.perf_counter() + args.timeout
+    while sum(delivered[:]) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    collected = [await asyncio.to_thread(results.get) for _ in range(workers)]
+    for proc in procs:
+        proc.join()
+    await publisher.stop()
+    if server is not None:
+        await server.stop()
+    if socket_dir is not None:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+    latencies = sorted(l for result in collected for l in result["latencies"])
+    total = sum(result["delivered"] for result in collected)
+    dropped = sum(result["dropped"] for result in collected)
+    print(
+        f"  {backend:<5} workers={workers:<2} delivered={total}/{expected} dropped={dropped} "
+        f"{total / elapsed:9.0f} deliveries/s "
+        f"p50={percentile(latencies, 0.5) * 1000:7.2f}ms p99={percentile(latencies, 0.99) * 1000:7.2f}ms"
+    )
+
+
+async def run(args):
+    print(
+        f"📊 接続 {args.clients} / {args.messages}メッセージ × 宛先{args.recipients}人 "
+        f"/ 送信コスト {args.send_cost_us}µs / {args.rate}件/秒"
+    )
+    backends = ["unix", "redis"] if args.backend == "both" else [args.backend]
+    for backend in backends:
+        for workers in (int(w) for w in args.workers.split(",")):
+            await run_once(args, backend, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["unix", "redis", "both"], default="both")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--recipients", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=200, help="1秒あたりの発行数")
+    parser.add_argument("--send-cost-us", type=float, default=20, help="1送信あたりのCPU時間（µs）")
+    parser.add_argument("--timeout", type=float, default=30)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
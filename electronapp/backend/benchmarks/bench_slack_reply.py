@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+/slack/reply のレイテンシ比較（ユーザープロフィールキャッシュ・共有HTTP接続の有無）
+--users 人が合計 --requests 件の返信を同時 --concurrency 件で送り、1件あたりの時間（p50/p99）を比べる
+
+  従来             : 毎回 users/{user_id} を読み、リクエストごとに新しいHTTPクライアントで送る
+  Firestore+共有接続 : 毎回 users/{user_id} を読み、送信は SlackAPI の共有接続
+  キャッシュ+共有接続 : UserProfileCache で読み込みを省き、送信は SlackAPI の共有接続（USER_CACHE_TTL）
+
+Firestore の読み込みは --firestore-latency 秒の待ちで代用する。
+Slack はローカルのスタブサーバー（chat.postMessage に --slack-latency 秒で応答）で、
+新しい接続の最初の応答だけ --handshake 秒遅らせて slack.com への TCP/TLS 接続確立を模す。
+
+    $ uv run python -m benchmarks.bench_slack_reply --requests 500 --users 20 --firestore-latency 0.03
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from managers.slack_api import SlackAPI
+from managers.user_cache import UserProfileCache
+
+
+class StubSlackServer:
+    """HTTP/1.1 keep-alive で {"ok": true} を返すだけの Slack Web API スタブ"""
+
+    def __init__(self, latency: float, handshake: float):
+        self.latency = latency
+        self.handshake = handshake
+        self.connections = 0
+        self.requests = 0
+        self._server = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/api/"
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        first = True
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self.latency + (self.handshake if first else 0.0))
+                first = False
+                body = json.dumps({"ok": True, "ts": f"{time.time():.6f}"}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run(label: str, reply, args, server: StubSlackServer):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    connections = server.connections
+
+    async def one(n: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await reply(f"UBENCHREPLY{n % args.users:05d}", f"返信 {n}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(
+        f"  {label:<18} {args.requests / elapsed:8.1f} req/s  "
+        f"p50={statistics.median(latencies) * 1000:7.2f}ms p99={latencies[int(len(latencies) * 0.99)] * 1000:7.2f}ms  "
+        f"新規接続 {server.connections - connections:4d}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=20, help="返信するユーザー数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に処理する返信数")
+    parser.add_argument("--firestore-latency", type=float, default=0.03, help="users/{user_id} の読み込み1回の遅延（秒）")
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="chat.postMessage の応答時間（秒）")
+    parser.add_argument("--handshake", type=float, default=0.05, help="新しい接続の確立にかかる時間（秒）")
+    parser.add_argument("--ttl", type=float, default=300.0, help="USER_CACHE_TTL")
+    args = parser.parse_args()
+
+    reads = 0
+
+    async def get_user(user_id: str):
+        nonlocal reads
+        reads += 1
+        await asyncio.sleep(args.firestore_latency)
+        return {"user_id": user_id, "slack_user_token": f"xoxp-{user_id}", "unread_counts": {}}
+
+    async def bench():
+        nonlocal reads
+        server = StubSlackServer(args.slack_latency, args.handshake)
+        base_url = await server.start()
+        slack_api = SlackAPI(base_url=base_url)
+        user_cache = UserProfileCache(get_user, ttl=args.ttl)
+
+        async def legacy(user_id: str, text: str):
+            user_data = await get_user(user_id)
+            async with httpx.AsyncClient() as client:
+                res = await client.post(
+                    base_url + "chat.postMessage",
+                    data={"channel": "CBENCH", "text": text},
+                    headers={"Authorization": f"Bearer {user_data['slack_user_token']}"},
+                )
+                res.json()
+
+        async def pooled(user_id: str, text: str):
+            user_data = await get_user(user_id)
+            await slack_api.client(user_data["slack_user_token"]).chat_postMessage(channel="CBENCH", text=text)
+
+        async def cached(user_id: str, text: str):
+            user_data = await user_cache.get(user_id)
+            await slack_api.client(user_data["slack_user_token"]).chat_postMessage(channel="CBENCH", text=text)
+
+        print(
+            f"📊 {args.requests}件 / {args.users}人 / 同時 {args.concurrency}件 "
+            f"(Firestore {args.firestore_latency * 1000:.0f}ms, Slack {args.slack_latency * 1000:.0f}ms, "
+            f"接続確立 {args.handshake * 1000:.0f}ms)"
+        )
+        for label, reply in (("従来", legacy), ("Firestore+共有接続", pooled), ("キャッシュ+共有接続", cached)):
+            reads = 0
+            await run(label, reply, args, server)
+            print(f"    Firestore読み込み {reads}回")
+        print(f"  キャッシュ: {user_cache.stats()}")
+
+        await slack_api.close()
+        await server.stop()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+メッセージ保存方式（copy / shared）の比較ベンチマーク
+1メッセージをメンバー --members 人のチャンネルに保存した場合の書き込み件数と保存バイト数を、
+fan_out_message と同じドキュメントを組み立てて Firestore のサイズ計算規則で見積もる
+（ドキュメント本体 + 単一フィールドの自動インデックス（昇順・降順、firestore.indexes.json の除外を反映）。
+複合インデックスは含めない）
+未読一覧1ページあたりの読み込み件数も出す（shared は本文の get_all 分が増える）
+
+FIRESTORE_EMULATOR_HOST を設定すると、エミュレータで両方式の保存と未読一覧の取得時間も計測する
+
+    $ uv run python -m benchmarks.bench_storage_layout --members 2 10 50 300
+    $ firebase emulators:start --only firestore
+    $ FIRESTORE_EMULATOR_HOST=localhost:8080 uv run python -m benchmarks.bench_storage_layout --members 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytz
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+
+from managers.firebase_manager import (
+    STORAGE_COPY,
+    STORAGE_SHARED,
+    FirebaseManager,
+    inbox_entry,
+    message_content,
+)
+
+CORPUS = Path(__file__).parent / "fixtures" / "urgency_corpus.jsonl"
+INDEXES = Path(__file__).parent.parent / "firestore.indexes.json"
+
+
+def index_exempt_fields():
+    """fieldOverrides でインデックスを無効にしているフィールド"""
+    overrides = json.loads(INDEXES.read_text(encoding="utf-8")).get("fieldOverrides", [])
+    return {o["fieldPath"] for o in overrides if o.get("collectionGroup") == "messages" and not o.get("indexes")}
+
+
+INDEX_EXEMPT = index_exempt_fields()
+
+
+# ===== Firestore のストレージサイズ計算 =====
+# https://firebase.google.com/docs/firestore/storage-size
+def string_size(value: str) -> int:
+    return len(value.encode("utf-8")) + 1
+
+
+def document_name_size(path: str) -> int:
+    return sum(string_size(segment) for segment in path.split("/")) + 16
+
+
+def value_size(value) -> int:
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return string_size(value)
+    if isinstance(value, dict):
+        return sum(string_size(k) + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(v) for v in value)
+    if hasattr(value, "path"):
+        # DocumentReference
+        return document_name_size(value.path)
+    raise TypeError(f"未対応の型: {type(value)}")
+
+
+def document_size(path: str, data: dict) -> int:
+    return document_name_size(path) + sum(string_size(k) + value_size(v) for k, v in data.items()) + 32
+
+
+def index_size(path: str, data: dict) -> int:
+    """単一フィールドの自動インデックス（昇順・降順の2エントリ）"""
+    name = document_name_size(path)
+    return sum(
+        2 * (name + string_size(k) + value_size(v) + 32)
+        for k, v in data.items()
+        if k not in INDEX_EXEMPT
+    )
+
+
+# ===== 保存方式ごとのドキュメント =====
+def copy_layout(manager: FirebaseManager, members, sender_id, message_id, channel_id, text, now):
+    """fan_out_message（copy）が書くドキュメント [(path, data)]"""
+    content = message_content(sender_id, message_id, channel_id, text, False, False, "channel", now)
+    return [
+        (f"users/{uid}/messages/{message_id}", {**content, "receiver_id": uid, "is_see": uid == sender_id})
+        for uid in members
+    ]
+
+
+def shared_layout(manager: FirebaseManager, members, sender_id, message_id, channel_id, text, now):
+    """fan_out_message（shared）が書くドキュメント [(path, data)]"""
+    content_ref = manager.channel_message_ref(channel_id, message_id)
+    content = message_content(sender_id, message_id, channel_id, text, False, False, "channel", now)
+    docs = [(content_ref.path, content)]
+    docs += [
+        (f"users/{uid}/messages/{message_id}", inbox_entry(content_ref, message_id, channel_id, uid == sender_id, now))
+        for uid in members
+    ]
+    return docs
+
+
+def load_texts(count: int, length: int):
+    """コーパスから本文を count 件作る。length を指定したら文をつないでその長さ前後にする"""
+    with CORPUS.open(encoding="utf-8") as f:
+        sentences = [json.loads(line)["text"] for line in f if line.strip()]
+    if not length:
+        return [sentences[i % len(sentences)] for i in range(count)]
+    texts = []
+    for i in range(count):
+        parts = []
+        while sum(len(p) for p in parts) < length:
+            parts.append(sentences[(i + len(parts) * 7) % len(sentences)])
+        texts.append("。".join(parts)[:length])
+    return texts
+
+
+def estimate(manager: FirebaseManager, members: int, texts, page: int):
+    users = [f"U{i:08d}" for i in range(members)]
+    sender_id = users[0]
+    now = datetime.now(pytz.timezone("Asia/Tokyo"))
+    # 未読カウンタの更新（送信者以外）はどちらの方式も同じ件数
+    counter_writes = members - 1
+
+    results = {}
+    for mode, layout in ((STORAGE_COPY, copy_layout), (STORAGE_SHARED, shared_layout)):
+        writes = doc_bytes = idx_bytes = 0
+        for n, text in enumerate(texts):
+            docs = layout(manager, users, sender_id, f"1760000000.{n:06d}", "C09HETVRA6Q", text, now)
+            writes += len(docs) + counter_writes
+            doc_bytes += sum(document_size(path, data) for path, data in docs)
+            idx_bytes += sum(index_size(path, data) for path, data in docs)
+        # 未読一覧1ページ: copy は page 件、shared は受信箱 page 件 + 本文 page 件（get_all）
+        reads = page if mode == STORAGE_COPY else page * 2
+        results[mode] = (writes / len(texts), doc_bytes / len(texts), idx_bytes / len(texts), reads)
+    return results
+
+
+# ===== エミュレータでの計測 =====
+def seed_users(db, user_ids):
+    batch = db.batch()
+    for i, user_id in enumerate(user_ids, 1):
+        batch.set(db.collection("users").document(user_id), {"user_id": user_id})
+        if i % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def run_emulator(project: str, members: int, texts, page: int):
+    db = firestore.Client(project=project)
+    for mode in (STORAGE_COPY, STORAGE_SHARED):
+        manager = FirebaseManager(db, storage_mode=mode)
+        users = [f"UBENCH{mode.upper()}{i:05d}" for i in range(members)]
+        seed_users(db, users)
+        timings = []
+        for n, text in enumerate(texts):
+            started = time.perf_counter()
+            manager.fan_out_message(
+                receiver_ids=users,
+                sender_id=users[0],
+                message_id=f"1760000000.{n:06d}",
+                channel_id=f"CBENCH{mode.upper()}",
+                text=text,
+                channel_type="channel",
+            )
+            timings.append(time.perf_counter() - started)
+        reads = []
+        for _ in range(5):
+            started = time.perf_counter()
+            manager.unread_messages(users[1], limit=page)
+            reads.append(time.perf_counter() - started)
+        print(
+            f"  {mode:<8} 保存 p50={statistics.median(timings) * 1000:8.1f}ms "
+            f"max={max(timings) * 1000:8.1f}ms / 未読1ページ p50={statistics.median(reads) * 1000:8.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, nargs="+", default=[2, 10, 50, 300])
+    parser.add_argument("--messages", type=int, default=200, help="見積もりに使うメッセージ数（コーパスから）")
+    parser.add_argument("--text-length", type=int, default=0, help="本文の長さ（0ならコーパスの文そのまま）")
+    parser.add_argument("--page", type=int, default=50, help="未読一覧の1ページの件数")
+    parser.add_argument("--project", default="demo-fk2505")
+    args = parser.parse_args()
+
+    texts = load_texts(args.messages, args.text_length)
+    # サイズ計算だけなのでネットワークには繋がない
+    manager = FirebaseManager(firestore.Client(project=args.project, credentials=AnonymousCredentials()))
+
+    print(f"📊 1メッセージあたり（本文 平均{statistics.mean(len(t) for t in texts):.0f}文字, {len(texts)}件の平均）")
+    for members in args.members:
+        results = estimate(manager, members, texts, args.page)
+        copy_total = results[STORAGE_COPY][1] + results[STORAGE_COPY][2]
+        print(f"  メンバー {members}人")
+        for mode, (writes, doc_bytes, idx_bytes, reads) in results.items():
+            total = doc_bytes + idx_bytes
+            print(
+                f"    {mode:<8} 書き込み {writes:7.0f}件  ドキュメント {doc_bytes / 1024:8.1f}KiB  "
+                f"インデックス {idx_bytes / 1024:8.1f}KiB  合計 {total / 1024:8.1f}KiB ({total / copy_total * 100:5.1f}%)  "
+                f"未読1ページの読み込み {reads}件"
+            )
+
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        for members in args.members:
+            print(f"⏱️ エミュレータ: メンバー {members}人 / {min(len(texts), 20)}メッセージ")
+            run_emulator(args.project, members, texts[:20], args.page)
+
+
+if __name__ == "__main__":
+    main()
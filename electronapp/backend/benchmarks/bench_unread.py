@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+未読メッセージ取得のベンチマーク（ローカルエミュレータ用）
+未読 --unread 件のユーザーに対して、従来の全件取得とページ取得（本文あり/なし）、
+全ページの走査、件数取得のレイテンシを比べる
+最後に既読化を1件ずつ（トランザクション）と一括（チャンクごとのバッチ）で比べる（データは既読になる）
+はじめに、カウンタ導入前から未読のあるユーザーの件数が正しいかを確かめる
+
+    $ firebase emulators:start --only firestore
+    $ FIRESTORE_EMULATOR_HOST=localhost:8080 uv run python -m benchmarks.bench_unread --unread 10000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from google.cloud import firestore
+
+from managers.firebase_manager import (
+    FIRESTORE_BATCH_LIMIT,
+    FirebaseManager,
+    unread_counter_ref,
+    unread_counter_update,
+)
+
+
+def seed_unread(manager: FirebaseManager, user_id: str, count: int):
+    """未読メッセージを count 件用意（既存分は作り直す）"""
+    user_ref = manager.db.collection("users").document(user_id)
+    user_ref.set({"user_id": user_id})
+    base = datetime.now(pytz.timezone("Asia/Tokyo"))
+    batch = manager.db.batch()
+    for i in range(count):
+        ts = base - timedelta(seconds=i)
+        batch.set(user_ref.collection("messages").document(f"bench-{i:06d}"), {
+            "sender_id": "UBENCHSENDER",
+            "receiver_id": user_id,
+            "slack_message_id": f"bench-{i:06d}",
+            "channel_id": f"CBENCH{i % 20:02d}",
+            "text": "本番環境で障害が発生しています。至急確認をお願いします。" * 4,
+            "is_ai": False,
+            "is_bot": False,
+            "is_see": False,
+            "channel_type": "channel",
+            "timestamp": ts,
+            "created_at": ts,
+        })
+        if (i + 1) % FIRESTORE_BATCH_LIMIT == 0:
+            batch.commit()
+            batch = manager.db.batch()
+    batch.commit()
+
+
+def check_legacy_counter(manager: FirebaseManager, user_id: str, count: int):
+    """
+    カウンタ導入前から未読 count 件あるユーザーに、新着1件（fan_out と同じ Increment(merge)）と
+    既存の未読の既読化1件が起きたあとで、件数が count 件になっているかを確かめる
+    """
+    seed_unread(manager, user_id, count)
+    user_ref = manager.db.collection("users").document(user_id)
+    unread_counter_ref(user_ref).delete()
+    batch = manager.db.batch()
+    batch.create(user_ref.collection("messages").document("bench-new"), {
+        "receiver_id": user_id,
+        "slack_message_id": "bench-new",
+        "channel_id": "CBENCH00",
+        "is_see": False,
+        "timestamp": datetime.now(pytz.timezone("Asia/Tokyo")),
+    })
+    batch.set(unread_counter_ref(user_ref), unread_counter_update("CBENCH00", 1), merge=True)
+    batch.commit()
+    manager.mark_seen(user_id, "bench-000000")
+    counters = manager.unread_counters(user_id)
+    if counters["count"] != count or any(value < 0 for value in counters["by_channel"].values()):
+        raise SystemExit(f"❌ 既存ユーザーの未読件数が合いません: {counters['count']}件（期待値 {count}件）")
+    print(f"✅ 既存ユーザーの未読件数: {counters['count']}件（カウンタ導入前の未読を含む）")
+
+
+def legacy_scan(manager: FirebaseManager, user_id: str):
+    """従来の GET /messages/unread/{user_id}（全件を読み込んで返す）"""
+    query = (
+        manager.db.collection("users").document(user_id).collection("messages")
+        .where("is_see", "==", False).stream()
+    )
+    messages = []
+    for doc in query:
+        data = doc.to_dict()
+        data["id"] = doc.id
+        messages.append(data)
+    return messages
+
+
+def walk_pages(manager: FirebaseManager, user_id: str, limit: int, fields):
+    total = 0
+    cursor = None
+    while True:
+        messages, cursor = manager.unread_messages(user_id, limit=limit, cursor=cursor, fields=fields)
+        total += len(messages)
+        if cursor is None:
+            return total
+
+
+def measure(label: str, fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    size = len(json.dumps(result, default=str, ensure_ascii=False).encode())
+    print(
+        f"  {label:<32} p50={statistics.median(timings) * 1000:9.1f}ms "
+        f"max={max(timings) * 1000:9.1f}ms  response={size / 1024:9.1f}KiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--unread", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mark-single", type=int, default=100, help="1件ずつ既読にする件数")
+    parser.add_argument("--mark-bulk", type=int, default=2000, help="一括で既読にする件数")
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--project", default="demo-fk2505")
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("FIRESTORE_EMULATOR_HOST が未設定です（エミュレータ専用）")
+
+    manager = FirebaseManager(firestore.Client(project=args.project))
+    check_legacy_counter(manager, "UBENCHLEGACY", 30)
+    user_id = "UBENCHUNREAD"
+    if not args.skip_seed:
+        print(f"🌱 未読 {args.unread}件を作成中...")
+        seed_unread(manager, user_id, args.unread)
+        manager.rebuild_unread_counters(user_id)
+
+    light = ["sender_id", "channel_id", "timestamp"]
+    print(f"📊 未読 {args.unread}件 / 1ページ {args.limit}件 / {args.repeat}回")
+    measure("全件取得（従来）", lambda: legacy_scan(manager, user_id), args.repeat)
+    measure("1ページ目", lambda: manager.unread_messages(user_id, limit=args.limit), args.repeat)
+    measure("1ページ目（本文なし）", lambda: manager.unread_messages(user_id, limit=args.limit, fields=light), args.repeat)
+    _, cursor = manager.unread_messages(user_id, limit=args.limit)
+    measure("2ページ目（カーソル）", lambda: manager.unread_messages(user_id, limit=args.limit, cursor=cursor), args.repeat)
+    measure("全ページ走査（本文なし, 500件/頁）", lambda: walk_pages(manager, user_id, 500, light), 1)
+    measure("件数（カウンタ）", lambda: manager.unread_counters(user_id), args.repeat)
+
+    # 既読化: 1件ずつ vs 一括（ID指定 / チャンネル + ts 指定）
+    ids = [f"bench-{i:06d}" for i in range(args.unread)]
+    single = ids[:args.mark_single]
+    started = time.perf_counter()
+    for message_id in single:
+        manager.mark_seen(user_id, message_id)
+    elapsed = time.perf_counter() - started
+    print(f"  {'既読化 1件ずつ':<32} {len(single)}件 {elapsed * 1000:9.1f}ms ({elapsed / len(single) * 1000:.1f}ms/件)")
+    bulk = ids[args.mark_single:args.mark_single + args.mark_bulk]
+    result = manager.mark_seen_bulk(user_id, message_ids=bulk)
+    print(f"  {'既読化 一括（ID指定）':<32} {result['marked']}件 {result['elapsed_ms']:9.1f}ms ({result['batches']} commit)")
+    result = manager.mark_seen_bulk(user_id, channel_id="CBENCH00", up_to_ts="bench-999999")
+    print(f"  {'既読化 一括（チャンネル+ts）':<32} {result['marked']}件 {result['elapsed_ms']:9.1f}ms ({result['batches']} commit)")
+    print(f"  未読カウンタ: {manager.unread_counters(user_id)['count']}件 / 再集計: {manager.rebuild_unread_counters(user_id)['count']}件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+write-behind バッファのベンチマーク
+Slackイベント --events 件（1件 = メンバー --members 人への fan_out_message）を --workers 並列で処理し、
+直接 commit する場合と WriteBehindBuffer に積む場合（ジャーナルなし/あり）で
+ハンドラの待ち時間・スループット・Firestore への commit 数と書き込み件数・全件反映までの時間を比べる
+既定は一定遅延の Firestore スタブ（--latency 秒/commit、--read-latency 秒/get_all）。FIRESTORE_EMULATOR_HOST を設定するとエミュレータを使う
+登録確認は読み込み済みの RegisteredUserIndex 相当で済ませ、受信箱の存在確認など残りの読み込みだけが待ち時間に入る
+
+    $ uv run python -m benchmarks.bench_write_behind --events 500 --members 20 --latency 0.03
+    $ FIRESTORE_EMULATOR_HOST=localhost:8080 uv run python -m benchmarks.bench_write_behind --events 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stubs import StubFirestoreClient
+from managers.firebase_manager import FirebaseManager
+from managers.write_behind import WriteBehindBuffer
+
+
+def make_client(args):
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        from google.cloud import firestore
+
+        db = firestore.Client(project=args.project)
+        batch = db.batch()
+        for i in range(args.members):
+            batch.set(db.collection("users").document(f"UBENCHWB{i:05d}"), {"user_id": f"UBENCHWB{i:05d}"})
+        batch.commit()
+        return db
+    return StubFirestoreClient(latency=args.latency, read_latency=args.read_latency)
+
+
+class AllRegistered:
+    """読み込み済みの RegisteredUserIndex の代わり（全員登録済み）"""
+
+    ready = True
+
+    def filter(self, user_ids):
+        return list(user_ids)
+
+    def __contains__(self, user_id: str) -> bool:
+        return True
+
+
+async def run(label: str, db, writer, args):
+    manager = FirebaseManager(db, user_index=AllRegistered(), writer=writer)
+    if writer is not None:
+        await writer.start()
+    users = [f"UBENCHWB{i:05d}" for i in range(args.members)]
+    semaphore = asyncio.Semaphore(args.workers)
+    waits = []
+
+    async def one(n: int):
+        async with semaphore:
+            started = time.perf_counter()
+            # main.py の firestore_call と同じくスレッドプールで呼ぶ
+            await asyncio.to_thread(
+                manager.fan_out_message,
+                receiver_ids=users,
+                sender_id=users[n % len(users)],
+                message_id=f"{1760000000 + n}.000100",
+                channel_id=f"CBENCH{n % args.channels:02d}",
+                text="本番環境で障害が発生しています。至急確認をお願いします。",
+                channel_type="channel",
+            )
+            waits.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(args.events)))
+    handled = time.perf_counter() - started
+    if writer is not None:
+        await writer.flush()
+    persisted = time.perf_counter() - started
+
+    waits.sort()
+    line = (
+        f"  {label:<20} {args.events / handled:8.1f} events/s  "
+        f"待ち p50={statistics.median(waits) * 1000:7.2f}ms p99={waits[int(len(waits) * 0.99)] * 1000:7.2f}ms  "
+        f"全件反映 {persisted:6.2f}s"
+    )
+    if isinstance(db, StubFirestoreClient):
+        line += f"  commit {db.commits:5d}回 書き込み {db.writes:6d}件"
+    if writer is not None:
+        line += f"  (まとめた {writer.coalesced}件)"
+        await writer.stop()
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--members", type=int, default=20, help="1イベントあたりの保存先ユーザー数")
+    parser.add_argument("--channels", type=int, default=5, help="イベントを振り分けるチャンネル数")
+    parser.add_argument("--workers", type=int, default=8, help="イベント処理の並列数（SLACK_EVENT_WORKERS）")
+    parser.add_argument("--latency", type=float, default=0.03, help="スタブの commit 1回あたりの遅延（秒）")
+    parser.add_argument("--read-latency", type=float, default=None, help="スタブの get_all 1回あたりの遅延（秒、既定は --latency）")
+    parser.add_argument("--flush-interval", type=float, default=0.2)
+    parser.add_argument("--max-batch", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=4, help="write-behind の同時 commit 数")
+    parser.add_argument("--project", default="demo-fk2505")
+    args = parser.parse_args()
+    if args.read_latency is None:
+        args.read_latency = args.latency
+
+    print(f"📊 {args.events}イベント × {args.members}人 / 並列 {args.workers} / チャンネル {args.channels}")
+
+    async def bench():
+        # Starlette の run_in_threadpool と同じく最大40スレッド
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=40))
+        await run("直接 commit", make_client(args), None, args)
+        db = make_client(args)
+        writer = WriteBehindBuffer(db, args.flush_interval, args.max_batch, concurrency=args.concurrency)
+        await run("write-behind", db, writer, args)
+        with tempfile.TemporaryDirectory() as tmp:
+            db = make_client(args)
+            writer = WriteBehindBuffer(
+                db, args.flush_interval, args.max_batch,
+                journal_path=os.path.join(tmp, "wb.sqlite3"), concurrency=args.concurrency,
+            )
+            await run("write-behind+journal", db, writer, args)
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
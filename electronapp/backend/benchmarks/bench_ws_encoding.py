@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+WebSocketのワイヤーフォーマット比較ベンチマーク
+new_message / unread_update（publish_unread_delta と同じ unread_update_payload）を JSON / msgpack、permessage-deflate の有無で送った場合の
+1メッセージあたりのバイト数と、1回のブロードキャスト（宛先 --recipients 接続）にかかるサーバーCPU時間を比べる
+deflate は接続ごとに圧縮コンテキストを持つ（RFC 7692 の context takeover）ので宛先数に比例してCPUを使う
+
+    $ uv run python -m benchmarks.bench_ws_encoding --recipients 50
+"""
+
+import argparse
+import json
+import random
+import time
+import zlib
+from pathlib import Path
+
+from managers import ws_codec
+from managers.ws_broadcaster import unread_update_payload
+from managers.ws_replay import ReplayBuffer
+
+CORPUS = Path(__file__).parent / "fixtures" / "urgency_corpus.jsonl"
+# 本文の長さ（文字数の目安）
+TEXT_SIZES = {"short": 20, "medium": 100, "long": 500}
+
+
+def load_sentences():
+    with CORPUS.open(encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+def make_text(rng: random.Random, sentences, length: int) -> str:
+    """コーパスの文をランダムにつないで本文を作る（毎回同じ本文だと deflate が効きすぎる）"""
+    parts = []
+    while sum(len(p) for p in parts) < length:
+        parts.append(rng.choice(sentences))
+    return "。".join(parts)[:length]
+
+
+def new_message(n: int, text: str) -> dict:
+    return {
+        "type": "new_message",
+        "data": {
+            "id": f"a1b2c3d4-{n:04d}-4e5f-8a9b-0c1d2e3f4a5b",
+            "channel": "C09HETVRA6Q",
+            "user": "U09HETVRA6Q",
+            "text": text,
+            "timestamp": f"{1760000000 + n}.123456",
+            "urgency": "高",
+        },
+    }
+
+
+def unread_update(n: int, count: int) -> dict:
+    """新着（count=1 で +1）または一括既読（-count）の unread_update"""
+    message_ids = [f"{1760000000 + n + i}.123456" for i in range(count)]
+    return unread_update_payload("C09HETVRA6Q", 1 if count == 1 else -count, message_ids)
+
+
+class Deflater:
+    """permessage-deflate（context takeover あり）の送信側"""
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+    def compress(self, data: bytes) -> bytes:
+        out = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out[:-4]  # 末尾の 00 00 ff ff は送らない
+
+
+def broadcast(encoding: str, deflate: bool, payloads, recipients: int):
+    """(1メッセージあたりの平均バイト数, 1ブロードキャストあたりのCPU秒)"""
+    replay = ReplayBuffer(size=10, max_users=recipients)
+    users = [f"U{i:05d}" for i in range(recipients)]
+    for user_id in users:
+        replay.track(user_id)
+    deflaters = {user_id: Deflater() for user_id in users} if deflate else {}
+
+    total_bytes = 0
+    frames = 0
+    started = time.process_time()
+    for payload in payloads:
+        # Broadcaster._on_published と同じ流れ: 1回エンコードして宛先ごとに連番を差し込む
+        text = ws_codec.encode_json(payload)
+        packed = ws_codec.encode(payload, ws_codec.MSGPACK) if encoding == ws_codec.MSGPACK else None
+        for user_id in users:
+            stamped = replay.append(user_id, text)
+            if packed is not None:
+                frame = ws_codec.stamp_msgpack(packed, replay.current_seq(user_id), replay.epoch)
+            else:
+                frame = stamped.encode()
+            if deflate:
+                frame = deflaters[user_id].compress(frame)
+            total_bytes += len(frame)
+            frames += 1
+    elapsed = time.process_time() - started
+    return total_bytes / frames, elapsed / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    encodings = list(reversed(ws_codec.available_encodings()))
+    if ws_codec.MSGPACK not in encodings:
+        print("⚠️ msgpack が未インストールのため JSON のみ計測します (uv add msgpack)")
+
+    print(f"📊 宛先 {args.recipients}接続 / {args.messages}メッセージ")
+    sentences = load_sentences()
+    rng = random.Random(0)
+    cases = []
+    for size, length in TEXT_SIZES.items():
+        texts = [make_text(rng, sentences, length) for _ in range(args.messages)]
+        cases.append((f"new_message ({size}, 本文{length}文字前後)", [new_message(n, texts[n]) for n in range(args.messages)]))
+    cases.append(("unread_update（新着 +1）", [unread_update(n, 1) for n in range(args.messages)]))
+    cases.append(("unread_update（一括既読 -20）", [unread_update(n * 20, 20) for n in range(args.messages)]))
+
+    for label, payloads in cases:
+        baseline = None
+        print(f"  {label}")
+        for encoding in encodings:
+            for deflate in (False, True):
+                avg_bytes, cpu = broadcast(encoding, deflate, payloads, args.recipients)
+                baseline = baseline or avg_bytes
+                wire = encoding + ("+deflate" if deflate else "")
+                print(
+                    f"    {wire:<16} {avg_bytes:9.0f}B/msg ({avg_bytes / baseline * 100:5.1f}%) "
+                    f"{cpu * 1000:8.3f}ms CPU/broadcast"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+WebSocket送信先の絞り込みベンチマーク（擬似クライアント使用）
+接続中の全クライアントに送る従来方式と、チャンネルメンバーの接続だけに送る方式で
+1イベントあたりの送信数・処理時間・送信バイト数を比較する
+
+    $ uv run python -m benchmarks.bench_ws_fanout --clients 5000 --channel-members 50
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from managers.ws_registry import ConnectionRegistry
+
+
+class FakeWebSocket:
+    """send_json で送ったバイト数だけ数える擬似クライアント"""
+
+    def __init__(self):
+        self.sent = 0
+        self.bytes = 0
+
+    async def send_json(self, data: dict):
+        self.sent += 1
+        self.bytes += len(json.dumps(data, ensure_ascii=False).encode())
+
+
+def message(n: int, channel: str, sender: str) -> dict:
+    return {
+        "type": "new_message",
+        "data": {
+            "id": f"msg-{n}",
+            "channel": channel,
+            "user": sender,
+            "text": "本番環境で障害が発生しています。至急確認をお願いします。" * 2,
+            "timestamp": f"{time.time():.6f}",
+            "urgency": "高",
+        },
+    }
+
+
+async def run(args):
+    users = [f"U{i:06d}" for i in range(args.clients)]
+    registry = ConnectionRegistry()
+    sockets = []
+    for user_id in users:
+        ws = FakeWebSocket()
+        registry.add(user_id, ws)
+        sockets.append(ws)
+    channels = [random.sample(users, args.channel_members) for _ in range(args.channels)]
+
+    print(f"📊 接続 {args.clients} / チャンネルメンバー {args.channel_members}人 / {args.events}イベント")
+    for label in ("broadcast", "targeted"):
+        for ws in sockets:
+            ws.sent = ws.bytes = 0
+        started = time.perf_counter()
+        for n in range(args.events):
+            members = channels[n % len(channels)]
+            payload = message(n, f"C{n % len(channels):04d}", members[0])
+            if label == "broadcast":
+                targets = sockets
+            else:
+                targets = registry.sockets_for(u for u in members if u != members[0])
+            for ws in targets:
+                await ws.send_json(payload)
+        elapsed = time.perf_counter() - started
+        sent = sum(ws.sent for ws in sockets)
+        sent_bytes = sum(ws.bytes for ws in sockets)
+        print(
+            f"  {label:<9} {elapsed / args.events * 1000:8.3f}ms/event "
+            f"sends={sent / args.events:8.1f}/event bytes={sent_bytes / args.events / 1024:9.1f}KiB/event"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--channel-members", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--events", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Redis互換の最小Pub/Subサーバー（PING / AUTH / SUBSCRIBE / UNSUBSCRIBE / PUBLISH のみ）
+Redis を用意できない環境で RedisPubSub を試すためのもの
+
+    $ uv run python -m benchmarks.resp_server --port 6379
+"""
+
+import argparse
+import asyncio
+from typing import Dict, Set
+
+
+def encode_value(value) -> bytes:
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(encode_value(v) for v in value)
+
+
+class RespPubSubServer:
+    def __init__(self):
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.published = 0
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 6379):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _read_command(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: Set[bytes] = set()
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                command = args[0].upper()
+                if command == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif command == b"AUTH":
+                    writer.write(b"+OK\r\n")
+                elif command == b"SUBSCRIBE":
+                    for channel in args[1:]:
+                        self.channels.setdefault(channel, set()).add(writer)
+                        subscribed.add(channel)
+                        writer.write(encode_value([b"subscribe", channel, len(subscribed)]))
+                elif command == b"UNSUBSCRIBE":
+                    for channel in args[1:] or list(subscribed):
+                        self.channels.get(channel, set()).discard(writer)
+                        subscribed.discard(channel)
+                        writer.write(encode_value([b"unsubscribe", channel, len(subscribed)]))
+                elif command == b"PUBLISH":
+                    channel, data = args[1], args[2]
+                    subscribers = self.channels.get(channel, set())
+                    frame = encode_value([b"message", channel, data])
+                    for subscriber in subscribers:
+                        subscriber.write(frame)
+                    self.published += 1
+                    writer.write(encode_value(len(subscribers)))
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % command)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+
+async def main(port: int):
+    server = RespPubSubServer()
+    port = await server.start(port=port)
+    print(f"🚀 RESP Pub/Subサーバー起動: 127.0.0.1:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(main(args.port))
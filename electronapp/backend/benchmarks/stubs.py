@@ -0,0 +1,152 @@
+"""
+ベンチマーク用のスタブAIモデル（Gemini / OpenAI SDKと同じ呼び出し形）と Firestore の書き込みスタブ
+実APIを呼ばずに一定の遅延で判定結果を返す
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+URGENT_WORDS = ("至急", "緊急", "すぐに", "障害", "エラー", "error", "down")
+CASUAL_WORDS = ("おはよう", "お疲れ", "ありがとう", "了解", "👍")
+
+
+def stub_verdict(text: str) -> str:
+    """キーワードだけで決める疑似判定"""
+    if any(word in text for word in URGENT_WORDS):
+        return "高"
+    if any(word in text for word in CASUAL_WORDS):
+        return "低"
+    return "中"
+
+
+_BATCH_LINE = re.compile(r'^\[(\w+)\] (".*")$', re.MULTILINE)
+
+
+def message_of(prompt: str) -> str:
+    """判定プロンプトからメッセージ本文を取り出す"""
+    return prompt.rsplit("メッセージ:", 1)[-1]
+
+
+def stub_answer(content: str) -> str:
+    """一括判定（[ID] "本文" の行がある）ならJSON、単発なら1文字で答える"""
+    lines = _BATCH_LINE.findall(content)
+    if lines:
+        return json.dumps(
+            {message_id: stub_verdict(json.loads(text)) for message_id, text in lines},
+            ensure_ascii=False,
+        )
+    return stub_verdict(content)
+
+
+class StubGeminiModel:
+    """genai.GenerativeModel 互換のスタブ"""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(text=stub_answer(message_of(prompt)))
+
+
+class StubOpenAIClient:
+    """openai.OpenAI 互換のスタブ"""
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        verdict = stub_answer(messages[-1]["content"])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=verdict))]
+        )
+
+
+class AsyncStubGeminiModel(StubGeminiModel):
+    """generate_content_async を持つGeminiスタブ（イベントループを止めない）"""
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=stub_answer(message_of(prompt)))
+
+
+class AsyncStubOpenAIClient(StubOpenAIClient):
+    """openai.AsyncOpenAI 互換のスタブ"""
+
+    def __init__(self, latency: float = 0.5):
+        super().__init__(latency)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_async))
+
+    async def _create_async(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        verdict = stub_answer(messages[-1]["content"])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=verdict))]
+        )
+
+
+class _StubWriteBatch:
+    def __init__(self, client: "StubFirestoreClient"):
+        self._client = client
+        self._writes = 0
+
+    def set(self, reference, document_data, merge=False):
+        self._writes += 1
+
+    def create(self, reference, document_data):
+        self._writes += 1
+
+    def commit(self):
+        time.sleep(self._client.latency + self._client.per_write * self._writes)
+        with self._client.lock:
+            self._client.commits += 1
+            self._client.writes += self._writes
+
+
+class StubFirestoreClient:
+    """
+    firestore.Client 互換のスタブ（書き込み用）
+    参照は本物（ネットワークには繋がない）、commit は一定の遅延のあと件数だけ数える。
+    get_all は users/{id} なら全員登録済み、それ以外（受信箱など）は未作成として返す
+    """
+
+    def __init__(self, latency: float = 0.03, per_write: float = 0.0002, read_latency: Optional[float] = None):
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore
+
+        self.latency = latency
+        self.per_write = per_write
+        self.read_latency = latency if read_latency is None else read_latency
+        self.commits = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self._client = firestore.Client(project="demo-stub", credentials=AnonymousCredentials())
+
+    def collection(self, name: str):
+        return self._client.collection(name)
+
+    def document(self, path: str):
+        return self._client.document(path)
+
+    def batch(self):
+        return _StubWriteBatch(self)
+
+    def get_all(self, references, field_paths=None):
+        time.sleep(self.read_latency)
+        return [
+            SimpleNamespace(id=ref.id, reference=ref, exists=ref.parent.id == "users")
+            for ref in references
+        ]
@@ -1,26 +1,104 @@
+import asyncio
 import hashlib
 import hmac
 import json
 import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import List, Optional
 
 import firebase_admin
 import google.generativeai as genai
-import httpx
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from firebasemanager import firebase_manager
+from fastapi.responses import PlainTextResponse
+from firebasemanager import async_firebase_manager, firebase_manager, user_index, write_behind
+from managers import ws_auth, ws_codec
+from managers.channel_members import ChannelMemberCache
+from managers.event_dedup import EventDeduplicator
+from managers.event_queue import SlackEventQueue
+from managers.firebase_manager import MESSAGE_FIELDS, UNREAD_PAGE_DEFAULT
+from managers.metrics import MetricsRegistry
+from managers.pubsub import create_pubsub
+from managers.slack_api import SlackAPI
+from managers.urgency import GEMINI_MODEL, UrgencyClassifier, UrgencyResult
+from managers.urgency_cache import UrgencyCache
+from managers.unread_feed import UnreadFeed
+from managers.urgency_rules import UrgencyPreClassifier
+from managers.user_cache import UserProfileCache
+from managers.ws_broadcaster import Broadcaster, unread_update_payload
 from pydantic import BaseModel
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-
-app = FastAPI()
+from starlette.concurrency import run_in_threadpool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 登録済みユーザーを読み込み、Slackイベント処理ワーカーを起動
+    # 終了時は残りのイベントを処理してから止める
+    if not WS_AUTH_SECRET:
+        if WS_AUTH_DISABLED:
+            print("⚠️⚠️⚠️ WS_AUTH_DISABLED=true: /ws は user_id だけで誰の接続でも受け付けます（ローカル開発専用）")
+        else:
+            print("⚠️⚠️⚠️ WS_AUTH_SECRET が未設定のため /ws の接続をすべて拒否します（.env.example を参照）")
+    await run_in_threadpool(user_index.start)
+    if write_behind is not None:
+        await write_behind.start()
+    await broadcaster.start()
+    await slack_event_queue.start()
+    yield
+    await slack_event_queue.stop(timeout=SLACK_EVENT_DRAIN_TIMEOUT)
+    if write_behind is not None:
+        # 処理し終えたイベントの書き込みを commit してから止める
+        await write_behind.stop()
+    await unread_feed.stop()
+    await broadcaster.stop()
+    await slack_api.close()
+    user_index.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 load_dotenv()
 
-# WebSocket接続管理
-active_connections: List[WebSocket] = []
+# Prometheus 形式のメトリクス（/metrics で出力）
+metrics = MetricsRegistry()
+
+# ===== WebSocket送信設定 =====
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "disconnect")  # "disconnect" | "drop"
+# 緊急メッセージに発行時刻 sent_at（UNIX秒）を付ける（配信遅延の計測用、クライアントは使わない）
+WS_SENT_AT_ENABLED = os.getenv("WS_SENT_AT_ENABLED", "false").lower() == "true"
+
+WS_REPLAY_SIZE = int(os.getenv("WS_REPLAY_SIZE", "50"))  # 再接続時に再送できるユーザーごとの件数
+WS_REPLAY_MAX_USERS = int(os.getenv("WS_REPLAY_MAX_USERS", "5000"))
+
+# ===== ワーカー間の配信（Pub/Sub）設定 =====
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")  # "memory" | "unix" | "redis"
+PUBSUB_SOCKET_DIR = os.getenv("PUBSUB_SOCKET_DIR", "/tmp/fk_2505_pubsub")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "urgent-messages")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# WebSocket接続管理（SlackユーザーID → 接続、接続ごとの送信キュー、ワーカー間の配信）
+broadcaster = Broadcaster(
+    max_queue=WS_SEND_QUEUE_SIZE,
+    overflow_policy=WS_OVERFLOW_POLICY,
+    pubsub=create_pubsub(PUBSUB_BACKEND, PUBSUB_SOCKET_DIR, REDIS_URL, PUBSUB_CHANNEL),
+    replay_size=WS_REPLAY_SIZE,
+    replay_max_users=WS_REPLAY_MAX_USERS,
+)
+broadcaster.register_metrics(metrics)
+# ===== 未読フィード（Firestoreリスナー）設定 =====
+UNREAD_FEED_ENABLED = os.getenv("UNREAD_FEED_ENABLED", "true").lower() == "true"
+UNREAD_FEED_MAX_LISTENERS = int(os.getenv("UNREAD_FEED_MAX_LISTENERS", "1000"))
+
+# 接続中ユーザーの未読の変更をこのワーカーの接続へ連番付きで流す
+unread_feed = UnreadFeed(
+    firebase_manager.db,
+    deliver=lambda user_id, payload: broadcaster.deliver_local([user_id], payload),
+    max_listeners=UNREAD_FEED_MAX_LISTENERS,
+    join=firebase_manager.join_messages,
+)
 # ===== Slack環境変数 =====
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
@@ -34,7 +112,7 @@ gemini_model = None
 if GEMINI_API_KEY:
     try:
         genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+        gemini_model = genai.GenerativeModel(GEMINI_MODEL)
         print("✅ Gemini API初期化完了")
     except Exception as e:
         print(f"⚠️ Gemini API初期化失敗: {e}")
@@ -43,8 +121,8 @@ if GEMINI_API_KEY:
 openai_client = None
 if OPENAI_API_KEY:
     try:
-        from openai import OpenAI
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        from openai import AsyncOpenAI
+        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
         print("✅ OpenAI API初期化完了")
     except Exception as e:
         print(f"⚠️ OpenAI API初期化失敗: {e}")
@@ -53,12 +131,125 @@ if OPENAI_API_KEY:
 if not gemini_model and not openai_client:
     print("⚠️ 警告: Gemini/OpenAI API両方とも未設定です。緊急度判定はデフォルト値を返します。")
 
-slack_client = WebClient(token=os.environ["SLACK_BOT_TOKEN"])
+# ===== 緊急度判定キャッシュ設定（PATH未指定ならメモリのみ） =====
+URGENCY_CACHE_SIZE = int(os.getenv("URGENCY_CACHE_SIZE", "5000"))
+URGENCY_CACHE_TTL = float(os.getenv("URGENCY_CACHE_TTL", str(24 * 60 * 60)))
+URGENCY_CACHE_PATH = os.getenv("URGENCY_CACHE_PATH") or None
+# ルールベースの事前判定（"false" でLLMのみ）
+URGENCY_RULES_ENABLED = os.getenv("URGENCY_RULES_ENABLED", "true").lower() == "true"
+# 短時間に続けて届いたメッセージをまとめて判定（間が空いて届いたものは待たない。WINDOW_MS=0 で1件ずつ）
+URGENCY_BATCH_WINDOW_MS = float(os.getenv("URGENCY_BATCH_WINDOW_MS", "50"))
+URGENCY_BATCH_MAX = int(os.getenv("URGENCY_BATCH_MAX", "20"))
+# LLM呼び出しの同時実行数・タイムアウト・OpenAIへのヘッジ開始までの秒数
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "8"))
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "10"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+
+# 緊急度判定（判定結果はイベントと一緒に handle_message まで渡す）
+urgency_classifier = UrgencyClassifier(
+    gemini_model=gemini_model,
+    openai_client=openai_client,
+    cache=UrgencyCache(
+        maxsize=URGENCY_CACHE_SIZE,
+        ttl=URGENCY_CACHE_TTL,
+        path=URGENCY_CACHE_PATH,
+    ),
+    pre_classifier=UrgencyPreClassifier() if URGENCY_RULES_ENABLED else None,
+    batch_window=URGENCY_BATCH_WINDOW_MS / 1000,
+    batch_max=URGENCY_BATCH_MAX,
+    gemini_concurrency=GEMINI_CONCURRENCY,
+    openai_concurrency=OPENAI_CONCURRENCY,
+    timeout=LLM_TIMEOUT,
+    hedge_delay=LLM_HEDGE_DELAY,
+)
+urgency_classifier.register_metrics(metrics)
+
+# Slack Web API（接続プール共有・トークンごとのクライアントを再利用）
+slack_api = SlackAPI()
+slack_client = slack_api.client(os.environ["SLACK_BOT_TOKEN"])
+
+# ===== チャンネルメンバーキャッシュ設定 =====
+CHANNEL_MEMBERS_TTL = float(os.getenv("CHANNEL_MEMBERS_TTL", "600"))
+CHANNEL_MEMBERS_MAX_CHANNELS = int(os.getenv("CHANNEL_MEMBERS_MAX_CHANNELS", "1000"))
+
+# チャンネル → メンバー一覧（参加/退出イベントで更新）
+channel_members_cache = ChannelMemberCache(
+    lambda channel_id: slack_client.conversations_members_all(channel=channel_id),
+    ttl=CHANNEL_MEMBERS_TTL,
+    max_channels=CHANNEL_MEMBERS_MAX_CHANNELS,
+)
+
+# ===== ユーザープロフィールキャッシュ設定 =====
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", "10000"))
+
+# ユーザーID → プロフィール（/slack/reply のトークン取得で Firestore を読まない）
+user_cache = UserProfileCache(
+    lambda user_id: firestore_call("get_user", user_id),
+    ttl=USER_CACHE_TTL,
+    max_users=USER_CACHE_MAX_USERS,
+)
+
+# トークンが失効・差し替えられたときの Slack のエラー（キャッシュを捨てて1回だけ取り直す）
+STALE_TOKEN_ERRORS = {"invalid_auth", "token_revoked", "token_expired", "account_inactive"}
+
+# メンバー構成が変わるイベント（キューに積まずにキャッシュへ反映）
+MEMBERSHIP_EVENTS = {
+    "member_joined_channel",
+    "member_left_channel",
+    "channel_deleted",
+    "channel_archive",
+    "group_deleted",
+    "group_archive",
+}
 
 SLACK_CLIENT_ID = os.getenv("SLACK_CLIENT_ID")
 SLACK_CLIENT_SECRET = os.getenv("SLACK_CLIENT_SECRET")
 SLACK_REDIRECT_URI = os.getenv("SLACK_REDIRECT_URI")
 
+# WebSocket接続時のユーザー認証用（未設定なら接続を拒否する）
+WS_AUTH_SECRET = os.getenv("WS_AUTH_SECRET")
+# ws_token の有効期間（秒）。期限内のトークンは POST /ws-token で更新できる
+WS_TOKEN_TTL = int(os.getenv("WS_TOKEN_TTL", "604800"))
+# true なら WS_AUTH_SECRET なしで user_id だけの接続を受け付ける（ローカル開発・負荷テスト専用）
+WS_AUTH_DISABLED = os.getenv("WS_AUTH_DISABLED", "false").lower() == "true"
+
+# ===== Slackイベント取り込みキュー設定 =====
+SLACK_EVENT_QUEUE_SIZE = int(os.getenv("SLACK_EVENT_QUEUE_SIZE", "1000"))
+SLACK_EVENT_WORKERS = int(os.getenv("SLACK_EVENT_WORKERS", "4"))
+SLACK_EVENT_DRAIN_TIMEOUT = float(os.getenv("SLACK_EVENT_DRAIN_TIMEOUT", "10"))  # 停止時に残りを処理する最大秒数
+SLACK_EVENT_DEDUP_SIZE = int(os.getenv("SLACK_EVENT_DEDUP_SIZE", "10000"))
+SLACK_EVENT_DEDUP_TTL = float(os.getenv("SLACK_EVENT_DEDUP_TTL", "600"))
+
+# 再送イベントの重複排除キャッシュ
+event_dedup = EventDeduplicator(maxsize=SLACK_EVENT_DEDUP_SIZE, ttl=SLACK_EVENT_DEDUP_TTL)
+
+# Slackイベント処理の段ごとの所要時間（ack: /slack/event の受付、total: キューから取り出した後の全体）
+slack_event_stage_seconds = metrics.histogram(
+    "slack_event_stage_seconds",
+    "Slackイベント処理の段ごとの所要時間",
+    ("stage",),
+)
+STAGE_ACK = slack_event_stage_seconds.labels("ack")
+STAGE_CHANNEL_MEMBERS = slack_event_stage_seconds.labels("channel_members")
+STAGE_FAN_OUT = slack_event_stage_seconds.labels("fan_out")
+STAGE_UNREAD_DELTA = slack_event_stage_seconds.labels("unread_delta")
+STAGE_CLASSIFY = slack_event_stage_seconds.labels("classify")
+STAGE_BROADCAST = slack_event_stage_seconds.labels("broadcast")
+STAGE_TOTAL = slack_event_stage_seconds.labels("total")
+
+
+async def firestore_call(method: str, *args, **kwargs):
+    """
+    Firestore の処理をイベントループを止めずに呼ぶ。
+    FIRESTORE_CLIENT=async なら AsyncFirebaseManager の同名メソッドを await し、
+    そうでなければ（または async 版に無い処理なら）同期版をスレッドプールで呼ぶ。
+    """
+    if async_firebase_manager is not None and hasattr(async_firebase_manager, method):
+        return await getattr(async_firebase_manager, method)(*args, **kwargs)
+    return await run_in_threadpool(getattr(firebase_manager, method), *args, **kwargs)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -81,6 +272,11 @@ class SlackReplyRequest(BaseModel):
     text: str
     thread_ts: str | None = None
     
+class MarkReadRequest(BaseModel):
+    message_ids: List[str] | None = None
+    channel_id: str | None = None
+    up_to_ts: str | None = None  # このSlack ts以下のメッセージを既読にする（channel_idと併用）
+
 class UserRegisterRequest(BaseModel):
     real_name: str | None = None
     display_name: str | None = None
@@ -99,28 +295,25 @@ async def register_user(user: UserRegisterRequest):
         slack_user_id = None
 
         if user.slack_code:
-            async with httpx.AsyncClient() as client:
-                res = await client.post(
-                    "https://slack.com/api/oauth.v2.access",
-                    data={
-                        "client_id": SLACK_CLIENT_ID,
-                        "client_secret": SLACK_CLIENT_SECRET,
-                        "code": user.slack_code,
-                        "redirect_uri": SLACK_REDIRECT_URI,
-                    },
-                )
-                data = res.json()
-                print(json.dumps(data, indent=2, ensure_ascii=False))
-                print("📥 Slack OAuth Response:", data)  # ← デバッグ出力
-                if not data.get("ok"):
-                    raise HTTPException(status_code=400, detail=f"Slack OAuth failed: {data}")
-                slack_user_token = data.get("authed_user", {}).get("access_token")
-                slack_user_id = data.get("authed_user", {}).get("id")
-                slack_team_id = data.get("team", {}).get("id")
-                print("✅ Slack OAuth成功:", data)
+            # 共有のHTTP接続プールでコードをトークンに交換
+            data = await slack_api.oauth_access(
+                client_id=SLACK_CLIENT_ID,
+                client_secret=SLACK_CLIENT_SECRET,
+                code=user.slack_code,
+                redirect_uri=SLACK_REDIRECT_URI,
+            )
+            print(json.dumps(data, indent=2, ensure_ascii=False))
+            print("📥 Slack OAuth Response:", data)  # ← デバッグ出力
+            if not data.get("ok"):
+                raise HTTPException(status_code=400, detail=f"Slack OAuth failed: {data}")
+            slack_user_token = data.get("authed_user", {}).get("access_token")
+            slack_user_id = data.get("authed_user", {}).get("id")
+            slack_team_id = data.get("team", {}).get("id")
+            print("✅ Slack OAuth成功:", data)
 
         # 🔹 Firestore登録（既存メソッド呼び出し）
-        firestore_data = firebase_manager.create_or_update_user(
+        firestore_data = await firestore_call(
+            "create_or_update_user",
             user_id=slack_user_id or "",
             real_name=user.real_name or "",
             display_name=user.display_name or "",
@@ -129,7 +322,18 @@ async def register_user(user: UserRegisterRequest):
             slack_user_token=slack_user_token or ""
         )
 
-        return {"status": "success", "data": firestore_data}
+        if slack_user_id:
+            # キャッシュ済みのプロフィールを新しいトークンに差し替え、古いトークンのクライアントは捨てる
+            cached = user_cache.peek(slack_user_id)
+            if cached and cached.get("slack_user_token") not in (None, firestore_data.get("slack_user_token")):
+                slack_api.discard(cached["slack_user_token"])
+            user_cache.put(slack_user_id, firestore_data)
+
+        response = {"status": "success", "data": firestore_data}
+        if WS_AUTH_SECRET and slack_user_id:
+            # デスクトップアプリが /ws に接続するときに使うトークン
+            response.update(issue_ws_token(slack_user_id))
+        return response
 
     except Exception as e:
         print("❌ Firestore登録エラー:", e)
@@ -145,75 +349,42 @@ async def analyze_urgency(text: str) -> str:
     Gemini優先、失敗時はOpenAIにフォールバック
     Returns: "低" | "中" | "高"
     """
-    # 判定用プロンプト（f-stringで変数展開）
-    prompt_text = f"""あなたはSlackメッセージの緊急度を判定するAIです。
-以下の基準で判定してください:
-
-【高】即座の対応が必要
-- システム障害、エラー、緊急のバグ報告
-- 締切が迫っている重要なタスク
-- 顧客からのクレームや緊急の問い合わせ
-- セキュリティ関連の警告
-- 「至急」「緊急」「すぐに」などの緊急を示す言葉
-
-【中】通常の業務連絡
-- 一般的な質問や相談
-- 通常のタスク依頼
-- 情報共有
-
-【低】確認不要または雑談
-- 雑談、挨拶
-- 既読確認のみで対応不要なもの
-- スタンプのみのリアクション
-
-回答は必ず「低」「中」「高」のいずれか1文字のみで返してください。
-
-メッセージ:
-{text}"""
-
-    # ✅ 1. Gemini APIを試す
-    if gemini_model:
-        try:
-            print("🔵 Gemini APIで判定中...")
-            response = gemini_model.generate_content(prompt_text)
-            urgency = response.text.strip()
-            print(f"🤖 Gemini判定結果: '{urgency}'")
-
-            # 正規化
-            if urgency in ["低", "中", "高"]:
-                return urgency
-            else:
-                print(f"⚠️ 予期しない判定結果: {urgency}")
-        except Exception as e:
-            print(f"❌ Gemini API エラー: {e}")
-
-    # ✅ 2. OpenAI APIにフォールバック
-    if openai_client:
-        try:
-            print("🟢 OpenAI APIで判定中...")
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": prompt_text.split("メッセージ:")[0]},
-                    {"role": "user", "content": f"以下のメッセージの緊急度を判定してください:\n\n{text}"}
-                ],
-                temperature=0.3,
-                max_tokens=10
-            )
-            urgency = response.choices[0].message.content.strip()
-            print(f"🤖 OpenAI判定結果: '{urgency}'")
+    result = await urgency_classifier.classify(text)
+    return result.urgency
 
-            # 正規化
-            if urgency in ["低", "中", "高"]:
-                return urgency
-            else:
-                print(f"⚠️ 予期しない判定結果: {urgency}")
-        except Exception as e:
-            print(f"❌ OpenAI API エラー: {e}")
+# =========================================================
+# 🔑 WebSocket接続トークン
+# =========================================================
+def issue_ws_token(user_id: str) -> dict:
+    """SlackユーザーIDに対するWebSocket接続用トークンを発行（WS_TOKEN_TTL 秒で失効）"""
+    token = ws_auth.issue_token(WS_AUTH_SECRET, user_id, WS_TOKEN_TTL)
+    return {"ws_token": token, "ws_token_expires_at": ws_auth.token_expires_at(token)}
+
+
+def verify_ws_token(user_id: str, token: Optional[str]) -> bool:
+    """
+    トークンの署名と有効期限を検証する。
+    WS_AUTH_SECRET が未設定なら拒否（WS_AUTH_DISABLED=true の場合だけ検証しない）
+    """
+    if not WS_AUTH_SECRET:
+        return WS_AUTH_DISABLED
+    return ws_auth.verify_token(WS_AUTH_SECRET, user_id, token)
+
+
+class WsTokenRefreshRequest(BaseModel):
+    user_id: str
+    ws_token: str
+
+
+@app.post("/ws-token")
+async def refresh_ws_token(request: WsTokenRefreshRequest):
+    """有効期限内の ws_token を新しいものに交換する（期限切れなら /register-user からやり直す）"""
+    if not WS_AUTH_SECRET:
+        raise HTTPException(status_code=404, detail="WS_AUTH_SECRET is not configured")
+    if not ws_auth.verify_token(WS_AUTH_SECRET, request.user_id, request.ws_token):
+        raise HTTPException(status_code=401, detail="Invalid or expired ws_token")
+    return issue_ws_token(request.user_id)
 
-    # ✅ 3. 両方とも失敗した場合はデフォルト値
-    print("⚠️ すべてのAI APIが使用不可 - デフォルトで'中'を返します")
-    return "中"
 
 # =========================================================
 # 🔒 Slack署名検証関数
@@ -241,6 +412,12 @@ def verify_slack_request(request: Request, body: bytes) -> bool:
 
 @app.post("/slack/event")
 async def slack_event(request: Request):
+    with STAGE_ACK.time():
+        return await accept_slack_event(request)
+
+
+async def accept_slack_event(request: Request):
+    """署名検証・重複排除のあとキューに積む（処理は process_slack_event で行う）"""
     body = await request.body()
     print("Headers:", request.headers)
 
@@ -255,82 +432,243 @@ async def slack_event(request: Request):
         print("✅ challenge確認リクエストを受信しました")
         return {"challenge": data["challenge"]}
     
-    # ✅ 通常イベント内容の確認
+    # ✅ 再送イベントは重複排除（判定・保存を繰り返さない）
+    retry_num = request.headers.get("X-Slack-Retry-Num")
+    dedup_keys = EventDeduplicator.keys_for(data)
+    if event_dedup.check_and_add(dedup_keys, retry_num=int(retry_num) if retry_num else None):
+        print(f"♻️ 重複イベントをスキップ (retry={retry_num}, keys={dedup_keys})")
+        return {"ok": True}
+
     event = data.get("event", {})
+
+    # ✅ メンバー参加/退出はチャンネルメンバーキャッシュに反映するだけ
+    if event.get("type") in MEMBERSHIP_EVENTS:
+        update_channel_members(event)
+        return {"ok": True}
+
+    # ✅ 通常イベントはキューに積んで即座にACK（Slackの3秒制限対策）
+    if not await slack_event_queue.submit(event):
+        # キュー満杯: 記録を消してSlack側の再送に任せる
+        event_dedup.forget(dedup_keys)
+        raise HTTPException(status_code=503, detail="Event queue is full")
+
+    return {"ok": True}
+
+
+def update_channel_members(event: dict):
+    """メンバー構成の変更イベントをチャンネルメンバーキャッシュに反映"""
+    event_type = event.get("type")
+    channel_id = event.get("channel")
+    if isinstance(channel_id, dict):
+        # channel_archive 等ではチャンネル情報がオブジェクトで届く場合がある
+        channel_id = channel_id.get("id")
+
+    if event_type == "member_joined_channel":
+        channel_members_cache.member_joined(channel_id, event.get("user"))
+    elif event_type == "member_left_channel":
+        channel_members_cache.member_left(channel_id, event.get("user"))
+    else:
+        channel_members_cache.invalidate(channel_id)
+    print(f"👥 チャンネルメンバー更新: {event_type} ({channel_id})")
+
+
+async def process_slack_event(event: dict):
+    """キューから取り出したSlackイベントを保存・緊急度判定・ブロードキャストする"""
+    with STAGE_TOTAL.time():
+        await handle_slack_event(event)
+
+
+async def handle_slack_event(event: dict):
     channel_id = event.get("channel")
     sender_id = event.get("user")
     text = event.get("text")
     ts = event.get("ts")
 
-    # チャンネルの全メンバーを取得
-    members_response = slack_client.conversations_members(channel=channel_id)
-    channel_members = members_response["members"]
+    # チャンネルの全メンバーを取得（通常はキャッシュから、100人を超える場合もページングで全員分）
+    with STAGE_CHANNEL_MEMBERS.time():
+        channel_members = await channel_members_cache.get(channel_id)
     print("👥 チャンネルメンバー一覧:", channel_members)
 
-    # 各ユーザーに対してメッセージ保存
-    for receiver_id in channel_members:
-        # 👇 自分宛てなら既読扱いにする
-        is_see = receiver_id == sender_id
-        firebase_manager.receive_message(
-            receiver_id=receiver_id,  # 🔥 アプリ利用者（Botではない）
+    # 登録済みメンバー分のメッセージを一括保存（送信者本人は既読扱い）
+    with STAGE_FAN_OUT.time():
+        receivers = await firestore_call(
+            "fan_out_message",
+            receiver_ids=channel_members,
             sender_id=sender_id,      # 発言者
             message_id=ts,
             channel_id=channel_id,
             text=text,
             is_ai=False,
             is_bot=False,
-            is_see=is_see,
             channel_type=event.get("channel_type", "im")
         )
-    
-    # 🤖 AI緊急度判定
+
+    # 🔢 未読カウンタの差分をWebSocketで通知（バッジ更新でFirestoreを読まずに済む）
+    with STAGE_UNREAD_DELTA.time():
+        await publish_unread_delta(
+            (user_id for user_id in receivers if user_id != sender_id),
+            channel_id=channel_id,
+            delta=1,
+            message_ids=[ts],
+        )
+
+    # 🤖 AI緊急度判定（1メッセージにつき1回だけ）
     print(f"🤖 緊急度判定開始: {text}")
-    urgency = await analyze_urgency(text)
-    print(f"📊 緊急度: {urgency}")
+    with STAGE_CLASSIFY.time():
+        classification = await urgency_classifier.classify(text)
+    print(f"📊 緊急度: {classification.urgency} ({classification.provider})")
 
     # ✅ 緊急度が「高」の場合のみWebSocketで送信
-    if urgency == "高":
+    if classification.is_urgent:
         print(f"📤 緊急度が高いため、WebSocketで送信します")
-        await handle_message(event)
+        with STAGE_BROADCAST.time():
+            await handle_message(event, classification, recipients=receivers)
     else:
-        print(f"⏭️  緊急度が'{urgency}'のためWebSocket送信をスキップ")
+        print(f"⏭️  緊急度が'{classification.urgency}'のためWebSocket送信をスキップ")
+
+
+slack_event_queue = SlackEventQueue(
+    process_slack_event,
+    maxsize=SLACK_EVENT_QUEUE_SIZE,
+    workers=SLACK_EVENT_WORKERS,
+)
+metrics.gauge("slack_event_queue_depth", "処理待ちのSlackイベント数", fn=lambda: slack_event_queue.depth)
+metrics.counter(
+    "slack_events_total",
+    "Slackイベントの処理結果（processed / failed / rejected）",
+    ("result",),
+    fn=lambda: {
+        ("processed",): slack_event_queue.processed,
+        ("failed",): slack_event_queue.failed,
+        ("rejected",): slack_event_queue.rejected,
+    },
+)
 
-    return {"ok": True}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus 形式のメトリクス（/stats の数値も replymate_stats_* として含める）。
+    各コンポーネントの値はイベントループ上で更新されるので、スレッドプールに回さずループ上で読む
+    """
+    return PlainTextResponse(
+        metrics.render(await get_stats()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/stats")
+async def get_stats():
+    """パイプライン各段の内部統計（キュー深さ・遅延など）"""
+    return {
+        "event_queue": slack_event_queue.stats(),
+        "event_dedup": event_dedup.stats(),
+        "urgency": urgency_classifier.stats(),
+        "slack_api": slack_api.stats(),
+        "channel_members": channel_members_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "registered_users": user_index.stats(),
+        "websocket": broadcaster.stats(),
+        "unread_feed": unread_feed.stats(),
+        "firestore": async_firebase_manager.stats() if async_firebase_manager else {"client": "sync"},
+        "write_behind": write_behind.stats() if write_behind else None,
+    }
 
 # =========================================================
 # 🔌 WebSocketエンドポイント
 # =========================================================
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket接続を受け入れてメッセージをブロードキャスト"""
-    await websocket.accept()
-    active_connections.append(websocket)
-    print(f"✅ WebSocket接続: {len(active_connections)}クライアント接続中")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    user_id: Optional[str] = None,
+    token: Optional[str] = None,
+    last_seq: Optional[int] = None,
+    epoch: Optional[str] = None,
+    encoding: Optional[str] = None,
+):
+    """
+    WebSocket接続を受け入れ、接続したSlackユーザー宛てのメッセージだけを送る
+    接続URL: /ws?user_id=<SlackユーザーID>&token=<register-userで発行したws_token>
+    再接続時は &last_seq=<最後に受け取ったseq>&epoch=<epoch> を付けると取りこぼし分が再送される
+    &encoding=msgpack（またはサブプロトコル "msgpack"）でバイナリフレーム、既定はJSON
+    permessage-deflate はクライアントが提示し、uvicorn が受け入れた場合に有効（/stats には合意した結果を出す）
+    """
+    if not user_id or not verify_ws_token(user_id, token):
+        print(f"🚫 WebSocket接続拒否: user_id={user_id}")
+        await websocket.close(code=1008)
+        return
 
+    wire_encoding, subprotocol = ws_codec.negotiate(encoding, websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=subprotocol)
+    # クライアントの提示ではなく、サーバーが実際に受け入れた拡張（判別できなければ deflate なし扱い）
+    deflate = bool(await ws_codec.accepted_deflate(websocket))
+    connection = broadcaster.connect(
+        user_id,
+        websocket,
+        last_seq=last_seq,
+        epoch=epoch,
+        encoding=wire_encoding,
+        deflate=deflate,
+    )
+    print(
+        f"✅ WebSocket接続: {user_id} last_seq={last_seq} {wire_encoding}{'+deflate' if deflate else ''} "
+        f"({broadcaster.connection_count}クライアント接続中)"
+    )
+
+    feed_subscribed = False
     try:
+        # 未読の変更（緊急以外も含む）を Firestore リスナーから unread_feed として流す
+        if UNREAD_FEED_ENABLED:
+            feed_subscribed = True
+            await unread_feed.subscribe(user_id)
+
         while True:
             # クライアントからのメッセージを受信（ping/pongなど）
             data = await websocket.receive_text()
             print(f"📨 WebSocket受信: {data}")
 
-            # pingに対してpongを返す
+            # pingに対してpongを返す（送信は接続ごとの書き込みタスク経由）
             if data == "ping":
-                await websocket.send_text("pong")
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
-        print(f"❌ WebSocket切断: {len(active_connections)}クライアント接続中")
+                connection.send_nowait("pong")
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: 送信キュー溢れ等でサーバー側から閉じた後の受信
+        pass
+    finally:
+        broadcaster.disconnect(connection)
+        if feed_subscribed:
+            await unread_feed.unsubscribe(user_id)
+        print(f"❌ WebSocket切断: {user_id} ({broadcaster.connection_count}クライアント接続中)")
+
+# =========================================================
+# 🔢 未読カウンタの差分を通知
+# =========================================================
+async def publish_unread_delta(user_ids, channel_id: str, delta: int, message_ids: List[str]):
+    """
+    unread_update として未読件数の増減だけを送る（クライアントは手元の件数に足し込む）
+    取りこぼした場合は resync_required で件数を取り直してもらう
+    """
+    await broadcaster.publish(user_ids, unread_update_payload(channel_id, delta, message_ids))
 
 # =========================================================
 # 📤 Slackメッセージをブロードキャスト
 # =========================================================
-async def handle_message(event: dict):
-    """Slackメッセージの緊急度を判定し、高緊急度のみWebSocketクライアントにブロードキャスト"""
+async def handle_message(
+    event: dict,
+    classification: Optional[UrgencyResult] = None,
+    recipients: Optional[List[str]] = None,
+):
+    """
+    Slackメッセージの緊急度を判定し、高緊急度のみ宛先ユーザーのWebSocketクライアントに送信
+    判定済みの classification が渡された場合は再判定しない
+    recipients を省略した場合はチャンネルメンバー全員が宛先（送信者本人は除く）
+    """
     message_text = event.get("text", "")
 
-    # ✅ OpenAI APIで緊急度を判定
-    print(f"🤖 緊急度判定開始: {message_text}")
-    urgency = await analyze_urgency(message_text)
-    print(f"📊 緊急度: {urgency}")
+    if classification is None:
+        print(f"🤖 緊急度判定開始: {message_text}")
+        classification = await urgency_classifier.classify(message_text)
+        print(f"📊 緊急度: {classification.urgency}")
+    urgency = classification.urgency
 
     # ✅ 緊急度が「高」の場合のみクライアントに送信
     if urgency != "高":
@@ -349,23 +687,18 @@ async def handle_message(event: dict):
         }
     }
 
-    print(f"📤 ブロードキャスト: {len(active_connections)}クライアントに送信 (緊急度: {urgency})")
-    print(f"📤 送信データ: {json.dumps(message_data, ensure_ascii=False)}")
-
-    # 切断されたクライアントを追跡
-    disconnected = []
-
-    for connection in active_connections:
-        try:
-            await connection.send_json(message_data)
-            print(f"✅ 送信成功")
-        except Exception as e:
-            print(f"❌ 送信失敗: {e}")
-            disconnected.append(connection)
+    if recipients is None:
+        recipients = await channel_members_cache.get(event.get("channel", ""))
+    sender_id = event.get("user")
 
-    # 切断されたクライアントを削除
-    for connection in disconnected:
-        active_connections.remove(connection)
+    if WS_SENT_AT_ENABLED:
+        message_data["sent_at"] = time.time()
+    # シリアライズは1回だけ、全ワーカーへ発行し各ワーカーが自分の接続の送信キューに積む
+    published = await broadcaster.publish(
+        (user_id for user_id in recipients if user_id != sender_id),
+        message_data,
+    )
+    print(f"📤 送信: {published}人宛てに配信 (緊急度: {urgency})")
 
 # =========================================================
 # 📤 Slack返信エンドポイント
@@ -377,26 +710,36 @@ async def slack_reply(req: SlackReplyRequest):
     Firestoreに保存されたSlackユーザートークンで本人として返信
     """
     try:
-        # --- Firestoreからユーザー情報取得 ---
-        user_doc = firebase_manager.db.collection("users").document(req.user_id).get()
-        if not user_doc.exists:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        user_data = user_doc.to_dict()
-        slack_token = user_data.get("slack_user_token")
-
-        if not slack_token:
-            raise HTTPException(status_code=400, detail="Slack user token not found")
-
-        # --- Slackクライアント初期化（本人のトークン）---
-        client = WebClient(token=slack_token)
-
-        # --- メッセージ送信 ---
-        response = client.chat_postMessage(
-            channel=req.channel,
-            text=req.text,
-            thread_ts=req.thread_ts
-        )
+        for attempt in range(2):
+            # --- ユーザー情報取得（キャッシュになければFirestoreから）---
+            user_data = await user_cache.get(req.user_id)
+            if user_data is None:
+                raise HTTPException(status_code=404, detail="User not found")
+
+            slack_token = user_data.get("slack_user_token")
+
+            if not slack_token:
+                raise HTTPException(status_code=400, detail="Slack user token not found")
+
+            # --- Slackクライアント取得（本人のトークン、接続は共有）---
+            client = slack_api.client(slack_token)
+
+            # --- メッセージ送信 ---
+            try:
+                response = await client.chat_postMessage(
+                    channel=req.channel,
+                    text=req.text,
+                    thread_ts=req.thread_ts
+                )
+                break
+            except SlackApiError as e:
+                # 別ワーカーで再登録されてトークンが変わった可能性があるので、取り直して1回だけ再送
+                if attempt == 0 and e.response.get("error") in STALE_TOKEN_ERRORS:
+                    print(f"🔄 Slackトークンを取り直して再送: {req.user_id}")
+                    slack_api.discard(slack_token)
+                    user_cache.invalidate(req.user_id)
+                    continue
+                raise
 
         print("✅ Slack送信成功:", response.data)
         return {"status": "success", "message_ts": response.data.get("ts")}
@@ -410,20 +753,87 @@ async def slack_reply(req: SlackReplyRequest):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/messages/unread/{user_id}")
-def get_unread_messages(user_id: str):
+async def get_unread_messages(
+    user_id: str,
+    limit: int = UNREAD_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    未読メッセージを新しい順にページ単位で返す
+    limit: 1ページの件数（最大500） / cursor: 前のページの next_cursor
+    fields: 取得するフィールドをカンマ区切りで指定（例: sender_id,channel_id,timestamp）
+    count は未読の総数（カウンタ）、page_count はこのページの件数。件数だけなら /messages/unread/{user_id}/count を使う
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    unknown = set(field_list or []) - set(MESSAGE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未対応のフィールド: {', '.join(sorted(unknown))}")
+
+    try:
+        (messages, next_cursor), counters = await asyncio.gather(
+            firestore_call("unread_messages", user_id, limit, cursor, field_list),
+            firestore_call("unread_counters", user_id),
+        )
+        return {
+            "count": counters["count"],
+            "page_count": len(messages),
+            "messages": messages,
+            "next_cursor": next_cursor,
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/messages/unread/{user_id}/count")
+async def get_unread_count(user_id: str):
+    """未読件数（全体とチャンネル別）。ユーザードキュメントのカウンタを読むだけ"""
     try:
-        messages_ref = firebase_manager.db.collection("users").document(user_id).collection("messages")
-        unread_query = messages_ref.where("is_see", "==", False).stream()
+        counters = await firestore_call("unread_counters", user_id)
+        return {"user_id": user_id, **counters}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        unread_messages = []
-        for doc in unread_query:
-            data = doc.to_dict()
-            data["id"] = doc.id
-            unread_messages.append(data)
 
-        return {"count": len(unread_messages), "messages": unread_messages}
+@app.post("/messages/{user_id}/read")
+async def mark_messages_read(user_id: str, req: MarkReadRequest):
+    """
+    メッセージをまとめて既読にする（message_ids、または channel_id + up_to_ts）
+    チャンク単位の一括commitで未読カウンタも同じバッチで減らし、件数と所要時間を返す
+    """
+    if req.message_ids is None and not (req.channel_id and req.up_to_ts):
+        raise HTTPException(status_code=400, detail="message_ids か channel_id + up_to_ts を指定してください")
 
+    try:
+        result = await firestore_call(
+            "mark_seen_bulk",
+            user_id,
+            message_ids=req.message_ids,
+            channel_id=req.channel_id,
+            up_to_ts=req.up_to_ts,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    # チャンネルごとに件数の差分を通知
+    for channel_id, message_ids in result.pop("message_ids").items():
+        await publish_unread_delta([user_id], channel_id=channel_id, delta=-len(message_ids), message_ids=message_ids)
+    return {"user_id": user_id, **result}
+
+
+@app.post("/messages/{user_id}/{message_id}/read")
+async def mark_message_read(user_id: str, message_id: str):
+    """メッセージを既読にして未読カウンタを減らし、差分を通知する"""
+    try:
+        channel_id = await firestore_call("mark_seen", user_id, message_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+    if channel_id is not None:
+        await publish_unread_delta([user_id], channel_id=channel_id, delta=-1, message_ids=[message_id])
+    return {"user_id": user_id, "message_id": message_id, "marked": channel_id is not None}
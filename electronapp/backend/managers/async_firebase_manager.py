@@ -0,0 +1,295 @@
+# managers/async_firebase_manager.py
+import asyncio
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import pytz
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore import AsyncClient
+
+from managers.firebase_manager import (
+    FIRESTORE_BATCH_LIMIT,
+    INBOX_CREATE_RETRIES,
+    STORAGE_COPY,
+    STORAGE_MODES,
+    STORAGE_SHARED,
+    InboxWrite,
+    fill_inbox_batch,
+    inbox_chunks,
+    message_content,
+    receiver_of,
+    unread_counter_ref,
+)
+
+
+class AsyncFirebaseManager:
+    """
+    FirebaseManager の AsyncClient 版（FIRESTORE_CLIENT=async で使う）。
+    create_or_update_user / receive_message / send_message / fan_out_message を同じ引数で提供し、
+    Firestore の往復をイベントループ上で await する（スレッドプールを使わない）。
+    fan_out_message は WriteBatch のチャンクを concurrency 件まで同時に commit する。
+    スナップショットリスナーや既読化のトランザクションは同期版（FirebaseManager）を使う。
+    writer（WriteBehindBuffer）を渡すと、保存は await せずにバッファへ積むだけになる。
+    """
+
+    def __init__(
+        self,
+        db: AsyncClient,
+        user_index=None,
+        storage_mode: str = STORAGE_COPY,
+        concurrency: int = 4,
+        writer=None,
+    ):
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"未対応の保存方式です: {storage_mode}")
+        self.db = db
+        self.tz = pytz.timezone("Asia/Tokyo")
+        self.user_index = user_index
+        self.storage_mode = storage_mode
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.writer = writer
+
+        # メトリクス
+        self.commits = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    async def create_or_update_user(
+        self,
+        user_id: str,
+        real_name: Optional[str] = None,
+        display_name: Optional[str] = None,
+        email: Optional[str] = None,
+        slack_team_id: Optional[str] = None,
+        slack_user_token: Optional[str] = None,
+    ):
+        """アプリ利用者を登録または更新（Slack連携情報付き）"""
+        ref = self.db.collection("users").document(user_id)
+        now = datetime.now(self.tz)
+
+        data = {
+            "user_id": user_id,
+            "real_name": real_name,
+            "display_name": display_name,
+            "email": email,
+            "slack_team_id": slack_team_id,
+            "slack_user_token": slack_user_token,
+            "updated_at": now,
+        }
+
+        if self.user_index is not None and self.user_index.ready:
+            exists = user_id in self.user_index
+        else:
+            exists = (await ref.get(field_paths=["user_id"])).exists
+        if not exists:
+            data["created_at"] = now
+        if self.writer is not None:
+            # merge なので既存の項目は残る
+            batch = self.writer.batch()
+            batch.set(ref, data, merge=True)
+            batch.commit()
+        elif exists:
+            await ref.update(data)
+        else:
+            await ref.set(data)
+
+        if self.user_index is not None:
+            self.user_index.add(user_id)
+        return data
+
+    async def get_user(self, user_id: str) -> Optional[dict]:
+        """ユーザードキュメント（未登録なら None）"""
+        doc = await self.db.collection("users").document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def receive_message(
+        self,
+        receiver_id: str,
+        sender_id: str,
+        message_id: str,
+        channel_id: str,
+        text: str,
+        is_ai: bool = False,
+        is_bot: bool = False,
+        is_see: bool = False,
+        channel_type: str = "im",
+    ):
+        """1人分のメッセージを保存（未登録ユーザーなら None）"""
+        receivers = await self.registered_user_ids([receiver_id])
+        if not receivers:
+            print(f"⚠️ Firestore: ユーザー {receiver_id} は未登録のためメッセージを保存しません。")
+            return None
+
+        user_ref = self.db.collection("users").document(receiver_id)
+        now = datetime.now(self.tz)
+        message_data = {
+            **message_content(sender_id, message_id, channel_id, text, is_ai, is_bot, channel_type, now),
+            "receiver_id": receiver_id,
+            "is_see": is_see,
+        }
+
+        message_ref = user_ref.collection("messages").document(message_id)
+        counter_ref = None if is_see else unread_counter_ref(user_ref)
+        if not await self._write_inbox([(message_ref, message_data, counter_ref)], channel_id):
+            print(f"♻️ Firestore: {receiver_id} の messages に保存済みのためスキップ ({message_id})")
+            return None
+        print(f"✅ Firestore: {receiver_id} の messages に保存完了 ({message_id})")
+        return message_data
+
+    async def send_message(self, receiver_id: str, sender_id: str,
+                           message_id: str, channel_id: str, text: str,
+                           is_ai=False, is_bot=False, is_see=False, channel_type="im"):
+        """送信者側の messages に保存"""
+        ref = (
+            self.db.collection("users")
+            .document(sender_id)
+            .collection("messages")
+            .document(message_id)
+        )
+        now = datetime.now(self.tz)
+        data = {
+            **message_content(sender_id, message_id, channel_id, text, is_ai, is_bot, channel_type, now),
+            "receiver_id": receiver_id,
+            "is_see": is_see,
+        }
+        batch = self._batch()
+        batch.set(ref, data)
+        await self._commit(batch)
+        return data
+
+    async def registered_user_ids(
+        self,
+        user_ids: Iterable[str],
+        chunk_size: int = FIRESTORE_BATCH_LIMIT,
+    ) -> List[str]:
+        """user_ids のうち登録済みのものを返す（インデックスが無ければ get_all をチャンクごとに同時実行）"""
+        user_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+        if self.user_index is not None and self.user_index.ready:
+            return self.user_index.filter(user_ids)
+
+        users_ref = self.db.collection("users")
+
+        async def exists(chunk):
+            refs = [users_ref.document(uid) for uid in chunk]
+            async with self._semaphore:
+                return [s.id async for s in self.db.get_all(refs, field_paths=["user_id"]) if s.exists]
+
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        registered = set()
+        for ids in await asyncio.gather(*(exists(chunk) for chunk in chunks)):
+            registered.update(ids)
+        return [uid for uid in user_ids if uid in registered]
+
+    async def fan_out_message(
+        self,
+        receiver_ids: Iterable[str],
+        sender_id: str,
+        message_id: str,
+        channel_id: str,
+        text: str,
+        is_ai: bool = False,
+        is_bot: bool = False,
+        channel_type: str = "im",
+        chunk_size: int = FIRESTORE_BATCH_LIMIT,
+    ) -> List[str]:
+        """
+        FirebaseManager.fan_out_message と同じ内容を書く（既にある受信箱は作らず、カウンタも増やさない）。
+        バッチを先に全部組み立て、concurrency 件まで同時に commit する。
+        shared の本文は最初のバッチに入れて先に commit する（参照だけ先に見えないように）。
+        Returns: 今回受信箱を作ったユーザーIDのリスト
+        """
+        receivers = await self.registered_user_ids(receiver_ids, chunk_size=chunk_size)
+        if not receivers:
+            print(f"⚠️ Firestore: 登録済みの受信者がいないため保存をスキップ ({message_id})")
+            return []
+
+        now = datetime.now(self.tz)
+        content = message_content(sender_id, message_id, channel_id, text, is_ai, is_bot, channel_type, now)
+        head = None
+        content_ref = None
+        if self.storage_mode == STORAGE_SHARED:
+            content_ref = (
+                self.db.collection("channels").document(channel_id)
+                .collection("messages").document(message_id)
+            )
+            head = (content_ref, content)
+
+        chunks = inbox_chunks(
+            self.db.collection("users"), receivers, sender_id, message_id,
+            channel_id, content, content_ref, now, chunk_size,
+        )
+        written = []
+        if head is not None:
+            written.extend(await self._write_inbox(chunks.pop(0), channel_id, head))
+        for done in await asyncio.gather(*(self._write_inbox(chunk, channel_id) for chunk in chunks)):
+            written.extend(done)
+
+        created = [receiver_of(write) for write in written]
+        print(
+            f"✅ Firestore: {len(created)}人の messages に一括保存完了 "
+            f"({message_id}, {self.storage_mode}, 保存済み {len(receivers) - len(created)}人, async)"
+        )
+        return created
+
+    async def _write_inbox(self, chunk: List[InboxWrite], channel_id: str, head=None) -> List[InboxWrite]:
+        """FirebaseManager._write_inbox の AsyncClient 版（既にある受信箱を除いて書き、書いた分を返す）"""
+        if self.writer is not None:
+            # バッファの保留分だけを見て積む（作成済みかは flush 時に確認する）
+            chunk = [write for write in chunk if not self.writer.is_pending(write[0].path)]
+            if chunk or head is not None:
+                batch = self.writer.batch()
+                fill_inbox_batch(batch, chunk, channel_id, head, deferred=True)
+                batch.commit()
+            return chunk
+
+        for attempt in range(INBOX_CREATE_RETRIES):
+            batch = self.db.batch()
+            fill_inbox_batch(batch, chunk, channel_id, head)
+            try:
+                await self._commit(batch)
+                return chunk
+            except AlreadyExists:
+                # 再配信などで一部の受信箱が既にある。それを除いて書き直す
+                existing = await self._existing_paths([write[0] for write in chunk])
+                chunk = [write for write in chunk if write[0].path not in existing]
+                if not chunk:
+                    return []
+        raise RuntimeError("受信箱の作成の競合が解消しませんでした")
+
+    async def _existing_paths(self, refs: List) -> set:
+        if not refs:
+            return set()
+        async with self._semaphore:
+            return {
+                snapshot.reference.path
+                async for snapshot in self.db.get_all(refs, field_paths=["is_see"])
+                if snapshot.exists
+            }
+
+    def _batch(self):
+        return self.writer.batch() if self.writer is not None else self.db.batch()
+
+    async def _commit(self, batch):
+        if self.writer is not None:
+            # バッファに積むだけ（commit は WriteBehindBuffer がまとめて行う）
+            batch.commit()
+            return
+        async with self._semaphore:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            try:
+                await batch.commit()
+                self.commits += 1
+            finally:
+                self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "client": "async",
+            "storage_mode": self.storage_mode,
+            "concurrency": self.concurrency,
+            "commits": self.commits,
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
@@ -0,0 +1,129 @@
+# managers/channel_members.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+MemberFetcher = Callable[[str], Awaitable[List[str]]]
+
+
+class ChannelMemberCache:
+    """
+    チャンネル → メンバー一覧のキャッシュ。
+    TTL の refresh_ratio を過ぎたエントリは返しつつ裏で取り直し、TTL 切れなら取り直してから返す。
+    member_joined_channel / member_left_channel イベントで差分を反映するので、
+    通常のファンアウトでは conversations.members を呼ばずに済む。
+    """
+
+    def __init__(
+        self,
+        fetch: MemberFetcher,
+        ttl: float = 600.0,
+        refresh_ratio: float = 0.5,
+        max_channels: int = 1000,
+    ):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.refresh_ratio = refresh_ratio
+        self.max_channels = max_channels
+        # channel_id -> (メンバー一覧, 取得時刻)
+        self._entries: "OrderedDict[str, Tuple[List[str], float]]" = OrderedDict()
+        # 同じチャンネルの同時取得を1回にまとめる
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # 取得中に届いた参加/退出イベント（取得結果に後から反映する）
+        self._deltas: Dict[str, List[Tuple[str, str]]] = {}
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def get(self, channel_id: str) -> List[str]:
+        entry = self._entries.get(channel_id)
+        now = time.monotonic()
+        if entry and now - entry[1] < self.ttl:
+            self.hits += 1
+            self._entries.move_to_end(channel_id)
+            if now - entry[1] >= self.ttl * self.refresh_ratio:
+                # 期限が近いので裏で取り直す
+                self._load(channel_id)
+            return list(entry[0])
+
+        self.misses += 1
+        return list(await self._load(channel_id))
+
+    def _load(self, channel_id: str) -> asyncio.Task:
+        task = self._inflight.get(channel_id)
+        if task is None:
+            self._deltas[channel_id] = []
+            task = asyncio.create_task(self._fetch(channel_id))
+            self._inflight[channel_id] = task
+            task.add_done_callback(lambda done: self._finish(channel_id, done))
+        return task
+
+    def _finish(self, channel_id: str, task: asyncio.Task):
+        self._inflight.pop(channel_id, None)
+        self._deltas.pop(channel_id, None)
+        if not task.cancelled() and task.exception():
+            print(f"❌ チャンネルメンバー取得エラー ({channel_id}): {task.exception()}")
+
+    async def _fetch(self, channel_id: str) -> List[str]:
+        started = time.monotonic()
+        members = list(await self.fetch(channel_id))
+        for action, user_id in self._deltas.pop(channel_id, []):
+            self._apply(members, action, user_id)
+        self.refreshes += 1
+        self._store(channel_id, members, started)
+        return members
+
+    @staticmethod
+    def _apply(members: List[str], action: str, user_id: str):
+        if action == "joined" and user_id not in members:
+            members.append(user_id)
+        elif action == "left" and user_id in members:
+            members.remove(user_id)
+
+    def _store(self, channel_id: str, members: List[str], fetched_at: float):
+        self._entries[channel_id] = (list(members), fetched_at)
+        self._entries.move_to_end(channel_id)
+        while len(self._entries) > self.max_channels:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def member_joined(self, channel_id: str, user_id: str):
+        """member_joined_channel: キャッシュ済みならメンバーを追加"""
+        self._on_membership(channel_id, "joined", user_id)
+
+    def member_left(self, channel_id: str, user_id: str):
+        """member_left_channel: キャッシュ済みならメンバーを削除"""
+        self._on_membership(channel_id, "left", user_id)
+
+    def _on_membership(self, channel_id: str, action: str, user_id: str):
+        entry = self._entries.get(channel_id)
+        if entry:
+            self._apply(entry[0], action, user_id)
+        if channel_id in self._deltas:
+            self._deltas[channel_id].append((action, user_id))
+        self.invalidations += 1
+
+    def invalidate(self, channel_id: str):
+        """チャンネル削除・アーカイブ等でエントリを破棄"""
+        self._entries.pop(channel_id, None)
+        self._deltas.pop(channel_id, None)
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "channels": len(self._entries),
+            "max_channels": self.max_channels,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
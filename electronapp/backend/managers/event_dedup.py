@@ -0,0 +1,89 @@
+# managers/event_dedup.py
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, List, Optional
+
+
+class EventDeduplicator:
+    """
+    Slackイベントの重複排除キャッシュ（TTL付きLRU）。
+    event_id と (channel, ts) をキーに記録し、再送イベントは辞書引き1回で弾く。
+    エントリ数は maxsize、保持期間は ttl 秒で上限を設ける。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> 有効期限（挿入順 = 期限順）
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+        self.retry_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def keys_for(payload: dict) -> List[Hashable]:
+        """イベントペイロードから重複判定キーを作る"""
+        keys: List[Hashable] = []
+        if payload.get("event_id"):
+            keys.append(("event_id", payload["event_id"]))
+        event = payload.get("event", {})
+        if event.get("channel") and event.get("ts"):
+            keys.append(("message", event["channel"], event["ts"]))
+        return keys
+
+    def _purge(self, now: float):
+        while self._entries:
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+
+    def check_and_add(self, keys: Iterable[Hashable], retry_num: Optional[int] = None) -> bool:
+        """
+        いずれかのキーが記録済みなら True（重複）。
+        未記録なら全キーを記録して False を返す。
+        retry_num は X-Slack-Retry-Num ヘッダーの値（初回配信なら None）
+        """
+        keys = list(keys)
+        now = time.monotonic()
+        self._purge(now)
+
+        if retry_num is not None:
+            self.retries += 1
+
+        if any(key in self._entries for key in keys):
+            self.hits += 1
+            if retry_num is not None:
+                self.retry_hits += 1
+            return True
+
+        self.misses += 1
+        for key in keys:
+            self._entries[key] = now + self.ttl
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return False
+
+    def forget(self, keys: Iterable[Hashable]):
+        """受付に失敗したイベントのキーを消し、Slackの再送を受け入れられるようにする"""
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "retries": self.retries,
+            "retry_hits": self.retry_hits,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,127 @@
+# managers/event_queue.py
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class SlackEventQueue:
+    """
+    Slackイベントの取り込みキュー。
+    /slack/event は署名検証後にここへ積んで即座に200を返し、
+    保存・緊急度判定・ブロードキャストはワーカーが非同期に処理する。
+    キューが満杯の場合は submit が False を返す（バックプレッシャー）。
+    """
+
+    def __init__(
+        self,
+        handler: EventHandler,
+        maxsize: int = 1000,
+        workers: int = 4,
+        enqueue_timeout: float = 0.5,
+    ):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        # メトリクス
+        self.enqueued = 0
+        self.dequeued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """ワーカーを起動（イベントループ上で呼ぶこと）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.worker_count)
+        ]
+        print(f"✅ イベントキュー起動: workers={self.worker_count}, maxsize={self.maxsize}")
+
+    async def stop(self, drain: bool = True, timeout: float = 10.0):
+        """
+        ワーカーを停止。drain=True なら積まれているイベントを処理し切ってから止める。
+        timeout 秒で処理し切れなければ（LLM・Firestore の呼び出しが詰まっている等）残りを捨てて止める
+        """
+        if not self.running:
+            return
+        if drain:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ イベントキュー: {timeout}秒で処理し切れなかったため停止します (残り {self.depth}件 + 処理中)")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        print("🛑 イベントキュー停止")
+
+    async def submit(self, event: dict) -> bool:
+        """
+        イベントをキューに積む。
+        enqueue_timeout 秒待っても空きがなければ False（呼び出し側で503を返す）
+        """
+        if not self.running:
+            raise RuntimeError("SlackEventQueue is not started")
+        try:
+            await asyncio.wait_for(
+                self._queue.put((time.monotonic(), event)),
+                timeout=self.enqueue_timeout,
+            )
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            print(f"⚠️ イベントキュー満杯のため受付拒否 (depth={self.depth})")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, index: int):
+        while True:
+            enqueued_at, event = await self._queue.get()
+            lag = time.monotonic() - enqueued_at
+            self.dequeued += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._total_lag += lag
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ イベント処理エラー (worker {index}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "workers": self.worker_count,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "lag_last_seconds": self.last_lag,
+            "lag_max_seconds": self.max_lag,
+            "lag_avg_seconds": (
+                self._total_lag / self.dequeued if self.dequeued else 0.0
+            ),
+        }
@@ -0,0 +1,781 @@
+# managers/firebase_manager.py
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pytz
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from google.cloud import firestore
+from google.cloud.firestore_v1.client import Client
+
+# Firestore の WriteBatch / get_all に渡せる1回あたりの上限
+FIRESTORE_BATCH_LIMIT = 500
+
+# 一括既読で同じチャンクを読み直す回数（他の既読処理と競合した場合）
+MARK_SEEN_RETRIES = 3
+# 受信箱の作成で、既にあるものを除いて書き直す回数（同じメッセージの同時保存と競合した場合）
+INBOX_CREATE_RETRIES = 3
+
+# 未読一覧の1ページあたりの件数
+UNREAD_PAGE_DEFAULT = 50
+UNREAD_PAGE_MAX = 500
+# 未読一覧で fields に指定できるフィールド
+MESSAGE_FIELDS = (
+    "sender_id",
+    "receiver_id",
+    "slack_message_id",
+    "channel_id",
+    "text",
+    "is_ai",
+    "is_bot",
+    "is_see",
+    "channel_type",
+    "timestamp",
+    "created_at",
+)
+
+# メッセージの保存方式
+STORAGE_COPY = "copy"      # users/{id}/messages/{ts} に本文ごとコピー（従来）
+STORAGE_SHARED = "shared"  # 本文は channels/{channel_id}/messages/{ts} に1回だけ、受信箱には参照と既読状態
+STORAGE_MODES = (STORAGE_COPY, STORAGE_SHARED)
+# shared の受信箱に置くフィールド（未読クエリ・カウンタ・既読化はこれだけで動く）
+INBOX_FIELDS = ("slack_message_id", "channel_id", "is_see", "timestamp", "message_ref")
+# shared でチャンネル側から取るフィールド
+CONTENT_FIELDS = tuple(f for f in MESSAGE_FIELDS if f not in INBOX_FIELDS and f not in ("receiver_id",))
+
+
+def unread_counter_ref(user_ref):
+    """
+    未読カウンタのドキュメント users/{user_id}/meta/unread。
+    users/{user_id} 自体に書くと users コレクションのリスナー（RegisteredUserIndex）に
+    メッセージごとの変更が届くので、別のドキュメントに置く
+    """
+    return user_ref.collection("meta").document("unread")
+
+
+# rebuild_unread_counters が数え直したカウンタに付ける印。
+# 既存ユーザーのカウンタは新着の Increment(merge) で途中から作られ、それ以前の未読を含まないので、
+# この印があるカウンタだけを信用する
+UNREAD_COUNTER_INITIALIZED = "initialized"
+
+
+def unread_counter_update(channel_id: str, delta: int) -> dict:
+    """未読カウンタ（全体とチャンネル別）を delta だけ増減する set(merge=True) 用の値"""
+    return {
+        "unread_count": firestore.Increment(delta),
+        "unread_by_channel": {channel_id: firestore.Increment(delta)},
+    }
+
+
+# fan_out の書き込み1件分（受信箱の参照, データ, 未読カウンタの参照 or None（既読で保存する場合））
+InboxWrite = Tuple[object, dict, Optional[object]]
+
+
+def inbox_chunks(
+    users_ref,
+    receivers: Sequence[str],
+    sender_id: str,
+    message_id: str,
+    channel_id: str,
+    content: dict,
+    content_ref,
+    now: datetime,
+    chunk_size: int = FIRESTORE_BATCH_LIMIT,
+) -> List[List[InboxWrite]]:
+    """
+    受信者ごとの受信箱の書き込みを WriteBatch 1回分ずつに分ける（カウンタ更新の分も数える）。
+    送信者本人の分は既読で保存し、カウンタは増やさない。shared の本文は最初のチャンクと一緒に書く前提で数える
+    """
+    chunks: List[List[InboxWrite]] = []
+    chunk: List[InboxWrite] = []
+    pending = 1 if content_ref is not None else 0
+    for receiver_id in receivers:
+        user_ref = users_ref.document(receiver_id)
+        message_ref = user_ref.collection("messages").document(message_id)
+        is_see = receiver_id == sender_id
+        if content_ref is not None:
+            data = inbox_entry(content_ref, message_id, channel_id, is_see, now)
+        else:
+            data = {**content, "receiver_id": receiver_id, "is_see": is_see}
+        chunk.append((message_ref, data, None if is_see else unread_counter_ref(user_ref)))
+        pending += 1 if is_see else 2
+        # WriteBatch は1回あたり最大500件まで
+        if pending >= chunk_size - 1:
+            chunks.append(chunk)
+            chunk = []
+            pending = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def fill_inbox_batch(batch, chunk: List[InboxWrite], channel_id: str, head=None, create: bool = True,
+                     deferred: bool = False):
+    """
+    チャンクの書き込みをバッチに積む。create=True なら受信箱は「存在しない場合だけ作成」にして、
+    再配信で既読状態を上書きしたりカウンタを二重に増やしたりしないようにする（既にあればバッチ全体が失敗する）。
+    deferred=True（write-behind のバッファ）なら存在の確認は flush 時に行い、
+    カウンタの加算は受信箱を作成できた場合だけ書くよう作成にぶら下げる
+    """
+    if head is not None:
+        batch.set(*head)
+    for message_ref, data, counter_ref in chunk:
+        if deferred:
+            then = {} if counter_ref is None else {counter_ref: unread_counter_update(channel_id, 1)}
+            batch.create(message_ref, data, then=then)
+            continue
+        if create:
+            batch.create(message_ref, data)
+        else:
+            batch.set(message_ref, data)
+        if counter_ref is not None:
+            batch.set(counter_ref, unread_counter_update(channel_id, 1), merge=True)
+
+
+def receiver_of(write: InboxWrite) -> str:
+    """受信箱の参照 users/{user_id}/messages/{ts} からユーザーID"""
+    return write[0].parent.parent.id
+
+
+def message_content(
+    sender_id: str,
+    message_id: str,
+    channel_id: str,
+    text: str,
+    is_ai: bool,
+    is_bot: bool,
+    channel_type: str,
+    now: datetime,
+) -> dict:
+    """channels/{channel_id}/messages/{ts} に1回だけ書く本文"""
+    return {
+        "sender_id": sender_id,
+        "slack_message_id": message_id,
+        "channel_id": channel_id,
+        "text": text,
+        "is_ai": is_ai,
+        "is_bot": is_bot,
+        "channel_type": channel_type,
+        "timestamp": now,
+        "created_at": now,
+    }
+
+
+def inbox_entry(content_ref, message_id: str, channel_id: str, is_see: bool, now: datetime) -> dict:
+    """shared の users/{user_id}/messages/{ts}（本文への参照と既読状態）"""
+    return {
+        "slack_message_id": message_id,
+        "channel_id": channel_id,
+        "is_see": is_see,
+        "timestamp": now,
+        "message_ref": content_ref,
+    }
+
+
+class FirebaseManager:
+    def __init__(self, db: Client, user_index=None, storage_mode: str = STORAGE_COPY, writer=None):
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"未対応の保存方式です: {storage_mode}")
+        self.db = db
+        self.tz = pytz.timezone("Asia/Tokyo")
+        # RegisteredUserIndex（読み込み済みなら未登録ユーザーへの参照を省く）
+        self.user_index = user_index
+        # 新しいメッセージの書き方（読み込みはどちらの形式のドキュメントも扱える）
+        self.storage_mode = storage_mode
+        # WriteBehindBuffer（指定すると保存はバッファに積むだけで返り、まとめて非同期に commit される）
+        self.writer = writer
+
+    def _batch(self):
+        """保存用の WriteBatch（write-behind が有効ならバッファに積むだけのもの）"""
+        return self.writer.batch() if self.writer is not None else self.db.batch()
+
+    def create_or_update_user(
+        self,
+        user_id: str,
+        real_name: Optional[str] = None,
+        display_name: Optional[str] = None,
+        email: Optional[str] = None,
+        slack_team_id: Optional[str] = None,
+        slack_user_token: Optional[str] = None,
+    ):
+        """アプリ利用者を登録または更新（Slack連携情報付き）"""
+        ref = self.db.collection("users").document(user_id)
+        now = datetime.now(self.tz)
+
+        data = {
+            "user_id": user_id,
+            "real_name": real_name,
+            "display_name": display_name,
+            "email": email,
+            "slack_team_id": slack_team_id,
+            "slack_user_token": slack_user_token,
+            "updated_at": now,
+        }
+
+        if self.writer is not None:
+            # 登録済みかはインデックスで判定し、読んでから書く往復を省く（merge なので既存の項目は残る）
+            if self._index_ready():
+                exists = user_id in self.user_index
+            else:
+                exists = ref.get(field_paths=["user_id"]).exists
+            if not exists:
+                data["created_at"] = now
+            batch = self.writer.batch()
+            batch.set(ref, data, merge=True)
+            batch.commit()
+        else:
+            # 既存ユーザなら更新、なければ新規登録
+            doc = ref.get()
+            if doc.exists:
+                ref.update(data)
+            else:
+                data["created_at"] = now
+                ref.set(data)
+
+        if self.user_index is not None:
+            self.user_index.add(user_id)
+        return data
+
+    def get_user(self, user_id: str) -> Optional[dict]:
+        """ユーザードキュメント（未登録なら None）"""
+        doc = self.db.collection("users").document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    # def create_or_update_user(
+    #     self,
+    #     user_id: str,
+    #     real_name: Optional[str] = None,
+    #     display_name: Optional[str] = None,
+    #     email: Optional[str] = None,
+    # ):
+    #     """アプリ利用者を登録または更新"""
+    #     ref = self.db.collection("users").document(user_id)
+    #     now = datetime.now(self.tz)
+
+    #     data = {
+    #         "user_id": user_id,
+    #         "real_name": real_name,
+    #         "display_name": display_name,
+    #         "email": email,
+    #         "updated_at": now
+    #     }
+
+    #     # 既存ユーザなら更新、なければ新規登録
+    #     doc = ref.get()
+    #     if doc.exists:
+    #         ref.update(data)
+    #     else:
+    #         data["created_at"] = now
+    #         ref.set(data)
+
+    #     return data
+    
+    def receive_message(
+        self,
+        receiver_id: str,
+        sender_id: str,
+        message_id: str,
+        channel_id: str,
+        text: str,
+        is_ai: bool = False,
+        is_bot: bool = False,
+        is_see: bool = False,
+        channel_type: str = "im",
+    ):
+        """
+        Firestore にメッセージを保存。
+        receiver_id: Firestore 上のアプリ利用者（自分）
+        sender_id  : 発信者の Slack ユーザー ID
+        """
+        if self._index_ready() and receiver_id not in self.user_index:
+            return None
+
+        user_ref = self.db.collection("users").document(receiver_id)
+        user_doc = user_ref.get()
+        
+        # 🔍 デバッグ出力追加
+        print(f"🔍 Firestore Document Path: users/{receiver_id}")
+        print(f"🔍 Exists?: {user_doc.exists}")
+        print(f"🔍 Raw Document Data: {user_doc.to_dict()}")
+
+        if not user_doc.exists:
+            print(f"⚠️ Firestore: ユーザー {receiver_id} は未登録のためメッセージを保存しません。")
+            return None
+
+        now = datetime.now(self.tz)
+
+        message_ref = (
+            user_ref
+            .collection("messages")
+            .document(message_id)
+        )
+
+        message_data = {
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "slack_message_id": message_id,
+            "channel_id": channel_id,
+            "text": text,
+            "is_ai": is_ai,
+            "is_bot": is_bot,
+            "is_see": is_see,
+            "channel_type": channel_type,
+            "timestamp": now,
+            "created_at": now,
+        }
+
+        counter_ref = None if is_see else unread_counter_ref(user_ref)
+        if not self._write_inbox([(message_ref, message_data, counter_ref)], channel_id):
+            print(f"♻️ Firestore: {receiver_id} の messages に保存済みのためスキップ ({message_id})")
+            return None
+        print(f"✅ Firestore: {receiver_id} の messages に保存完了 ({message_id})")
+        return message_data
+    
+    def _index_ready(self) -> bool:
+        return self.user_index is not None and self.user_index.ready
+
+    def registered_user_ids(
+        self,
+        user_ids: Iterable[str],
+        chunk_size: int = FIRESTORE_BATCH_LIMIT,
+    ) -> List[str]:
+        """
+        user_ids のうち Firestore に登録済みのユーザーIDだけを返す。
+        インデックスが読み込み済みならそれだけで判定し、Firestore は参照しない。
+        なければ1件ずつ get() せず、get_all でまとめて存在確認する。
+        """
+        user_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+        if self._index_ready():
+            return self.user_index.filter(user_ids)
+
+        users_ref = self.db.collection("users")
+
+        registered = set()
+        for i in range(0, len(user_ids), chunk_size):
+            refs = [users_ref.document(uid) for uid in user_ids[i:i + chunk_size]]
+            # 存在確認だけなので取得フィールドは最小限にする
+            for snapshot in self.db.get_all(refs, field_paths=["user_id"]):
+                if snapshot.exists:
+                    registered.add(snapshot.id)
+
+        # 入力順を維持して返す
+        return [uid for uid in user_ids if uid in registered]
+
+    def fan_out_message(
+        self,
+        receiver_ids: Iterable[str],
+        sender_id: str,
+        message_id: str,
+        channel_id: str,
+        text: str,
+        is_ai: bool = False,
+        is_bot: bool = False,
+        channel_type: str = "im",
+        chunk_size: int = FIRESTORE_BATCH_LIMIT,
+    ) -> List[str]:
+        """
+        チャンネルメンバー全員分のメッセージをまとめて保存。
+        receive_message をメンバー数だけ呼ぶ代わりに、登録確認を get_all 1回、
+        書き込みを chunk_size 件ごとの WriteBatch commit にまとめる。
+        送信者本人のコピーは既読扱いで保存する。
+        未読になる受信者は同じバッチで未読カウンタ（users/{id}/meta/unread）も増やす。
+        受信箱は既に無い場合だけ作るので、Slack の再送などで同じメッセージが来てもカウンタは増えない。
+        storage_mode が shared なら本文はチャンネル側に1回だけ書き、受信箱には参照と既読状態だけを書く。
+        Returns: 今回受信箱を作ったユーザーIDのリスト（保存済みだった受信者は含まない）
+        """
+        receivers = self.registered_user_ids(receiver_ids, chunk_size=chunk_size)
+        if not receivers:
+            print(f"⚠️ Firestore: 登録済みの受信者がいないため保存をスキップ ({message_id})")
+            return []
+
+        now = datetime.now(self.tz)
+        content = message_content(sender_id, message_id, channel_id, text, is_ai, is_bot, channel_type, now)
+        head = None
+        content_ref = None
+        if self.storage_mode == STORAGE_SHARED:
+            content_ref = self.channel_message_ref(channel_id, message_id)
+            head = (content_ref, content)
+
+        chunks = inbox_chunks(
+            self.db.collection("users"), receivers, sender_id, message_id,
+            channel_id, content, content_ref, now, chunk_size,
+        )
+        written = []
+        for i, chunk in enumerate(chunks):
+            # shared の本文は最初のバッチで書く（参照だけ先に見えないように）
+            written.extend(self._write_inbox(chunk, channel_id, head if i == 0 else None))
+
+        created = [receiver_of(write) for write in written]
+        print(
+            f"✅ Firestore: {len(created)}人の messages に一括保存完了 "
+            f"({message_id}, {self.storage_mode}, 保存済み {len(receivers) - len(created)}人)"
+        )
+        return created
+
+    def _write_inbox(self, chunk: List[InboxWrite], channel_id: str, head=None) -> List[InboxWrite]:
+        """
+        受信箱とカウンタを1バッチで書く。既にある受信箱は除く。
+        write-behind ならバッファの保留分だけを見て積み、Firestore は読まない
+        （作成済みの受信箱は flush 時に除かれ、カウンタも増えない）。
+        Returns: 実際に書いた（新しく作った）分。write-behind では積んだ分
+        （flush 前に作成済みだった受信者も含みうる。Slack の再送は EventDeduplicator で先に除く）
+        """
+        if self.writer is not None:
+            chunk = [write for write in chunk if not self.writer.is_pending(write[0].path)]
+            if chunk or head is not None:
+                batch = self.writer.batch()
+                fill_inbox_batch(batch, chunk, channel_id, head, deferred=True)
+                batch.commit()
+            return chunk
+
+        for attempt in range(INBOX_CREATE_RETRIES):
+            batch = self.db.batch()
+            fill_inbox_batch(batch, chunk, channel_id, head)
+            try:
+                batch.commit()
+                return chunk
+            except AlreadyExists:
+                # 再配信などで一部の受信箱が既にある。それを除いて書き直す（バッチは全部失敗しているので二重にならない）
+                existing = self._existing_paths([write[0] for write in chunk])
+                chunk = [write for write in chunk if write[0].path not in existing]
+                if not chunk:
+                    # 全員分あれば shared の本文も前回の保存で書かれている
+                    return []
+        raise RuntimeError("受信箱の作成の競合が解消しませんでした")
+
+    def _existing_paths(self, refs: List) -> set:
+        if not refs:
+            return set()
+        return {
+            snapshot.reference.path
+            for snapshot in self.db.get_all(refs, field_paths=["is_see"])
+            if snapshot.exists
+        }
+
+    def channel_message_ref(self, channel_id: str, message_id: str):
+        return self.db.collection("channels").document(channel_id).collection("messages").document(message_id)
+
+    def join_messages(
+        self,
+        messages: List[dict],
+        fields: Optional[Sequence[str]] = None,
+        chunk_size: int = FIRESTORE_BATCH_LIMIT,
+    ) -> List[dict]:
+        """
+        受信箱のドキュメント（to_dict した値）のうち message_ref を持つもの（shared）に
+        チャンネル側の本文を get_all でまとめて読んで足す。本文をコピーしたもの（copy）はそのまま。
+        fields を指定すると、そのうち本文側のフィールドだけ読む（無ければ読み込み自体を省く）。
+        受信箱側の値（is_see 等）を優先し、message_ref は取り除く（APIでそのまま返せるように）。
+        """
+        content_fields = [f for f in (fields or CONTENT_FIELDS) if f in CONTENT_FIELDS]
+        refs = {}
+        for message in messages:
+            ref = message.get("message_ref")
+            if ref is not None:
+                refs.setdefault(ref.path, ref)
+
+        contents: Dict[str, dict] = {}
+        if refs and content_fields:
+            unique = list(refs.values())
+            for i in range(0, len(unique), chunk_size):
+                for snapshot in self.db.get_all(unique[i:i + chunk_size], field_paths=content_fields):
+                    if snapshot.exists:
+                        contents[snapshot.reference.path] = snapshot.to_dict()
+
+        joined = []
+        for message in messages:
+            ref = message.pop("message_ref", None)
+            if ref is not None:
+                message = {**contents.get(ref.path, {}), **message}
+            joined.append(message)
+        return joined
+
+    def unread_messages(
+        self,
+        user_id: str,
+        limit: int = UNREAD_PAGE_DEFAULT,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        未読メッセージを timestamp の新しい順に limit 件ずつ返す。
+        cursor には前のページの next_cursor（最後のメッセージID）を渡す。
+        fields を指定するとそのフィールドだけ取得する（本文を省く等）。
+        shared 形式の受信箱は本文をチャンネル側から join_messages で足す（ページ1つにつき get_all 1回）。
+        is_see + timestamp の複合インデックスが必要（firestore.indexes.json）。
+        Returns: (メッセージのリスト, 次のページのカーソル or None)
+        """
+        limit = max(1, min(limit, UNREAD_PAGE_MAX))
+        messages_ref = self.db.collection("users").document(user_id).collection("messages")
+        query = (
+            messages_ref
+            .where("is_see", "==", False)
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+        )
+        if fields:
+            selected = list(fields)
+            if any(f in CONTENT_FIELDS for f in fields):
+                # shared 形式なら本文は参照先にある
+                selected.append("message_ref")
+            query = query.select(selected)
+        if cursor:
+            # カーソルのドキュメントの timestamp（と ID）の直後から読む
+            cursor_doc = messages_ref.document(cursor).get(field_paths=["timestamp"])
+            if not cursor_doc.exists:
+                raise ValueError(f"不正なカーソルです: {cursor}")
+            query = query.start_after(cursor_doc)
+
+        # 1件多く読んで次のページがあるか判定する
+        docs = list(query.limit(limit + 1).stream())
+        messages = []
+        for doc in docs[:limit]:
+            data = doc.to_dict()
+            data["id"] = doc.id
+            messages.append(data)
+        messages = self.join_messages(messages, fields)
+        if not fields or "receiver_id" in fields:
+            # shared 形式の受信箱には receiver_id を持たせていない
+            for message in messages:
+                message.setdefault("receiver_id", user_id)
+        next_cursor = docs[limit - 1].id if len(docs) > limit else None
+        return messages, next_cursor
+
+    def unread_counters(self, user_id: str) -> dict:
+        """
+        未読件数（全体とチャンネル別）を users/{user_id}/meta/unread のカウンタから返す（読み込み1回）。
+        まだ数え直していないカウンタ（カウンタ導入前からの未読が入っていない）や、
+        負になったカウンタは未読メッセージから作り直す。
+        """
+        snapshot = unread_counter_ref(self.db.collection("users").document(user_id)).get(
+            field_paths=["unread_count", "unread_by_channel", UNREAD_COUNTER_INITIALIZED]
+        )
+        data = snapshot.to_dict() or {}
+        by_channel = data.get("unread_by_channel") or {}
+        if (
+            not data.get(UNREAD_COUNTER_INITIALIZED)
+            or int(data.get("unread_count", 0)) < 0
+            or any(count < 0 for count in by_channel.values())
+        ):
+            return self.rebuild_unread_counters(user_id)
+        return {
+            "count": max(0, int(data["unread_count"])),
+            "by_channel": {channel_id: count for channel_id, count in by_channel.items() if count > 0},
+        }
+
+    def rebuild_unread_counters(self, user_id: str) -> dict:
+        """
+        未読件数を count() 集計で数え直してカウンタを上書きする。
+        未読のあるチャンネルを channel_id 順に1件ずつ飛ばし読みし（チャンネル数回の読み込み）、
+        チャンネルごとに count() で数えるので、未読メッセージを全件読まない。
+        読み込みと上書きは1つのトランザクションで行い、数えている間の保存・既読化とずれないようにする。
+        上書きしたカウンタには UNREAD_COUNTER_INITIALIZED の印を付け、以降は増減だけで正しい値を保つ。
+        ユーザーが存在しなければ何も書かずに0件を返す（任意のIDで users/{id} を作らない）。
+        """
+        user_ref = self.db.collection("users").document(user_id)
+        unread = user_ref.collection("messages").where("is_see", "==", False)
+        self._flush_pending(prefix=f"{user_ref.path}/messages/")
+
+        @firestore.transactional
+        def rebuild(transaction):
+            if not user_ref.get(field_paths=["user_id"], transaction=transaction).exists:
+                return None
+            by_channel = {}
+            query = unread.order_by("channel_id").select(["channel_id"]).limit(1)
+            while True:
+                docs = list(query.stream(transaction=transaction))
+                if not docs:
+                    break
+                channel_id = docs[0].get("channel_id")
+                result = unread.where("channel_id", "==", channel_id).count().get(transaction=transaction)
+                by_channel[channel_id] = int(result[0][0].value)
+                query = (
+                    unread.order_by("channel_id")
+                    .start_after({"channel_id": channel_id})
+                    .select(["channel_id"])
+                    .limit(1)
+                )
+            count = sum(by_channel.values())
+            transaction.set(unread_counter_ref(user_ref), {
+                "unread_count": count,
+                "unread_by_channel": by_channel,
+                UNREAD_COUNTER_INITIALIZED: True,
+            })
+            return {"count": count, "by_channel": by_channel}
+
+        counters = rebuild(self.db.transaction())
+        if counters is None:
+            return {"count": 0, "by_channel": {}}
+        print(f"🔢 Firestore: {user_id} の未読カウンタを再集計 ({counters['count']}件, {len(counters['by_channel'])}チャンネル)")
+        return counters
+
+    def mark_seen(self, user_id: str, message_id: str) -> Optional[str]:
+        """
+        メッセージを既読にし、未読カウンタを減らす（トランザクションで二重に減らさない）。
+        Returns: 未読から既読になった場合はそのチャンネルID、既読済み/存在しなければ None
+        """
+        user_ref = self.db.collection("users").document(user_id)
+        message_ref = user_ref.collection("messages").document(message_id)
+        self._flush_pending([message_ref.path])
+
+        @firestore.transactional
+        def mark(transaction):
+            snapshot = message_ref.get(field_paths=["is_see", "channel_id"], transaction=transaction)
+            if not snapshot.exists or snapshot.get("is_see"):
+                return None
+            channel_id = snapshot.get("channel_id")
+            transaction.update(message_ref, {"is_see": True})
+            transaction.set(unread_counter_ref(user_ref), unread_counter_update(channel_id, -1), merge=True)
+            return channel_id
+
+        return mark(self.db.transaction())
+
+    def mark_seen_bulk(
+        self,
+        user_id: str,
+        message_ids: Optional[Iterable[str]] = None,
+        channel_id: Optional[str] = None,
+        up_to_ts: Optional[str] = None,
+        chunk_size: int = FIRESTORE_BATCH_LIMIT,
+    ) -> dict:
+        """
+        メッセージをまとめて既読にする。
+        message_ids を指定するとそのメッセージ、channel_id + up_to_ts なら
+        そのチャンネルの Slack ts が up_to_ts 以下の未読メッセージが対象。
+        chunk_size - 1 件ごとに既読化とカウンタの減算を1つの WriteBatch で commit する。
+        各ドキュメントは読んだ時点の update_time を前提条件にするので、
+        同時に既読にされたものを二重に数えない（競合したチャンクは読み直す）。
+        Returns: 既読にした件数・チャンネル別件数・チャンネル別メッセージID・commit数・所要時間
+        """
+        started = time.perf_counter()
+        messages_ref = self.db.collection("users").document(user_id).collection("messages")
+        # 1バッチ = 既読化 (chunk_size - 1) 件 + カウンタ更新1件
+        per_batch = max(1, chunk_size - 1)
+        result = {"marked": 0, "by_channel": {}, "message_ids": {}, "batches": 0, "scanned": 0}
+
+        if message_ids is not None:
+            ids = list(dict.fromkeys(message_ids))
+            self._flush_pending([messages_ref.document(mid).path for mid in ids])
+            for i in range(0, len(ids), per_batch):
+                refs = [messages_ref.document(mid) for mid in ids[i:i + per_batch]]
+                self._mark_chunk(
+                    user_id,
+                    lambda: self.db.get_all(refs, field_paths=["is_see", "channel_id"]),
+                    result,
+                )
+        elif channel_id and up_to_ts:
+            self._flush_pending(prefix=f"{messages_ref.path}/")
+            # is_see が True になったものは次の読み込みで出てこないので、同じクエリを繰り返す
+            query = (
+                messages_ref
+                .where("is_see", "==", False)
+                .where("channel_id", "==", channel_id)
+                .where("slack_message_id", "<=", up_to_ts)
+                .select(["is_see", "channel_id"])
+                .limit(per_batch)
+            )
+            while self._mark_chunk(user_id, query.stream, result) >= per_batch:
+                pass
+        else:
+            raise ValueError("message_ids か channel_id + up_to_ts を指定してください")
+
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        print(
+            f"✅ Firestore: {user_id} の {result['marked']}件を既読化 "
+            f"({result['batches']} commit, {result['elapsed_ms']}ms)"
+        )
+        return result
+
+    def _flush_pending(self, paths: Iterable[str] = (), prefix: Optional[str] = None):
+        """
+        write-behind で積んだだけの受信箱（とカウンタの加算）を先に commit する。
+        既読化や再集計はバッファを通さず Firestore を直接読み書きするので、まだ無い受信箱を読み飛ばしたり、
+        後から届いた加算でカウンタがずれたりしないようにする
+        """
+        if self.writer is None:
+            return
+        paths = list(paths)
+        if prefix is not None:
+            paths.extend(self.writer.pending_paths(prefix))
+        if paths:
+            self.writer.flush_paths(paths)
+
+    def _mark_chunk(self, user_id: str, read_chunk, result: dict) -> int:
+        """
+        read_chunk() で読んだスナップショットのうち未読のものを1バッチで既読にする。
+        Returns: 読んだスナップショット数（クエリの続きがあるかの判定用）
+        """
+        user_ref = self.db.collection("users").document(user_id)
+        for attempt in range(MARK_SEEN_RETRIES):
+            snapshots = [snapshot for snapshot in read_chunk() if snapshot.exists]
+            unseen = [snapshot for snapshot in snapshots if not snapshot.get("is_see")]
+            if not unseen:
+                result["scanned"] += len(snapshots)
+                return len(snapshots)
+
+            batch = self.db.batch()
+            ids_by_channel: Dict[str, List[str]] = {}
+            for snapshot in unseen:
+                batch.update(
+                    snapshot.reference,
+                    {"is_see": True},
+                    option=self.db.write_option(last_update_time=snapshot.update_time),
+                )
+                ids_by_channel.setdefault(snapshot.get("channel_id"), []).append(snapshot.id)
+            batch.set(unread_counter_ref(user_ref), {
+                "unread_count": firestore.Increment(-len(unseen)),
+                "unread_by_channel": {
+                    channel: firestore.Increment(-len(ids)) for channel, ids in ids_by_channel.items()
+                },
+            }, merge=True)
+
+            try:
+                batch.commit()
+            except FailedPrecondition:
+                # 読んだ後に他の既読処理が更新した。読み直してやり直す
+                print(f"⚠️ Firestore: 既読化が競合したため読み直します ({attempt + 1}/{MARK_SEEN_RETRIES})")
+                continue
+
+            result["batches"] += 1
+            result["scanned"] += len(snapshots)
+            result["marked"] += len(unseen)
+            for channel, ids in ids_by_channel.items():
+                result["by_channel"][channel] = result["by_channel"].get(channel, 0) + len(ids)
+                result["message_ids"].setdefault(channel, []).extend(ids)
+            return len(snapshots)
+
+        raise RuntimeError("既読化の競合が解消しませんでした")
+
+    def send_message(self, receiver_id: str, sender_id: str,
+                     message_id: str, channel_id: str, text: str,
+                     is_ai=False, is_bot=False, is_see=False, channel_type="im"):
+        """
+        Firestoreにメッセージを保存
+        receiver_id : Firestore上のアプリ利用者（自分）
+        sender_id   : 発信者のSlackユーザID（relationsで参照）
+        """
+        ref = (
+            self.db.collection("users")
+            .document(sender_id)
+            .collection("messages")
+            .document(message_id)
+        )
+
+        now = datetime.now(self.tz)
+        data = {
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "slack_message_id": message_id,
+            "channel_id": channel_id,
+            "text": text,
+            "is_ai": is_ai,
+            "is_bot": is_bot,
+            "is_see": is_see,
+            "channel_type": channel_type,
+            "timestamp": now,
+            "created_at": now
+        }
+
+        batch = self._batch()
+        batch.set(ref, data)
+        batch.commit()
+        return data
@@ -0,0 +1,279 @@
+# managers/metrics.py
+import bisect
+import math
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 処理時間ヒストグラムの既定の境界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+_INVALID_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(name: str) -> str:
+    """Prometheus のメトリクス名に使えない文字を _ に置き換える"""
+    name = _INVALID_NAME.sub("_", name)
+    return "_" + name if name[:1].isdigit() else name
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class HistogramChild:
+    """
+    1つのラベルの組み合わせのヒストグラム。counts は累積しない各バケットの件数
+    （ws_broadcaster.LatencyHistogram と同じ形なので、どちらも render_histogram で出力できる）
+    """
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        """with で囲んだ区間の時間を記録する（例外で抜けた場合も記録）"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Metric:
+    """
+    ラベル付きメトリクスの共通部分。
+    labels(...) で子を取り出して記録する（よく使う組み合わせは呼び出し側で保持しておくと辞書引きも省ける）。
+    fn を渡すと、値は出力時に fn() から読む（各コンポーネントが既に数えている値を二重に数えない）。
+    ラベルなしなら fn は値を、ラベルありなら {ラベル値のタプル: 値} を返す。
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._children: Dict[LabelValues, object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ラベルは {self.labelnames} です（{values}）")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _items(self) -> Iterable[Tuple[LabelValues, object]]:
+        if self.fn is None:
+            return list(self._children.items())
+        value = self.fn()
+        if not self.labelnames:
+            return [((), value)] if value is not None else []
+        return [(tuple(str(v) for v in key), item) for key, item in value.items()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, item in self._items():
+            lines.extend(self._sample_lines(values, item))
+        return lines
+
+    def _sample_lines(self, values: LabelValues, item) -> List[str]:
+        value = getattr(item, "value", item)
+        return [f"{self.name}{format_labels(self.labelnames, values)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        fn: Optional[Callable] = None,
+    ):
+        super().__init__(name, help, labelnames, fn)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _sample_lines(self, values: LabelValues, item) -> List[str]:
+        return render_histogram(self.name, self.labelnames, values, item)
+
+
+def render_histogram(name: str, labelnames: Sequence[str], values: LabelValues, histogram) -> List[str]:
+    """buckets / counts（累積しない）/ total / count を持つヒストグラムを Prometheus 形式の行にする"""
+    lines = []
+    cumulative = 0
+    bucket_labels = tuple(labelnames) + ("le",)
+    for bound, count in zip(list(histogram.buckets) + [math.inf], histogram.counts):
+        cumulative += count
+        le = format_value(float(bound))
+        lines.append(f"{name}_bucket{format_labels(bucket_labels, values + (le,))} {cumulative}")
+    labels = format_labels(labelnames, values)
+    lines.append(f"{name}_sum{labels} {format_value(histogram.total)}")
+    lines.append(f"{name}_count{labels} {histogram.count}")
+    return lines
+
+
+def flatten_stats(stats: dict, prefix: str) -> List[Tuple[str, float]]:
+    """
+    /stats の入れ子の辞書から数値だけを (メトリクス名, 値) にする。
+    文字列・リスト・ヒストグラムのスナップショット（buckets を持つ辞書）は出さない。
+    """
+    samples = []
+    for key, value in stats.items():
+        name = f"{prefix}_{metric_name(str(key))}"
+        if isinstance(value, dict):
+            if "buckets" not in value:
+                samples.extend(flatten_stats(value, name))
+        elif isinstance(value, (int, float)):
+            samples.append((name, value))
+    return samples
+
+
+class MetricsRegistry:
+    """
+    Prometheus のテキスト形式で出力するメトリクスの登録先。
+    記録は単純な加算と bisect だけ（ロックなし、イベントループ上から呼ぶ前提）。
+    """
+
+    def __init__(self, prefix: str = "replymate"):
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"メトリクスが重複しています: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _name(self, name: str) -> str:
+        return f"{self.prefix}_{name}" if self.prefix else name
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None) -> Counter:
+        return self._register(Counter(self._name(name), help, labelnames, fn))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge(self._name(name), help, labelnames, fn))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        fn: Optional[Callable] = None,
+    ) -> Histogram:
+        return self._register(Histogram(self._name(name), help, labelnames, buckets, fn))
+
+    def render(self, stats: Optional[dict] = None) -> str:
+        """
+        登録済みのメトリクスを出力する。stats を渡すと数値の項目を
+        <prefix>_stats_<コンポーネント>_<項目> の untyped として後ろに付ける
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # 1つのメトリクスの読み出し失敗で全体を落とさない
+                print(f"❌ メトリクス出力エラー ({metric.name}): {e}")
+        if stats:
+            for name, value in flatten_stats(stats, self._name("stats")):
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
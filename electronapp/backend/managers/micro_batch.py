@@ -0,0 +1,103 @@
+# managers/micro_batch.py
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    短い時間窓に届いた要求をまとめて1回で処理する。
+    window 秒待つか max_batch 件たまった時点で run_batch に渡し、
+    run_batch が None を返した（応答を解釈できなかった）場合は run_single で1件ずつ処理し直す。
+    直前の要求から window 秒以上空いて届いた要求（低トラフィック時）は待たずにすぐ処理し、
+    続けて届いた要求だけを窓にためる（単発のメッセージに窓の待ち時間を足さない）。
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], Awaitable[Optional[List[Any]]]],
+        run_single: Callable[[Any], Awaitable[Any]],
+        window: float = 0.05,
+        max_batch: int = 20,
+    ):
+        self.run_batch = run_batch
+        self.run_single = run_single
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self._last_submit: Optional[float] = None
+
+        # メトリクス
+        self.batches = 0
+        self.batched_items = 0
+        self.singles = 0
+        self.immediate = 0
+        self.fallbacks = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        now = loop.time()
+        idle = self._last_submit is None or now - self._last_submit >= self.window
+        self._last_submit = now
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif idle and len(self._pending) == 1:
+            # 前の要求から間が空いている（バーストではない）ので待たない
+            self.immediate += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            # 実行中のタスクが GC されないよう保持
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        try:
+            if len(items) == 1:
+                self.singles += 1
+                results = [await self.run_single(items[0])]
+            else:
+                self.batches += 1
+                self.batched_items += len(items)
+                results = await self.run_batch(items)
+                if results is None:
+                    # 一括応答を解釈できなければ1件ずつ処理
+                    self.fallbacks += 1
+                    print(f"⚠️ 一括判定に失敗したため1件ずつ判定します ({len(items)}件)")
+                    results = await asyncio.gather(*(self.run_single(item) for item in items))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window,
+            "max_batch": self.max_batch,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "avg_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+            "singles": self.singles,
+            "immediate": self.immediate,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,371 @@
+# managers/pubsub.py
+import asyncio
+import os
+import socket
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+MessageHandler = Callable[[bytes], None]
+
+
+# =========================================================
+# 📦 配信メッセージの形式
+# =========================================================
+def encode_envelope(user_ids: List[str], text: str) -> bytes:
+    """宛先ユーザーID（カンマ区切り）と送信するJSON文字列を1行目/2行目以降に詰める"""
+    return (",".join(user_ids) + "\n" + text).encode()
+
+
+def decode_envelope(data: bytes) -> Tuple[List[str], str]:
+    header, _, text = data.decode().partition("\n")
+    return (header.split(",") if header else []), text
+
+
+# =========================================================
+# 🏠 プロセス内（ワーカー1つ）
+# =========================================================
+class InProcessPubSub:
+    """同じプロセスの購読者にそのまま渡す（uvicorn ワーカー1つの場合の既定）"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._on_message: Optional[MessageHandler] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, on_message: MessageHandler):
+        self._on_message = on_message
+
+    async def stop(self):
+        self._on_message = None
+
+    async def publish(self, data: bytes):
+        self.published += 1
+        if self._on_message is not None:
+            self.received += 1
+            self._on_message(data)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+        }
+
+
+# =========================================================
+# 🧦 Unixドメインソケット（同一マシンの複数ワーカー）
+# =========================================================
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner: "UnixSocketPubSub"):
+        self.owner = owner
+
+    def datagram_received(self, data: bytes, addr):
+        self.owner._received(data)
+
+    def error_received(self, exc: Exception):
+        self.owner.errors += 1
+        print(f"❌ Pub/Sub受信エラー: {exc}")
+
+
+class UnixSocketPubSub:
+    """
+    ワーカーごとに socket_dir/<pid>.sock のデータグラムソケットを開き、
+    publish はディレクトリ内の全ソケット（自分を含む）へ送る。
+    宛先ごとに connect したソケットを使うので、受信側のキューが詰まっていれば空くまで待つ
+    （send_timeout を過ぎたら破棄）。応答のないソケット（終了したワーカー）は削除する。
+    """
+
+    name = "unix"
+
+    def __init__(self, socket_dir: str, peer_refresh: float = 1.0, send_timeout: float = 1.0):
+        self.socket_dir = socket_dir
+        self.peer_refresh = peer_refresh
+        self.send_timeout = send_timeout
+        self.path: Optional[str] = None
+        self._on_message: Optional[MessageHandler] = None
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        # 宛先ソケットのパス -> connect 済みの送信用ソケット
+        self._peers: Dict[str, socket.socket] = {}
+        self._peers_at = 0.0
+
+        # メトリクス
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    async def start(self, on_message: MessageHandler):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.path = os.path.join(self.socket_dir, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._on_message = on_message
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self),
+            local_addr=self.path,
+            family=socket.AF_UNIX,
+        )
+        self._peers_at = 0.0
+        print(f"✅ Pub/Sub(unix) 購読開始: {self.path}")
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+        for sock in self._peers.values():
+            sock.close()
+        self._peers.clear()
+
+    def _received(self, data: bytes):
+        self.received += 1
+        if self._on_message is not None:
+            self._on_message(data)
+
+    def peers(self) -> Dict[str, socket.socket]:
+        """購読中のワーカーのソケット（peer_refresh 秒ごとにディレクトリを読み直す）"""
+        now = time.monotonic()
+        if now - self._peers_at < self.peer_refresh:
+            return self._peers
+        self._peers_at = now
+        try:
+            paths = {
+                os.path.join(self.socket_dir, name)
+                for name in os.listdir(self.socket_dir) if name.endswith(".sock")
+            }
+        except FileNotFoundError:
+            paths = set()
+        for path in set(self._peers) - paths:
+            self._peers.pop(path).close()
+        for path in paths - set(self._peers):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            try:
+                sock.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # 終了したワーカーのソケットが残っている
+                sock.close()
+                self._unlink(path)
+                continue
+            self._peers[path] = sock
+        return self._peers
+
+    async def publish(self, data: bytes):
+        self.published += 1
+        peers = list(self.peers().items())
+        await asyncio.gather(*(self._send(path, sock, data) for path, sock in peers))
+
+    async def _send(self, path: str, sock: socket.socket, data: bytes):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(loop.sock_sendall(sock, data), timeout=self.send_timeout)
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._remove_peer(path)
+        except asyncio.TimeoutError:
+            # 受信側のワーカーが詰まっている
+            self.dropped += 1
+        except OSError as e:
+            self.errors += 1
+            print(f"❌ Pub/Sub送信エラー ({path}): {e}")
+
+    def _remove_peer(self, path: str):
+        sock = self._peers.pop(path, None)
+        if sock is not None:
+            sock.close()
+        self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "socket": self.path,
+            "peers": len(self._peers),
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+# =========================================================
+# 🟥 Redis（複数マシン / 複数レプリカ）
+# =========================================================
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    """RESP の配列としてコマンドを組み立てる"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Redis接続が切断されました")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b"+":
+        return body.decode()
+    if prefix == b"-":
+        raise RedisError(body.decode())
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"不正な応答: {line!r}")
+
+
+class RedisPubSub:
+    """
+    Redis の PUBLISH / SUBSCRIBE を使う（RESP を直接話すのでクライアントライブラリは不要）。
+    購読用と発行用に接続を1本ずつ持ち、切断されたら待ってから繋ぎ直す。
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._on_message: Optional[MessageHandler] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publisher: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._publish_lock = asyncio.Lock()
+        self.subscribed = False
+
+        # メトリクス
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await writer.drain()
+            await read_reply(reader)
+        return reader, writer
+
+    async def start(self, on_message: MessageHandler):
+        self._on_message = on_message
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._publisher is not None:
+            self._publisher[1].close()
+            self._publisher = None
+
+    async def _listen(self):
+        delay = self.reconnect_delay
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                writer.write(encode_command("SUBSCRIBE", self.channel))
+                await writer.drain()
+                print(f"✅ Pub/Sub(redis) 購読開始: {self.host}:{self.port} {self.channel}")
+                delay = self.reconnect_delay
+                while True:
+                    reply = await read_reply(reader)
+                    if not isinstance(reply, list) or not reply:
+                        continue
+                    kind = reply[0]
+                    if kind == b"subscribe":
+                        self.subscribed = True
+                    elif kind == b"message":
+                        self.received += 1
+                        if self._on_message is not None:
+                            self._on_message(reply[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.reconnects += 1
+                print(f"⚠️ Pub/Sub(redis) 購読が切断されました: {e} ({delay}秒後に再接続)")
+            finally:
+                self.subscribed = False
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def publish(self, data: bytes):
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = await self._connect()
+                    reader, writer = self._publisher
+                    writer.write(encode_command("PUBLISH", self.channel, data))
+                    await writer.drain()
+                    await read_reply(reader)
+                    self.published += 1
+                    return
+                except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                    # 発行用接続が切れていたら1回だけ繋ぎ直す
+                    self.errors += 1
+                    if self._publisher is not None:
+                        self._publisher[1].close()
+                        self._publisher = None
+                    if attempt:
+                        raise ConnectionError(f"Redisへの発行に失敗しました: {e}") from e
+                    self.reconnects += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "server": f"{self.host}:{self.port}",
+            "channel": self.channel,
+            "subscribed": self.subscribed,
+            "published": self.published,
+            "received": self.received,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+        }
+
+
+def create_pubsub(backend: str, socket_dir: str = "", redis_url: str = "", channel: str = ""):
+    """PUBSUB_BACKEND の値からバックエンドを作る"""
+    if backend == "memory":
+        return InProcessPubSub()
+    if backend == "unix":
+        return UnixSocketPubSub(socket_dir)
+    if backend == "redis":
+        return RedisPubSub(redis_url, channel)
+    raise ValueError(f"不明な PUBSUB_BACKEND: {backend} (memory / unix / redis)")
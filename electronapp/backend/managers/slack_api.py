@@ -0,0 +1,211 @@
+# managers/slack_api.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+
+SLACK_API_URL = "https://slack.com/api/"
+
+# メソッドごとのTierと1分あたりの上限（https://api.slack.com/apis/rate-limits）
+TIER_LIMITS = {1: 1, 2: 20, 3: 50, 4: 100}
+METHOD_TIERS = {
+    "conversations.members": 4,
+    "conversations.info": 3,
+    "conversations.history": 3,
+    "users.info": 4,
+    "oauth.v2.access": 4,
+}
+# chat.postMessage はTier外（1チャンネルあたり概ね1件/秒）
+SPECIAL_LIMITS = {"chat.postMessage": 60}
+DEFAULT_PER_MINUTE = TIER_LIMITS[3]
+
+
+class RateLimiter:
+    """
+    トークンバケットによる呼び出し間隔の調整。
+    429 の Retry-After を受けたら、その時刻まで新しい呼び出しを止める。
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, per_minute)
+        self.rate = per_minute / 60
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class SlackTokenClient:
+    """1つのトークン用のSlack Web APIクライアント（HTTP接続は SlackAPI と共有）"""
+
+    def __init__(self, api: "SlackAPI", token: str):
+        self.api = api
+        self.token = token
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def _limiter(self, method: str) -> RateLimiter:
+        if method not in self._limiters:
+            if method in SPECIAL_LIMITS:
+                per_minute = SPECIAL_LIMITS[method]
+            else:
+                per_minute = TIER_LIMITS.get(METHOD_TIERS.get(method), DEFAULT_PER_MINUTE)
+            self._limiters[method] = RateLimiter(per_minute)
+        return self._limiters[method]
+
+    async def api_call(self, method: str, **params) -> SlackResponse:
+        """
+        Slack Web APIを呼ぶ。Tierの上限に合わせて待ち、429なら Retry-After 後に再試行する
+        ok=false の応答は SlackApiError を送出する
+        """
+        params = {key: value for key, value in params.items() if value is not None}
+        limiter = self._limiter(method)
+        http = self.api.http()
+
+        for attempt in range(self.api.max_retries + 1):
+            await limiter.acquire()
+            res = await http.post(
+                self.api.base_url + method,
+                data=params,
+                headers={"Authorization": f"Bearer {self.token}"},
+            )
+            if res.status_code == 429 and attempt < self.api.max_retries:
+                retry_after = float(res.headers.get("Retry-After", "1"))
+                self.api.rate_limited += 1
+                print(f"⏳ Slack API {method} がレート制限中: {retry_after}秒待って再試行")
+                limiter.block(retry_after)
+                continue
+            break
+
+        self.api.calls += 1
+        try:
+            data = res.json()
+        except ValueError:
+            data = {"ok": False, "error": f"http_{res.status_code}"}
+        response = SlackResponse(
+            client=self,
+            http_verb="POST",
+            api_url=self.api.base_url + method,
+            req_args={"data": params},
+            data=data,
+            headers=dict(res.headers),
+            status_code=res.status_code,
+        )
+        if not response.get("ok"):
+            raise SlackApiError(f"The request to the Slack API failed. ({method})", response)
+        return response
+
+    async def chat_postMessage(self, channel: str, text: str, thread_ts: Optional[str] = None) -> SlackResponse:
+        return await self.api_call("chat.postMessage", channel=channel, text=text, thread_ts=thread_ts)
+
+    async def conversations_members(self, channel: str, cursor: Optional[str] = None, limit: int = 1000) -> SlackResponse:
+        return await self.api_call("conversations.members", channel=channel, cursor=cursor, limit=limit)
+
+    async def conversations_members_all(self, channel: str, limit: int = 1000) -> List[str]:
+        """カーソルをたどってチャンネルの全メンバーを取得（100人超のチャンネルも欠けない）"""
+        members: List[str] = []
+        cursor = None
+        while True:
+            response = await self.conversations_members(channel=channel, cursor=cursor, limit=limit)
+            members.extend(response.get("members", []))
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                return members
+
+
+class SlackAPI:
+    """
+    非同期Slack Web APIクライアントの共有レイヤー。
+    HTTP接続プール（httpx.AsyncClient）を1つだけ持ち、トークンごとのクライアントを使い回す。
+    """
+
+    def __init__(
+        self,
+        max_clients: int = 1000,
+        max_retries: int = 3,
+        timeout: float = 10.0,
+        base_url: str = SLACK_API_URL,
+    ):
+        self.base_url = base_url
+        self.max_clients = max_clients
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._http: Optional[httpx.AsyncClient] = None
+        self._clients: "OrderedDict[str, SlackTokenClient]" = OrderedDict()
+
+        # メトリクス
+        self.calls = 0
+        self.rate_limited = 0
+
+    def http(self) -> httpx.AsyncClient:
+        """共有HTTPクライアント（イベントループ上で初回利用時に作成）"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+        return self._http
+
+    def client(self, token: str) -> SlackTokenClient:
+        """トークンごとのクライアントを返す（古いものから破棄して max_clients 件まで保持）"""
+        client = self._clients.get(token)
+        if client is None:
+            client = SlackTokenClient(self, token)
+            self._clients[token] = client
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        self._clients.move_to_end(token)
+        return client
+
+    def discard(self, token: str):
+        """トークンが差し替えられたら古いクライアントを捨てる"""
+        self._clients.pop(token, None)
+
+    async def oauth_access(self, client_id: str, client_secret: str, code: str, redirect_uri: str) -> dict:
+        """
+        oauth.v2.access でコードをトークンに交換する（共有HTTP接続を使う）
+        トークン不要なので SlackTokenClient は通さず、応答の JSON をそのまま返す
+        """
+        res = await self.http().post(
+            self.base_url + "oauth.v2.access",
+            data={
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "code": code,
+                "redirect_uri": redirect_uri,
+            },
+        )
+        self.calls += 1
+        return res.json()
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+        }
@@ -0,0 +1,158 @@
+# managers/unread_feed.py
+import asyncio
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+import pytz
+from google.cloud.firestore_v1.client import Client
+
+FeedHandler = Callable[[str, dict], None]
+# 受信箱のドキュメントに本文を足す（FirebaseManager.join_messages）
+JoinHandler = Callable[[List[dict], Sequence[str]], List[dict]]
+
+# WebSocket に載せるメッセージのフィールド
+FEED_FIELDS = ("sender_id", "channel_id", "text", "channel_type", "timestamp")
+
+
+class UnreadFeed:
+    """
+    接続中のユーザーごとに users/{id}/messages (is_see == False) のスナップショットリスナーを持ち、
+    変更分だけを unread_feed としてWebSocketへ流す（ポーリングで未読を読み直さない）。
+    対象は購読開始以降のメッセージ（全未読をリスナーに読み込まないため）。
+    同じユーザーの複数接続は参照カウントで1つのリスナーを共有し、最後の切断で止める。
+    リスナーのコールバックは別スレッドで呼ばれるので、call_soon_threadsafe でイベントループに渡す。
+    受信箱が参照だけ（shared）の場合は join で本文を足してから流す。
+    """
+
+    def __init__(
+        self,
+        db: Client,
+        deliver: FeedHandler,
+        max_listeners: int = 1000,
+        join: Optional[JoinHandler] = None,
+    ):
+        self.db = db
+        self.deliver = deliver
+        self.join = join
+        self.max_listeners = max_listeners
+        self.tz = pytz.timezone("Asia/Tokyo")
+        self._refs: Dict[str, int] = {}
+        self._watches: Dict[str, object] = {}
+        self._starting: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # メトリクス
+        self.snapshots = 0
+        self.added = 0
+        self.removed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    async def subscribe(self, user_id: str):
+        self._refs[user_id] = self._refs.get(user_id, 0) + 1
+        if user_id in self._watches or user_id in self._starting:
+            return
+        if len(self._watches) + len(self._starting) >= self.max_listeners:
+            # リスナー数の上限（クライアントは未読一覧APIで補う）
+            self.rejected += 1
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._starting.add(user_id)
+        try:
+            watch = await asyncio.to_thread(self._listen, user_id, datetime.now(self.tz))
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 未読フィード開始エラー ({user_id}): {e}")
+            return
+        finally:
+            self._starting.discard(user_id)
+
+        if self._refs.get(user_id, 0) == 0:
+            # 開始中に切断された
+            await asyncio.to_thread(watch.unsubscribe)
+            return
+        self._watches[user_id] = watch
+
+    async def unsubscribe(self, user_id: str):
+        count = self._refs.get(user_id, 0) - 1
+        if count > 0:
+            self._refs[user_id] = count
+            return
+        self._refs.pop(user_id, None)
+        watch = self._watches.pop(user_id, None)
+        if watch is not None:
+            await asyncio.to_thread(watch.unsubscribe)
+
+    async def stop(self):
+        watches = list(self._watches.values())
+        self._watches.clear()
+        self._refs.clear()
+        for watch in watches:
+            await asyncio.to_thread(watch.unsubscribe)
+
+    def _listen(self, user_id: str, since: datetime):
+        query = (
+            self.db.collection("users").document(user_id).collection("messages")
+            .where("is_see", "==", False)
+            .where("timestamp", ">=", since)
+        )
+
+        def on_snapshot(docs, changes, read_time):
+            # リスナーのスレッドから呼ばれる。対象は購読開始以降なので初回の ADDED もそのまま流す
+            added: List[dict] = []
+            removed: List[str] = []
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    # 既読になった（または削除された）
+                    removed.append(change.document.id)
+                elif change.type.name == "ADDED":
+                    data = change.document.to_dict() or {}
+                    data["id"] = change.document.id
+                    added.append(data)
+            if added and self.join is not None:
+                # shared 形式なら本文をまとめて読む（このスナップショット分で get_all 1回）
+                try:
+                    added = self.join(added, FEED_FIELDS)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ 未読フィード本文取得エラー ({user_id}): {e}")
+            added = [self._feed_message(data) for data in added]
+            if added or removed:
+                self._loop.call_soon_threadsafe(self._emit, user_id, added, removed)
+
+        return query.on_snapshot(on_snapshot)
+
+    @staticmethod
+    def _feed_message(data: dict) -> dict:
+        message = {field: data.get(field) for field in FEED_FIELDS}
+        message["id"] = data["id"]
+        message["timestamp"] = data["timestamp"].isoformat() if data.get("timestamp") else None
+        return message
+
+    def _emit(self, user_id: str, added: List[dict], removed: List[str]):
+        if not self._refs.get(user_id):
+            # 切断済み
+            return
+        self.snapshots += 1
+        self.added += len(added)
+        self.removed += len(removed)
+        try:
+            self.deliver(user_id, {
+                "type": "unread_feed",
+                "data": {"added": added, "removed": removed},
+            })
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 未読フィード送信エラー ({user_id}): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "listeners": len(self._watches),
+            "max_listeners": self.max_listeners,
+            "snapshots": self.snapshots,
+            "added": self.added,
+            "removed": self.removed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
@@ -0,0 +1,403 @@
+# managers/urgency.py
+import asyncio
+import hashlib
+import inspect
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from managers.micro_batch import MicroBatcher
+
+URGENCY_LEVELS = ("低", "中", "高")
+DEFAULT_URGENCY = "中"
+
+# 判定に使うモデル
+GEMINI_MODEL = "gemini-2.5-flash"
+OPENAI_MODEL = "gpt-3.5-turbo"
+
+# 判定基準（単発・一括判定のプロンプトで共通）
+URGENCY_CRITERIA = """あなたはSlackメッセージの緊急度を判定するAIです。
+以下の基準で判定してください:
+
+【高】即座の対応が必要
+- システム障害、エラー、緊急のバグ報告
+- 締切が迫っている重要なタスク
+- 顧客からのクレームや緊急の問い合わせ
+- セキュリティ関連の警告
+- 「至急」「緊急」「すぐに」などの緊急を示す言葉
+
+【中】通常の業務連絡
+- 一般的な質問や相談
+- 通常のタスク依頼
+- 情報共有
+
+【低】確認不要または雑談
+- 雑談、挨拶
+- 既読確認のみで対応不要なもの
+- スタンプのみのリアクション
+"""
+
+# 判定用プロンプト（メッセージ本文は {text} に展開）
+URGENCY_PROMPT = URGENCY_CRITERIA + """
+回答は必ず「低」「中」「高」のいずれか1文字のみで返してください。
+
+メッセージ:
+{text}"""
+
+# 一括判定用プロンプト（{messages} は「[ID] "本文"」を1行ずつ並べたもの）
+URGENCY_BATCH_PROMPT = URGENCY_CRITERIA + """
+複数のメッセージが「[ID] "本文"」の形式で1行ずつ与えられます。
+各メッセージの緊急度を、IDをキー、「低」「中」「高」のいずれか1文字を値とするJSONオブジェクトのみで返してください。
+例: {{"1": "高", "2": "低"}}
+
+メッセージ:
+{messages}"""
+
+# 単発・一括どちらのプロンプトを編集しても、モデルを変えてもバージョンが変わり、キャッシュ済みの判定は無効になる
+PROMPT_VERSION = hashlib.sha256(
+    "\0".join((URGENCY_PROMPT, URGENCY_BATCH_PROMPT, GEMINI_MODEL, OPENAI_MODEL)).encode()
+).hexdigest()[:12]
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def parse_batch_verdicts(raw: str, ids: List[str]) -> Optional[Dict[str, str]]:
+    """一括判定の応答（JSON）を解釈。全IDに正しい判定が揃っていなければ None"""
+    try:
+        verdicts = json.loads(_CODE_FENCE.sub("", raw.strip()))
+    except ValueError:
+        return None
+    if not isinstance(verdicts, dict):
+        return None
+    verdicts = {str(key): str(value).strip() for key, value in verdicts.items()}
+    if any(verdicts.get(message_id) not in URGENCY_LEVELS for message_id in ids):
+        return None
+    return verdicts
+
+
+@dataclass(frozen=True)
+class UrgencyResult:
+    """
+    緊急度判定の結果。イベントと一緒にパイプラインを流し、
+    同じメッセージを二度判定しないようにする。
+    provider: "rules" | "gemini" | "openai" | "default"
+    cached: キャッシュから返した結果なら True（latency は元の判定にかかった時間）
+    """
+    urgency: str
+    provider: str
+    latency: float = 0.0
+    cached: bool = False
+
+    @property
+    def is_urgent(self) -> bool:
+        return self.urgency == "高"
+
+
+class UrgencyClassifier:
+    """AI APIを使用してメッセージの緊急度を判定（Gemini優先、OpenAIフォールバック）"""
+
+    def __init__(
+        self,
+        gemini_model: Any = None,
+        openai_client: Any = None,
+        cache: Any = None,
+        pre_classifier: Any = None,
+        batch_window: float = 0.0,
+        batch_max: int = 20,
+        gemini_concurrency: int = 8,
+        openai_concurrency: int = 8,
+        timeout: float = 10.0,
+        hedge_delay: float = 2.0,
+    ):
+        self.gemini_model = gemini_model
+        self.openai_client = openai_client
+        # プロバイダーごとの同時呼び出し数の上限
+        self.limits = {
+            "gemini": asyncio.Semaphore(gemini_concurrency),
+            "openai": asyncio.Semaphore(openai_concurrency),
+        }
+        # 同期SDKしかない場合に使うスレッド（イベントループを止めないため）
+        self.executor = ThreadPoolExecutor(
+            max_workers=gemini_concurrency + openai_concurrency,
+            thread_name_prefix="urgency-llm",
+        )
+        # 1回の呼び出しのタイムアウト
+        self.timeout = timeout
+        # Geminiがこの秒数で返らなければOpenAIにも並行して聞く（エラー時は即フォールバック）
+        self.hedge_delay = hedge_delay
+        # UrgencyCache（同じ本文の再判定を省く）
+        self.cache = cache
+        # UrgencyPreClassifier（明らかな高/低はLLMを呼ばずに決める）
+        self.pre_classifier = pre_classifier
+        # batch_window 秒以内に届いたメッセージを batch_max 件までまとめて判定（0で無効）
+        self.batcher = None
+        if batch_window > 0 and batch_max > 1:
+            self.batcher = MicroBatcher(
+                self.classify_many,
+                self._classify_single,
+                window=batch_window,
+                max_batch=batch_max,
+            )
+        # プロバイダー別の呼び出し回数と結果
+        self.calls = {"gemini": 0, "openai": 0}
+        self.outcomes = {
+            provider: {"ok": 0, "invalid": 0, "error": 0, "timeout": 0, "cancelled": 0}
+            for provider in self.calls
+        }
+        self.hedges = 0
+        # register_metrics で設定（provider, outcome ごとの所要時間）
+        self._request_seconds = None
+
+    def register_metrics(self, metrics):
+        """LLM呼び出しの回数（provider, outcome 別）と所要時間を MetricsRegistry に登録"""
+        self._request_seconds = metrics.histogram(
+            "llm_request_seconds",
+            "LLM呼び出し1回の所要時間（同時実行数の空き待ちを含む）",
+            ("provider", "outcome"),
+        )
+        metrics.counter(
+            "llm_requests_total",
+            "LLM呼び出しの回数（outcome: ok / invalid / error / timeout / cancelled）",
+            ("provider", "outcome"),
+            fn=lambda: {
+                (provider, outcome): count
+                for provider, counts in self.outcomes.items()
+                for outcome, count in counts.items()
+            },
+        )
+        metrics.counter("llm_hedges_total", "Geminiが遅くOpenAIにも問い合わせた回数", fn=lambda: self.hedges)
+
+    async def classify(self, text: str) -> UrgencyResult:
+        """
+        メッセージの緊急度を判定（事前判定 → キャッシュ → LLM の順）
+        Returns: UrgencyResult（urgency は "低" | "中" | "高"）
+        """
+        if self.pre_classifier:
+            decided = self.pre_classifier.classify(text)
+            if decided:
+                print(f"⚡ ルール判定結果: '{decided.urgency}'")
+                return decided
+
+        if self.cache:
+            cached = self.cache.get(text)
+            if cached:
+                print(f"💾 キャッシュ判定結果: '{cached.urgency}'")
+                return cached
+
+        result = await self._classify_with_llm(text)
+
+        # 判定失敗時のデフォルト値はキャッシュしない
+        if self.cache and result.provider != "default":
+            self.cache.put(text, result)
+        return result
+
+    async def _classify_with_llm(self, text: str) -> UrgencyResult:
+        """Gemini → OpenAI → デフォルト値の順に判定（バッチャーがあれば一括判定に回す）"""
+        if self.batcher:
+            return await self.batcher.submit(text)
+        return await self._classify_single(text)
+
+    async def _classify_single(self, text: str) -> UrgencyResult:
+        """1メッセージを1回のAPI呼び出しで判定"""
+        started = time.perf_counter()
+        prompt_text = URGENCY_PROMPT.format(text=text)
+
+        answer = await self._ask(
+            prompt_text,
+            user_content=f"以下のメッセージの緊急度を判定してください:\n\n{text}",
+            parse=lambda raw: raw if raw in URGENCY_LEVELS else None,
+            max_tokens=10,
+        )
+        if answer:
+            urgency, provider = answer
+            return UrgencyResult(urgency, provider, time.perf_counter() - started)
+
+        # ✅ 3. 両方とも失敗した場合はデフォルト値
+        print(f"⚠️ すべてのAI APIが使用不可 - デフォルトで'{DEFAULT_URGENCY}'を返します")
+        return UrgencyResult(DEFAULT_URGENCY, "default", time.perf_counter() - started)
+
+    async def classify_many(self, texts: List[str]) -> Optional[List[UrgencyResult]]:
+        """
+        複数メッセージを1回のAPI呼び出しで判定（IDごとの判定をJSONで受け取る）
+        応答を解釈できなければ None（呼び出し側で1件ずつ判定し直す）。
+        どのプロバイダーも応答しなかった（エラー・タイムアウト）場合は1件ずつ呼び直しても失敗するだけなので、
+        全件をデフォルト値にする（1件ずつ判定した場合に全プロバイダーが失敗したときと同じ）
+        """
+        started = time.perf_counter()
+        ids = [str(i) for i in range(1, len(texts) + 1)]
+        lines = "\n".join(
+            f"[{message_id}] {json.dumps(text, ensure_ascii=False)}"
+            for message_id, text in zip(ids, texts)
+        )
+        prompt_text = URGENCY_BATCH_PROMPT.format(messages=lines)
+        # 応答が届いたか（解釈できなかったのか、呼び出し自体が失敗したのかを区別する）
+        responses = []
+
+        def parse(raw: str):
+            responses.append(raw)
+            return parse_batch_verdicts(raw, ids)
+
+        answer = await self._ask(
+            prompt_text,
+            user_content=f"以下のメッセージの緊急度をそれぞれ判定してください:\n\n{lines}",
+            parse=parse,
+            max_tokens=16 + 12 * len(texts),
+        )
+        if not answer:
+            if responses:
+                return None
+            print(f"⚠️ すべてのAI APIが使用不可 - 一括判定の{len(texts)}件をデフォルトで'{DEFAULT_URGENCY}'にします")
+            latency = time.perf_counter() - started
+            return [UrgencyResult(DEFAULT_URGENCY, "default", latency) for _ in ids]
+        verdicts, provider = answer
+        latency = time.perf_counter() - started
+        return [UrgencyResult(verdicts[message_id], provider, latency) for message_id in ids]
+
+    async def _ask(
+        self,
+        prompt_text: str,
+        user_content: str,
+        parse: Callable[[str], Any],
+        max_tokens: int,
+    ) -> Optional[Tuple[Any, str]]:
+        """
+        Gemini優先で聞き、エラー・解釈不能・hedge_delay 超過のいずれかでOpenAIにも聞く
+        先に解釈できる応答を返したほうを採用し、残りはキャンセルする
+        Returns: (parse後の値, プロバイダー名) / どちらもだめなら None
+        """
+        gemini_task = None
+        if self.gemini_model:
+            gemini_task = asyncio.create_task(self._ask_gemini(prompt_text, parse))
+            if not self.openai_client:
+                return await gemini_task
+
+            # ✅ 1. Gemini APIを試す（hedge_delay までは単独で待つ）
+            done, _ = await asyncio.wait({gemini_task}, timeout=self.hedge_delay)
+            if done and gemini_task.result() is not None:
+                return gemini_task.result()
+            if not done:
+                self.hedges += 1
+                print(f"⏱️ Gemini応答が{self.hedge_delay}秒を超えたためOpenAIにも問い合わせます")
+
+        if not self.openai_client:
+            return None
+
+        # ✅ 2. OpenAI APIにフォールバック（Gemini が遅いだけなら並走させる）
+        openai_task = asyncio.create_task(
+            self._ask_openai(prompt_text, user_content, parse, max_tokens)
+        )
+        pending = {task for task in (gemini_task, openai_task) if task and not task.done()}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, provider: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        SDK呼び出しを同時実行数・タイムアウト付きで実行
+        async版SDKならそのまま await、同期版ならスレッドで実行する
+        """
+        async with self.limits[provider]:
+            self.calls[provider] += 1
+            # デコレータで包まれた async 関数（OpenAIのAsyncクライアント等）も判定できるよう unwrap する
+            if inspect.iscoroutinefunction(inspect.unwrap(fn)):
+                call = fn(*args, **kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                call = loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+            return await asyncio.wait_for(call, timeout=self.timeout)
+
+    async def _ask_gemini(self, prompt_text: str, parse: Callable[[str], Any]):
+        started = time.perf_counter()
+        try:
+            print("🔵 Gemini APIで判定中...")
+            generate = getattr(self.gemini_model, "generate_content_async", None)
+            if generate is None:
+                generate = self.gemini_model.generate_content
+            response = await self._call("gemini", generate, prompt_text)
+            raw = response.text.strip()
+            print(f"🤖 Gemini判定結果: '{raw}'")
+            return self._accept("gemini", raw, parse, started)
+        except asyncio.CancelledError:
+            self._record("gemini", "cancelled", started)
+            raise
+        except asyncio.TimeoutError:
+            self._record("gemini", "timeout", started)
+            print(f"❌ Gemini API タイムアウト ({self.timeout}秒)")
+        except Exception as e:
+            self._record("gemini", "error", started)
+            print(f"❌ Gemini API エラー: {e}")
+        return None
+
+    async def _ask_openai(
+        self,
+        prompt_text: str,
+        user_content: str,
+        parse: Callable[[str], Any],
+        max_tokens: int,
+    ):
+        started = time.perf_counter()
+        try:
+            print("🟢 OpenAI APIで判定中...")
+            response = await self._call(
+                "openai",
+                self.openai_client.chat.completions.create,
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": prompt_text.split("メッセージ:")[0]},
+                    {"role": "user", "content": user_content}
+                ],
+                temperature=0.3,
+                max_tokens=max_tokens
+            )
+            raw = response.choices[0].message.content.strip()
+            print(f"🤖 OpenAI判定結果: '{raw}'")
+            return self._accept("openai", raw, parse, started)
+        except asyncio.CancelledError:
+            self._record("openai", "cancelled", started)
+            raise
+        except asyncio.TimeoutError:
+            self._record("openai", "timeout", started)
+            print(f"❌ OpenAI API タイムアウト ({self.timeout}秒)")
+        except Exception as e:
+            self._record("openai", "error", started)
+            print(f"❌ OpenAI API エラー: {e}")
+        return None
+
+    def _accept(self, provider: str, raw: str, parse: Callable[[str], Any], started: float):
+        # 正規化
+        parsed = parse(raw)
+        if parsed is None:
+            self._record(provider, "invalid", started)
+            print(f"⚠️ 予期しない判定結果: {raw}")
+            return None
+        self._record(provider, "ok", started)
+        return parsed, provider
+
+    def _record(self, provider: str, outcome: str, started: float):
+        self.outcomes[provider][outcome] += 1
+        if self._request_seconds is not None:
+            self._request_seconds.labels(provider, outcome).observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        stats = {
+            "calls": dict(self.calls),
+            "outcomes": {provider: dict(counts) for provider, counts in self.outcomes.items()},
+            "hedges": self.hedges,
+        }
+        if self.cache:
+            stats["cache"] = self.cache.stats()
+        if self.pre_classifier:
+            stats["rules"] = self.pre_classifier.stats()
+        if self.batcher:
+            stats["batch"] = self.batcher.stats()
+        return stats
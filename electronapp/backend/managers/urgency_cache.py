@@ -0,0 +1,144 @@
+# managers/urgency_cache.py
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Optional, Tuple
+
+from managers.urgency import PROMPT_VERSION, UrgencyResult
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """全角/半角・大文字小文字・空白の揺れを吸収してからハッシュする"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+class UrgencyCache:
+    """
+    緊急度判定のキャッシュ（正規化した本文のハッシュがキー）。
+    メモリ上のLRUと、再起動後も残るSQLite（path指定時のみ）の2段構成。
+    エントリごとにTTLを持ち、プロンプトのバージョンが変わると古い判定は使わない。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 5000,
+        ttl: float = 24 * 60 * 60,
+        path: Optional[str] = None,
+        prompt_version: str = PROMPT_VERSION,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.prompt_version = prompt_version
+        # key -> (UrgencyResult, 有効期限 UNIX時刻)
+        self._memory: "OrderedDict[str, Tuple[UrgencyResult, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._open_db(path)
+
+        # メトリクス
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0
+
+    def _open_db(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS urgency_cache (
+                key TEXT PRIMARY KEY,
+                urgency TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                latency REAL NOT NULL,
+                prompt_version TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+        # 別バージョンのプロンプトによる判定と期限切れを起動時に掃除
+        deleted = self._db.execute(
+            "DELETE FROM urgency_cache WHERE prompt_version != ? OR expires_at <= ?",
+            (self.prompt_version, time.time()),
+        ).rowcount
+        print(f"✅ 緊急度キャッシュ(SQLite)読み込み: {path} (削除 {deleted}件)")
+
+    def key(self, text: str) -> str:
+        raw = f"{self.prompt_version}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _remember(self, key: str, result: UrgencyResult, expires_at: float):
+        self._memory[key] = (result, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str) -> Optional[UrgencyResult]:
+        """キャッシュ済みの判定結果（cached=True）を返す。なければ None"""
+        key = self.key(text)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._hit(entry[0])
+            if entry:
+                del self._memory[key]
+
+            if self._db:
+                row = self._db.execute(
+                    "SELECT urgency, provider, latency, expires_at FROM urgency_cache "
+                    "WHERE key = ? AND prompt_version = ? AND expires_at > ?",
+                    (key, self.prompt_version, now),
+                ).fetchone()
+                if row:
+                    result = UrgencyResult(row[0], row[1], row[2])
+                    # ディスクで見つかった判定はメモリにも載せる
+                    self._remember(key, result, row[3])
+                    self.disk_hits += 1
+                    return self._hit(result)
+
+            self.misses += 1
+            return None
+
+    def _hit(self, result: UrgencyResult) -> UrgencyResult:
+        self.saved_latency += result.latency
+        return replace(result, cached=True)
+
+    def put(self, text: str, result: UrgencyResult):
+        key = self.key(text)
+        expires_at = time.time() + self.ttl
+        result = replace(result, cached=False)
+        with self._lock:
+            self._remember(key, result, expires_at)
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO urgency_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, result.urgency, result.provider, result.latency,
+                     self.prompt_version, expires_at),
+                )
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._memory),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "persistent": self._db is not None,
+            "prompt_version": self.prompt_version,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "saved_latency_seconds": self.saved_latency,
+        }
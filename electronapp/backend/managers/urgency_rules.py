@@ -0,0 +1,208 @@
+# managers/urgency_rules.py
+import re
+import time
+import unicodedata
+from typing import Dict, Optional
+
+from managers.urgency import UrgencyResult
+
+# 緊急を示す語と重み（判定プロンプトの【高】の基準に対応）
+HIGH_KEYWORDS: Dict[str, float] = {
+    "至急": 3.0,
+    "緊急": 3.0,
+    "大至急": 3.0,
+    "すぐに": 2.0,
+    "今すぐ": 2.5,
+    "障害": 2.5,
+    "落ちて": 2.0,
+    "ダウン": 2.0,
+    "エラー": 1.5,
+    "不具合": 1.5,
+    "バグ": 1.0,
+    "クレーム": 2.0,
+    "セキュリティ": 1.5,
+    "不正アクセス": 3.0,
+    "情報漏洩": 3.0,
+    "締切": 1.0,
+    "本日中": 1.5,
+    "error": 1.5,
+    "down": 1.5,
+    "outage": 3.0,
+    "incident": 2.5,
+    "urgent": 3.0,
+    "asap": 2.5,
+    "critical": 2.0,
+    "fatal": 2.0,
+}
+
+# 急ぎではないことを示す表現。含まれていればキーワードがあっても高とは決めずLLMに回す
+NOT_URGENT_PHRASES = (
+    "急ぎではない",
+    "急ぎではありません",
+    "急ぎじゃない",
+    "急ぎません",
+    "急がない",
+    "急がなくて",
+    "後で大丈夫",
+    "あとで大丈夫",
+    "後ほどで大丈夫",
+    "いつでも大丈夫",
+    "時間があるとき",
+    "手が空いたら",
+    "no rush",
+    "no hurry",
+    "not urgent",
+    "not critical",
+    "low priority",
+    "whenever",
+)
+
+# 解決報告・お礼（「障害は復旧しました」「緊急対応ありがとうございました」など）。
+# 過去形やお礼を含むメッセージは緊急の語があっても高とは決めずLLMに回す
+RESOLVED_PHRASES = (
+    "ました",
+    "でした",
+    "ありがとう",
+    "助かりました",
+    "resolved",
+    "fixed",
+    "recovered",
+    "thanks",
+    "thank you",
+)
+
+# 日本語のキーワード直後の否定（「緊急ではない」「障害ではありません」など）
+_JA_NEGATION = r"(?!\s*(?:では|じゃ|で)(?:ない|なく|あり(?:ません|ませ)))"
+
+
+def _keyword_pattern(words, ja_negation: bool = True) -> "re.Pattern":
+    """
+    キーワードのいずれかに一致する正規表現。
+    英語は単語境界で区切り（download / countdown の down に一致させない）、
+    日本語は ja_negation なら直後が否定のものに一致させない。長い語を先に試す
+    """
+    parts = []
+    for word in sorted(words, key=len, reverse=True):
+        if word.isascii():
+            parts.append(rf"(?<![a-z0-9]){re.escape(word)}(?![a-z0-9])")
+        else:
+            parts.append(re.escape(word) + (_JA_NEGATION if ja_negation else ""))
+    return re.compile("|".join(parts))
+
+
+# 雑談・挨拶（【低】の基準に対応）。メッセージ全体が挨拶だけなら低と判定
+GREETINGS = (
+    "おはよう",
+    "こんにちは",
+    "こんばんは",
+    "お疲れ",
+    "おつかれ",
+    "ありがとう",
+    "了解",
+    "承知",
+    "よろしく",
+    "おやすみ",
+    "いってきます",
+    "ただいま",
+    "お先に失礼",
+    "thanks",
+    "thank you",
+    "lgtm",
+)
+
+# 挨拶の後ろに付く敬語（「お疲れ様です」「ありがとうございました」「よろしくお願いします」など）
+GREETING_SUFFIXES = (
+    "様",
+    "さま",
+    "です",
+    "でした",
+    "ございます",
+    "ございました",
+    "します",
+    "しました",
+    "いたします",
+    "いたしました",
+    "致します",
+    "致しました",
+    "お願いします",
+    "お願いいたします",
+    "お願い致します",
+    "なさい",
+)
+
+# :smile: のような絵文字コードだけのメッセージ（スタンプのみ）
+_STAMP = r":[a-z0-9_+\-']+:"
+_STAMP_ONLY = re.compile(rf"^(\s*{_STAMP}\s*)+$")
+_SYMBOLS_ONLY = re.compile(r"^[\W_]*$")
+
+
+def _alternation(words) -> str:
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+# 挨拶（＋敬語）と区切り（空白・句読点・記号・スタンプ。? は除く）だけでできたメッセージ
+_GREETING_ONLY = re.compile(
+    rf"^(?:[^\w?]|{_STAMP})*"
+    rf"(?:(?:{_alternation(GREETINGS)})(?![a-z0-9])(?:{_alternation(GREETING_SUFFIXES)})*(?:[^\w?]|{_STAMP})*)+$"
+)
+
+
+class UrgencyPreClassifier:
+    """
+    LLMに投げる前のルール＋辞書ベースの事前判定。
+    明らかに高い/低いメッセージだけをローカルで決め、曖昧なものは None を返してLLMに回す。
+    """
+
+    def __init__(
+        self,
+        high_threshold: float = 3.0,
+        max_low_length: int = 30,
+        keywords: Optional[Dict[str, float]] = None,
+    ):
+        self.high_threshold = high_threshold
+        self.max_low_length = max_low_length
+        self.keywords = keywords or HIGH_KEYWORDS
+        self._keyword_re = _keyword_pattern(self.keywords)
+        self._not_urgent_re = _keyword_pattern(NOT_URGENT_PHRASES + RESOLVED_PHRASES, ja_negation=False)
+
+        # メトリクス
+        self.decided = {"高": 0, "低": 0}
+        self.passed = 0
+
+    def score(self, text: str) -> float:
+        """緊急を示す語の重みの合計（同じ語は1回だけ数える。否定されている語は数えない）"""
+        matched = {match.group() for match in self._keyword_re.finditer(text)}
+        return sum(self.keywords[word] for word in matched)
+
+    def classify(self, text: str) -> Optional[UrgencyResult]:
+        """確実に判定できる場合のみ UrgencyResult（provider="rules"）を返す"""
+        started = time.perf_counter()
+        normalized = unicodedata.normalize("NFKC", text or "").strip().lower()
+
+        urgency = None
+        if not normalized or _STAMP_ONLY.match(normalized) or _SYMBOLS_ONLY.match(normalized):
+            # 空・スタンプのみ・記号や絵文字のみ
+            urgency = "低"
+        else:
+            score = self.score(normalized)
+            if score >= self.high_threshold and not self._not_urgent_re.search(normalized):
+                urgency = "高"
+            elif score == 0 and len(normalized) <= self.max_low_length and _GREETING_ONLY.match(normalized):
+                # 挨拶・お礼だけの短いメッセージ（後ろに用件が続くものはLLMに回す）
+                urgency = "低"
+
+        if urgency is None:
+            self.passed += 1
+            return None
+
+        self.decided[urgency] += 1
+        return UrgencyResult(urgency, "rules", time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        decided = sum(self.decided.values())
+        total = decided + self.passed
+        return {
+            "decided": dict(self.decided),
+            "passed_to_llm": self.passed,
+            "short_circuit_ratio": decided / total if total else 0.0,
+        }
@@ -0,0 +1,117 @@
+# managers/user_cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+ProfileFetcher = Callable[[str], Awaitable[Optional[dict]]]
+
+# キャッシュに残す項目（未読カウンタなど頻繁に変わるものは持たない）
+PROFILE_FIELDS = (
+    "user_id",
+    "real_name",
+    "display_name",
+    "email",
+    "slack_team_id",
+    "slack_user_token",
+)
+
+
+def profile_of(user_data: Optional[dict]) -> Optional[dict]:
+    if user_data is None:
+        return None
+    return {field: user_data.get(field) for field in PROFILE_FIELDS}
+
+
+class UserProfileCache:
+    """
+    ユーザーID → プロフィール（Slackユーザートークンなど）のキャッシュ。
+    /slack/reply のたびに users/{user_id} を読まずに済むようにする。
+    TTL 切れか未登録なら取り直し、同じユーザーの同時取得は1回にまとめる。
+    /register-user でトークンを書き換えたら put で差し替える（取得中の古い結果では上書きしない）。
+    未登録ユーザー（None）はキャッシュしない。
+    """
+
+    def __init__(self, fetch: ProfileFetcher, ttl: float = 300.0, max_users: int = 10000):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_users = max_users
+        # user_id -> (プロフィール, 取得時刻)
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            self.hits += 1
+            self._entries.move_to_end(user_id)
+            return dict(entry[0])
+
+        self.misses += 1
+        profile = await self._load(user_id)
+        return dict(profile) if profile is not None else None
+
+    def _load(self, user_id: str) -> asyncio.Task:
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda done: self._finish(user_id, done))
+        return task
+
+    def _finish(self, user_id: str, task: asyncio.Task):
+        if self._inflight.get(user_id) is task:
+            self._inflight.pop(user_id)
+        if not task.cancelled() and task.exception():
+            print(f"❌ ユーザープロフィール取得エラー ({user_id}): {task.exception()}")
+
+    async def _fetch(self, user_id: str) -> Optional[dict]:
+        started = time.monotonic()
+        profile = profile_of(await self.fetch(user_id))
+        # 取得中に put / invalidate されていたら結果は呼び出し元に返すだけ
+        if profile is not None and self._inflight.get(user_id) is asyncio.current_task():
+            self._store(user_id, profile, started)
+        return profile
+
+    def _store(self, user_id: str, profile: dict, fetched_at: float):
+        self._entries[user_id] = (profile, fetched_at)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def peek(self, user_id: str) -> Optional[dict]:
+        """期限に関係なくキャッシュ済みのプロフィール（無ければ None、取得はしない）"""
+        entry = self._entries.get(user_id)
+        return dict(entry[0]) if entry else None
+
+    def put(self, user_id: str, user_data: dict):
+        """登録・更新直後の内容で差し替える（write-behind 中でも新しいトークンを使える）"""
+        self._inflight.pop(user_id, None)
+        self._store(user_id, profile_of(user_data), time.monotonic())
+        self.invalidations += 1
+
+    def invalidate(self, user_id: str):
+        """エントリを破棄（次の get で取り直す）"""
+        self._inflight.pop(user_id, None)
+        self._entries.pop(user_id, None)
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "max_users": self.max_users,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,100 @@
+# managers/user_index.py
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from google.cloud.firestore_v1.client import Client
+
+
+class RegisteredUserIndex:
+    """
+    Firestore の users に登録済みのユーザーIDをメモリ上に持つインデックス。
+    起動時に読み込み、users コレクションのスナップショットリスナーで他プロセスの登録・削除にも追従する。
+    ファンアウト時は未登録メンバーへの Firestore 参照を省ける。
+    """
+
+    def __init__(self, db: Client, collection: str = "users"):
+        self.db = db
+        self.collection = collection
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._watch = None
+        self.loaded_at: Optional[float] = None
+        self.synced_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self, timeout: float = 30.0):
+        """リスナーを登録し、初回スナップショット（= 全件読み込み）を待つ"""
+        try:
+            self._watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+            if self._ready.wait(timeout):
+                print(f"✅ 登録ユーザーインデックス読み込み完了: {len(self._ids)}人")
+                return
+            print("⚠️ 登録ユーザーインデックス: スナップショットが届かないためクエリで読み込みます")
+        except Exception as e:
+            print(f"⚠️ 登録ユーザーインデックス: リスナー登録失敗 ({e})")
+        self.load()
+
+    def load(self):
+        """IDだけを射影したクエリで全件読み込む"""
+        docs = self.db.collection(self.collection).select(["user_id"]).stream()
+        ids = {doc.id for doc in docs}
+        with self._lock:
+            self._ids = ids
+        self.loaded_at = self.synced_at = time.time()
+        self._ready.set()
+        print(f"✅ 登録ユーザーインデックス読み込み完了: {len(ids)}人")
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # リスナーのスレッドから呼ばれる
+        with self._lock:
+            if not self._ready.is_set():
+                self._ids = {doc.id for doc in docs}
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    self._ids.discard(change.document.id)
+                else:
+                    self._ids.add(change.document.id)
+        now = time.time()
+        if self.loaded_at is None:
+            self.loaded_at = now
+        self.synced_at = now
+        self._ready.set()
+
+    def add(self, user_id: str):
+        if user_id:
+            with self._lock:
+                self._ids.add(user_id)
+
+    def discard(self, user_id: str):
+        with self._lock:
+            self._ids.discard(user_id)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def filter(self, user_ids: Iterable[str]) -> List[str]:
+        """登録済みのIDだけを入力順で返す"""
+        ids = self._ids
+        return [uid for uid in dict.fromkeys(user_ids) if uid in ids]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._ids),
+            "ready": self.ready,
+            "listening": self._watch is not None,
+            # リスナー稼働中は最後に変更通知を受けてからの秒数
+            "seconds_since_sync": time.time() - self.synced_at if self.synced_at else None,
+        }
@@ -0,0 +1,696 @@
+# managers/write_behind.py
+import asyncio
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud import firestore
+from google.cloud.firestore_v1.async_document import AsyncDocumentReference
+from google.cloud.firestore_v1.base_document import BaseDocumentReference
+from google.cloud.firestore_v1.client import Client
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Firestore の WriteBatch 1回あたりの上限
+FIRESTORE_BATCH_LIMIT = 500
+
+# 再試行しても通らない失敗（データ自体が不正）
+PERMANENT_ERRORS = (google_exceptions.InvalidArgument, ValueError, TypeError)
+# flush 時に作成済みと分かった受信箱を除いて commit し直す回数（確認から commit までの間に他で作られた場合）
+CREATE_RETRIES = 3
+
+# 書き込みの種類（ジャーナルの merge 列の値）
+SET, MERGE, CREATE = 0, 1, 2
+
+# (ドキュメントのパス, データ, 種類, CREATE で作成できた場合だけ merge するドキュメント {パス: データ})
+Write = Tuple[str, dict, int, Optional[Dict[str, dict]]]
+
+
+def _encode(value):
+    """書き込む値を JSON にできる形にする（SQLite のジャーナル用）"""
+    if isinstance(value, datetime):
+        return {"$ts": value.isoformat()}
+    if isinstance(value, firestore.Increment):
+        return {"$inc": value.value}
+    if isinstance(value, BaseDocumentReference):
+        return {"$ref": value.path}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _combine(old, new):
+    """同じフィールドに保留中の値 old へ new を重ねる（Increment は足し合わせる）"""
+    if isinstance(new, firestore.Increment):
+        if isinstance(old, firestore.Increment):
+            return firestore.Increment(old.value + new.value)
+        if isinstance(old, (int, float)) and not isinstance(old, bool):
+            return old + new.value
+        return new
+    if isinstance(new, dict) and isinstance(old, dict):
+        return _merge(old, new)
+    return new
+
+
+def _merge(base: dict, update: dict) -> dict:
+    merged = dict(base)
+    for key, value in update.items():
+        merged[key] = _combine(merged[key], value) if key in merged else value
+    return merged
+
+
+def _merge_into(writes: Dict[str, Tuple[dict, bool]], path: str, data: dict, merge: bool) -> bool:
+    """1つの WriteBatch に同じドキュメントを2回書かないよう、path への書き込みを重ねる（重ねたら True）"""
+    if path not in writes:
+        writes[path] = (data, merge)
+        return False
+    if merge:
+        old, old_merge = writes[path]
+        writes[path] = (_merge(old, data), old_merge)
+    else:
+        writes[path] = (data, False)
+    return True
+
+
+class _PendingWrite:
+    __slots__ = ("data", "mode", "dependents", "journal_ids", "since", "attempts")
+
+    def __init__(
+        self,
+        data: dict,
+        mode: int,
+        journal_ids: List[int],
+        since: float,
+        attempts: int = 0,
+        dependents: Optional[Dict[str, dict]] = None,
+    ):
+        self.data = data
+        self.mode = mode
+        # CREATE で作成できた場合だけ merge する書き込み（受信箱に対する未読カウンタの加算）
+        self.dependents = dependents or {}
+        self.journal_ids = journal_ids
+        self.since = since
+        # commit に失敗した回数
+        self.attempts = attempts
+
+    @property
+    def weight(self) -> int:
+        """commit したときの WriteBatch の書き込み件数（の上限）"""
+        return 1 + len(self.dependents)
+
+    def then(self, later: "_PendingWrite") -> "_PendingWrite":
+        """self の後に later を書いたのと同じ結果になる1件にまとめる"""
+        journal_ids = self.journal_ids + later.journal_ids
+        if later.mode == CREATE:
+            # 先に書く（作る）分があるので、後の作成は AlreadyExists と同じく何もしない
+            return _PendingWrite(self.data, self.mode, journal_ids, self.since, self.attempts, self.dependents)
+        if later.mode == MERGE:
+            data, mode = _merge(self.data, later.data), self.mode
+        else:
+            data, mode = later.data, (CREATE if self.mode == CREATE else SET)
+        # 作成に重ねた書き込みは、作成できた場合だけ反映する
+        return _PendingWrite(data, mode, journal_ids, self.since, self.attempts, self.dependents)
+
+    def journal_data(self) -> dict:
+        """ジャーナルに書く形（CREATE は依存する書き込みも一緒に持つ）"""
+        if self.mode == CREATE:
+            return {"data": self.data, "then": self.dependents}
+        return self.data
+
+
+class _BufferedBatch:
+    """WriteBatch の代わりに渡す（commit はバッファに積むだけ）"""
+
+    def __init__(self, buffer: "WriteBehindBuffer"):
+        self._buffer = buffer
+        self._writes: List[Tuple[str, dict, bool]] = []
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._writes.append((reference.path, document_data, MERGE if merge else SET, None))
+
+    def create(self, reference, document_data: dict, then: Optional[Dict[object, dict]] = None):
+        """
+        ドキュメントが無い場合だけ作る。存在の確認は flush 時に行い、作成済みなら何も書かない。
+        then（{参照: データ}）は作成できた場合だけ同じ WriteBatch で merge する（未読カウンタの加算など）
+        """
+        dependents = {ref.path: data for ref, data in (then or {}).items()}
+        self._writes.append((reference.path, document_data, CREATE, dependents))
+
+    def commit(self):
+        self._buffer.enqueue(self._writes)
+        self._writes = []
+
+
+class WriteBehindBuffer:
+    """
+    Firestore への書き込みを溜めて、まとめて非同期に commit するバッファ（write-behind）。
+    FirebaseManager に渡すと、保存処理は batch() でここに積むだけで返る（Firestore の待ち時間を待たない）。
+    同じドキュメントへの書き込みは1件にまとめ（merge は重ね、Increment は足し合わせる）、
+    max_batch 件溜まるか flush_interval 秒ごとに WriteBatch で commit する（1回に concurrency バッチまで同時）。
+    失敗したら指数バックオフで再試行し、max_attempts 回失敗した書き込みと不正なデータで失敗した書き込みは
+    デッドレター（ジャーナルの dead_letter テーブルとログ）に移して、後ろの書き込みを止めない。
+    create で積んだ書き込みは flush 時に get_all でまとめて存在を確認し、無いものだけ作る
+    （積む側は Firestore を読まずに返る。作成できた場合だけ一緒に積んだ未読カウンタの加算も書く）。
+    journal_path を指定すると積んだ書き込みを
+    SQLite に記録してから返すので、プロセスが落ちても次の起動時に書き直せる。
+    ジャーナルはプロセスごとの別ファイル（journal_path に pid を付けたもの）で、ロックファイルを保持している間は
+    他のプロセスは読まない。起動時にロックの取れる（持ち主が終了した）ジャーナルだけを引き取って書き直す。
+    commit 直後にジャーナルを消す前に落ちた場合は書き直しになる（Increment は二重に数えうる。
+    未読カウンタは rebuild_unread_counters で直せる）。
+    書き込みは flush されるまで読み込みに反映されない。
+    """
+
+    def __init__(
+        self,
+        db: Client,
+        flush_interval: float = 0.2,
+        max_batch: int = 400,
+        journal_path: Optional[str] = None,
+        max_backoff: float = 30.0,
+        concurrency: int = 4,
+        max_attempts: int = 20,
+    ):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, min(max_batch, FIRESTORE_BATCH_LIMIT))
+        self.concurrency = max(1, concurrency)
+        self.max_backoff = max_backoff
+        self.max_attempts = max(1, max_attempts)
+        self.journal_path = journal_path
+        self.journal_file: Optional[str] = None
+        self._lock_file = None
+        # ドキュメントのパス -> 保留中の書き込み（古い順）
+        self._pending: "OrderedDict[str, _PendingWrite]" = OrderedDict()
+        # 取り出して commit 中のドキュメントのパス
+        self._committing: set = set()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # メトリクス
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.commits = 0
+        self.failures = 0
+        self.replayed = 0
+        self.claimed_journals = 0
+        self.dead_lettered = 0
+        # flush 時に作成済みと分かって書かなかった CREATE
+        self.skipped_creates = 0
+        self.last_commit_ms = 0.0
+        self.last_error: Optional[str] = None
+
+        if journal_path:
+            self._open_journal(journal_path)
+
+    # ===== ジャーナル =====
+    @staticmethod
+    def _journal_name(path: str, pid: int) -> str:
+        root, ext = os.path.splitext(path)
+        return f"{root}.{pid}{ext}"
+
+    @staticmethod
+    def _try_lock(path: str):
+        """path + ".lock" を排他ロックして開いたファイルを返す（他のプロセスが保持中なら None）"""
+        handle = open(path + ".lock", "a")
+        if fcntl is None:
+            return handle
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    @staticmethod
+    def _remove_journal(path: str):
+        for suffix in ("", "-wal", "-shm", ".lock"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _open_journal(self, path: str):
+        # 同じファイルを複数のワーカーが読み直すと他のワーカーの未反映分まで二重に書くので、プロセスごとに分ける
+        self.journal_file = self._journal_name(path, os.getpid())
+        self._lock_file = self._try_lock(self.journal_file)
+        if self._lock_file is None:
+            raise RuntimeError(f"書き込みジャーナルが使用中です: {self.journal_file}")
+        self._db = sqlite3.connect(self.journal_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL ならプロセスが落ちても commit 済みの行は残る（電源断までは守らない）
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS write_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                merge INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS dead_letter (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                merge INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                error TEXT NOT NULL,
+                failed_at TEXT NOT NULL
+            )"""
+        )
+        # 終了したプロセスのジャーナルを自分のジャーナルへ移してから、前回 flush できなかった書き込みを積み直す
+        self._claim_orphans(path)
+        rows = self._db.execute("SELECT id, path, merge, data FROM write_journal ORDER BY id").fetchall()
+        now = time.monotonic()
+        for journal_id, path_, mode, data in rows:
+            self._add(path_, self._from_journal(mode, self._decode(json.loads(data)), [journal_id], now))
+        self.replayed = len(rows)
+        print(f"✅ 書き込みジャーナル(SQLite)読み込み: {self.journal_file} (未反映 {len(rows)}件)")
+
+    def _claim_orphans(self, path: str):
+        """ロックの取れる他プロセスのジャーナル（と pid なしの旧形式のファイル）の行を引き取って削除する"""
+        root, ext = os.path.splitext(path)
+        pattern = re.compile(re.escape(root) + r"\.(\d+)" + re.escape(ext))
+        candidates = [path] + [
+            name for name in glob.glob(glob.escape(root) + ".*" + glob.escape(ext))
+            if pattern.fullmatch(name) and name != self.journal_file
+        ]
+        if fcntl is None and len(candidates) > 1:
+            print("⚠️ 書き込みジャーナル: ファイルロックが使えないため他プロセスのジャーナルは引き取りません")
+            candidates = [path]
+        for orphan in candidates:
+            if not os.path.exists(orphan):
+                continue
+            handle = self._try_lock(orphan)
+            if handle is None:
+                # 持ち主のプロセスが動いている
+                continue
+            try:
+                # ロックを取る間に他のプロセスが引き取って消していたら何もしない
+                if not os.path.exists(orphan):
+                    continue
+                source = sqlite3.connect(orphan, isolation_level=None)
+                try:
+                    rows = self._select(source, "SELECT path, merge, data FROM write_journal ORDER BY id")
+                    dead = self._select(source, "SELECT path, merge, data, error, failed_at FROM dead_letter ORDER BY id")
+                finally:
+                    source.close()
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT INTO write_journal (path, merge, data) VALUES (?, ?, ?)", rows)
+                self._db.executemany(
+                    "INSERT INTO dead_letter (path, merge, data, error, failed_at) VALUES (?, ?, ?, ?, ?)", dead
+                )
+                self._db.execute("COMMIT")
+                self._remove_journal(orphan)
+                self.claimed_journals += 1
+                print(f"♻️ 書き込みジャーナル引き取り: {orphan} ({len(rows)}件)")
+            finally:
+                handle.close()
+
+    @staticmethod
+    def _select(source: sqlite3.Connection, sql: str) -> list:
+        try:
+            return source.execute(sql).fetchall()
+        except sqlite3.OperationalError:
+            # 古い形式のジャーナル（テーブルがない）
+            return []
+
+    def _localize(self, data: dict) -> dict:
+        """AsyncClient の参照（shared の message_ref）を同期クライアントのものに揃える"""
+        if not any(isinstance(v, AsyncDocumentReference) for v in data.values()):
+            return data
+        return {
+            k: self.db.document(v.path) if isinstance(v, AsyncDocumentReference) else v
+            for k, v in data.items()
+        }
+
+    @staticmethod
+    def _from_journal(mode: int, data: dict, journal_ids: List[int], since: float) -> _PendingWrite:
+        if mode == CREATE:
+            return _PendingWrite(data["data"], CREATE, journal_ids, since, dependents=data.get("then"))
+        return _PendingWrite(data, mode, journal_ids, since)
+
+    def _decode(self, value):
+        if isinstance(value, dict):
+            if len(value) == 1:
+                if "$ts" in value:
+                    return datetime.fromisoformat(value["$ts"])
+                if "$inc" in value:
+                    return firestore.Increment(value["$inc"])
+                if "$ref" in value:
+                    return self.db.document(value["$ref"])
+            return {k: self._decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        return value
+
+    # ===== 書き込みを積む =====
+    def batch(self) -> _BufferedBatch:
+        return _BufferedBatch(self)
+
+    def enqueue(self, writes: List[Write]):
+        """(ドキュメントのパス, データ, 種類, 依存する書き込み) を積む（スレッドプールからも呼べる）"""
+        if not writes:
+            return
+        now = time.monotonic()
+        pending = [
+            (path, _PendingWrite(self._localize(data), mode, [], now, dependents=dependents))
+            for path, data, mode, dependents in writes
+        ]
+        rows = None
+        if self.journal_path:
+            rows = [
+                (path, write.mode, json.dumps(_encode(write.journal_data()), ensure_ascii=False))
+                for path, write in pending
+            ]
+        with self._lock:
+            if self._db and rows:
+                # 1回の呼び出し分を1トランザクションで記録
+                self._db.execute("BEGIN")
+                for (_, write), row in zip(pending, rows):
+                    cursor = self._db.execute("INSERT INTO write_journal (path, merge, data) VALUES (?, ?, ?)", row)
+                    write.journal_ids.append(cursor.lastrowid)
+                self._db.execute("COMMIT")
+            for path, write in pending:
+                self._add(path, write)
+                self.enqueued += 1
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake()
+
+    def _add(self, path: str, write: _PendingWrite):
+        previous = self._pending.get(path)
+        if previous is None:
+            self._pending[path] = write
+        else:
+            self._pending[path] = previous.then(write)
+            self.coalesced += 1
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # ===== flush =====
+    async def start(self):
+        """flush ループを起動（イベントループ上で呼ぶこと）"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        print(
+            f"✅ 書き込みバッファ起動: interval={self.flush_interval}s, "
+            f"max_batch={self.max_batch}, concurrency={self.concurrency}"
+        )
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        flush ループを止め、残りを timeout 秒まで書き込む（残った分はジャーナルから次回書く）。
+        commit 中のラウンドはキャンセルせずに終わるのを待つ（取り出し済みの書き込みを見失うと、
+        commit が成功していてもジャーナルから書き直して二重になるため）
+        """
+        deadline = time.monotonic() + timeout
+        if self._task is not None:
+            self._stopping = True
+            self._wake()
+            await self._task
+            self._task = None
+        while self.pending and time.monotonic() < deadline:
+            if not await self._flush_round():
+                await asyncio.sleep(min(self.flush_interval, max(0.0, deadline - time.monotonic())))
+        if self.pending:
+            print(f"⚠️ 書き込みバッファ: 停止時に書き切れませんでした（{self.pending}件, {self.last_error}）")
+        if self._db:
+            dead = self._db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+            self._db.close()
+            self._db = None
+            if not self.pending and not dead:
+                # 書き切ったのでファイルごと消す（残っていれば次に起動したプロセスが引き取る）
+                self._remove_journal(self.journal_file)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        print("🛑 書き込みバッファ停止")
+
+    async def flush(self):
+        """保留中の書き込みを全部 commit する（失敗したら例外）"""
+        while self.pending:
+            if not await self._flush_round():
+                raise RuntimeError(self.last_error or "commit に失敗しました")
+
+    async def _sleep(self, seconds: float):
+        """seconds 秒待つ（_wake で早めに起きる）"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run(self):
+        backoff = self.flush_interval
+        while not self._stopping:
+            await self._sleep(self.flush_interval)
+            while self.pending and not self._stopping:
+                if await self._flush_round():
+                    backoff = self.flush_interval
+                    continue
+                # 失敗したら間隔を空けて再試行（書き込みはバッファに戻してある）
+                backoff = min(backoff * 2, self.max_backoff)
+                await self._sleep(backoff)
+
+    async def _flush_round(self) -> bool:
+        """
+        古い順に最大 concurrency バッチ分を取り出して同時に commit する。
+        1回に取り出すパスは重複しないので、同じドキュメントへの書き込みの順序は入れ替わらない。
+        """
+        with self._lock:
+            chunks = []
+            while self._pending and len(chunks) < self.concurrency:
+                taken, size = [], 0
+                # 作成に依存するカウンタの加算も WriteBatch の件数に数える
+                while self._pending and (not taken or size + next(iter(self._pending.values())).weight <= self.max_batch):
+                    taken.append(self._pending.popitem(last=False))
+                    size += taken[-1][1].weight
+                chunks.append(taken)
+            paths = [path for taken in chunks for path, _ in taken]
+            self._committing.update(paths)
+        try:
+            results = await asyncio.gather(*(self._commit(taken) for taken in chunks))
+        finally:
+            with self._lock:
+                self._committing.difference_update(paths)
+        return all(results)
+
+    async def _commit(self, taken: List[Tuple[str, _PendingWrite]]) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._commit_batch, taken)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            if isinstance(e, PERMANENT_ERRORS) and len(taken) > 1:
+                # どの書き込みが不正か分からないので1件ずつ commit して切り分ける
+                print(f"⚠️ 書き込みバッファ: 不正な書き込みを含むため1件ずつ commit します ({len(taken)}件, {e})")
+                results = [await self._commit([item]) for item in taken]
+                return all(results)
+            return self._failed(taken, e)
+
+        self.last_commit_ms = (time.perf_counter() - started) * 1000
+        self.commits += 1
+        self.flushed += len(taken)
+        self._forget(taken)
+        return True
+
+    def _commit_batch(self, taken: List[Tuple[str, _PendingWrite]]):
+        """
+        taken を1つの WriteBatch で commit する。CREATE は get_all で作成済みのものを除いてから作り、
+        作成できるものの依存する書き込みだけを重ねる。確認の後に他で作られて AlreadyExists になったら確認し直す
+        """
+        creates = [(path, write) for path, write in taken if write.mode == CREATE]
+        for attempt in range(CREATE_RETRIES):
+            existing = self._existing_paths(creates)
+            writes: Dict[str, Tuple[dict, bool]] = {}
+            coalesced = 0
+            batch = self.db.batch()
+            for path, write in taken:
+                if write.mode != CREATE:
+                    _merge_into(writes, path, write.data, write.mode == MERGE)
+                elif path not in existing:
+                    batch.create(self.db.document(path), write.data)
+                    # 同じユーザーのカウンタへの加算は1件にまとめる
+                    coalesced += sum(_merge_into(writes, dependent, data, True) for dependent, data in write.dependents.items())
+            for path, (data, merge) in writes.items():
+                batch.set(self.db.document(path), data, merge=merge)
+            try:
+                batch.commit()
+            except (google_exceptions.AlreadyExists, google_exceptions.Conflict):
+                print(f"⚠️ 書き込みバッファ: 作成中に他で作られたため確認し直します ({attempt + 1}/{CREATE_RETRIES})")
+                continue
+            self.skipped_creates += len(existing)
+            self.coalesced += coalesced
+            return
+        raise RuntimeError("受信箱の作成の競合が解消しませんでした")
+
+    def _existing_paths(self, creates: List[Tuple[str, _PendingWrite]]) -> set:
+        if not creates:
+            return set()
+        refs = [self.db.document(path) for path, _ in creates]
+        # 存在確認だけなので、作るデータにあるフィールドを1つだけ取る
+        field = min(creates[0][1].data)
+        return {snapshot.reference.path for snapshot in self.db.get_all(refs, field_paths=[field]) if snapshot.exists}
+
+    def flush_paths(self, paths: Iterable[str]):
+        """
+        paths への保留中の書き込みをその場で commit する（スレッドから呼ぶ。失敗したらバッファに戻して例外）。
+        既読化などバッファを通さずに Firestore を読み書きする処理の前に呼び、積んだだけの受信箱を追い越さないようにする
+        """
+        paths = set(paths)
+        while True:
+            with self._lock:
+                # flush ループが commit 中なら終わるのを待つ（同じドキュメントの書き込み順を保つ）
+                if not paths & self._committing:
+                    taken = [(path, write) for path, write in self._pending.items() if path in paths]
+                    for path, _ in taken:
+                        del self._pending[path]
+                    self._committing.update(path for path, _ in taken)
+                    break
+            time.sleep(0.01)
+        if not taken:
+            return
+        chunks, size = [[]], 0
+        for path, write in taken:
+            if chunks[-1] and size + write.weight > self.max_batch:
+                chunks.append([])
+                size = 0
+            chunks[-1].append((path, write))
+            size += write.weight
+        try:
+            for i, chunk in enumerate(chunks):
+                try:
+                    self._commit_batch(chunk)
+                except Exception as e:
+                    self.failures += 1
+                    self.last_error = str(e)
+                    self._failed([item for rest in chunks[i:] for item in rest], e)
+                    raise
+                self.commits += 1
+                self.flushed += len(chunk)
+                self._forget(chunk)
+        finally:
+            with self._lock:
+                self._committing.difference_update(path for path, _ in taken)
+
+    def pending_paths(self, prefix: str) -> List[str]:
+        """prefix で始まるパスのうち、保留中・commit 中のもの"""
+        with self._lock:
+            return [path for path in (*self._pending, *self._committing) if path.startswith(prefix)]
+
+    def _forget(self, taken: List[Tuple[str, _PendingWrite]]):
+        """commit し終えた書き込みをジャーナルから消す"""
+        journal_ids = [journal_id for _, write in taken for journal_id in write.journal_ids]
+        if journal_ids:
+            with self._lock:
+                if self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany("DELETE FROM write_journal WHERE id = ?", [(i,) for i in journal_ids])
+                    self._db.execute("COMMIT")
+
+    def _failed(self, taken: List[Tuple[str, _PendingWrite]], error: Exception) -> bool:
+        """
+        再試行する書き込みはバッファに戻し、不正なデータか max_attempts 回失敗したものはデッドレターに移す。
+        戻したものがあれば False（呼び出し側でバックオフする）
+        """
+        retry, dead = [], []
+        for path, write in taken:
+            write.attempts += 1
+            if isinstance(error, PERMANENT_ERRORS) or write.attempts >= self.max_attempts:
+                dead.append((path, write))
+            else:
+                retry.append((path, write))
+        if dead:
+            self._dead_letter(dead, error)
+        if retry:
+            print(f"⚠️ 書き込みバッファ: commit 失敗、再試行します ({len(retry)}件, {error})")
+            self._restore(retry)
+        return not retry
+
+    def _dead_letter(self, dead: List[Tuple[str, _PendingWrite]], error: Exception):
+        for path, write in dead:
+            print(f"☠️ 書き込みバッファ: {write.attempts}回失敗したため破棄 ({path}, {error})")
+        self.dead_lettered += len(dead)
+        with self._lock:
+            if not self._db:
+                return
+            failed_at = datetime.now().isoformat()
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO dead_letter (path, merge, data, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (path, write.mode, json.dumps(_encode(write.journal_data()), ensure_ascii=False, default=str), str(error), failed_at)
+                    for path, write in dead
+                ],
+            )
+            self._db.executemany(
+                "DELETE FROM write_journal WHERE id = ?",
+                [(i,) for _, write in dead for i in write.journal_ids],
+            )
+            self._db.execute("COMMIT")
+
+    def _restore(self, taken: List[Tuple[str, _PendingWrite]]):
+        """失敗した書き込みを、その後に積まれた書き込みより前に戻す"""
+        with self._lock:
+            restored: "OrderedDict[str, _PendingWrite]" = OrderedDict(taken)
+            for path, write in self._pending.items():
+                restored[path] = restored[path].then(write) if path in restored else write
+            self._pending = restored
+
+    def is_pending(self, path: str) -> bool:
+        """path への書き込みがまだ commit されずに積まれているか（commit 中のものも含む）"""
+        with self._lock:
+            return path in self._pending or path in self._committing
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = next(iter(self._pending.values()), None)
+        return {
+            "pending": self.pending,
+            "oldest_pending_seconds": round(time.monotonic() - oldest.since, 3) if oldest else 0.0,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushed": self.flushed,
+            "commits": self.commits,
+            "failures": self.failures,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+            "skipped_creates": self.skipped_creates,
+            "last_commit_ms": round(self.last_commit_ms, 1),
+            "last_error": self.last_error,
+            "journal": self.journal_file,
+            "claimed_journals": self.claimed_journals,
+            "flush_interval": self.flush_interval,
+            "max_batch": self.max_batch,
+            "concurrency": self.concurrency,
+            "max_attempts": self.max_attempts,
+        }
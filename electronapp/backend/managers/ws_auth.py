@@ -0,0 +1,35 @@
+# managers/ws_auth.py
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+# トークンの形式: "<有効期限(UNIX秒)>.<HMAC-SHA256(secret, "<user_id>:<有効期限>")>"
+# 有効期限も署名に含めるので、書き換えると検証に失敗する
+
+
+def _signature(secret: str, user_id: str, expires_at: int) -> str:
+    return hmac.new(secret.encode(), f"{user_id}:{expires_at}".encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(secret: str, user_id: str, ttl: int, now: Optional[float] = None) -> str:
+    """user_id に対する WebSocket 接続用トークンを発行（ttl 秒で失効）"""
+    expires_at = int(now if now is not None else time.time()) + ttl
+    return f"{expires_at}.{_signature(secret, user_id, expires_at)}"
+
+
+def token_expires_at(token: Optional[str]) -> Optional[int]:
+    """トークンの有効期限（UNIX秒）。形式が不正なら None"""
+    expires_at, _, signature = (token or "").partition(".")
+    if not signature or not expires_at.isdigit():
+        return None
+    return int(expires_at)
+
+
+def verify_token(secret: str, user_id: str, token: Optional[str], now: Optional[float] = None) -> bool:
+    """署名が正しく、有効期限内なら True"""
+    expires_at = token_expires_at(token)
+    if expires_at is None or expires_at < (now if now is not None else time.time()):
+        return False
+    signature = token.partition(".")[2]
+    return hmac.compare_digest(_signature(secret, user_id, expires_at), signature)
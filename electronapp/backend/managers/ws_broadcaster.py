@@ -0,0 +1,349 @@
+# managers/ws_broadcaster.py
+import asyncio
+import bisect
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from managers import ws_codec
+from managers.pubsub import InProcessPubSub, decode_envelope, encode_envelope
+from managers.ws_registry import ConnectionRegistry
+from managers.ws_replay import ReplayBuffer
+
+# 送信レイテンシのヒストグラム境界（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def unread_update_payload(channel_id: str, delta: int, message_ids: List[str]) -> dict:
+    """未読件数の増減を知らせる unread_update（クライアントは手元の件数に delta を足し込む）"""
+    return {
+        "type": "unread_update",
+        "data": {
+            "delta": delta,
+            "channel_id": channel_id,
+            "message_ids": message_ids,
+        },
+    }
+
+
+class LatencyHistogram:
+    """累積しない単純なバケット集計（le は各バケットの上限）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "sum": self.total,
+        }
+
+
+class ClientConnection:
+    """
+    1つのWebSocket接続。送信待ちの上限付きキューと専用の書き込みタスクを持ち、
+    遅いクライアントが他のクライアントへの送信を待たせないようにする。
+    encoding が msgpack ならバイナリフレーム、json ならテキストフレームで送る。
+    """
+
+    def __init__(
+        self,
+        broadcaster: "Broadcaster",
+        user_id: str,
+        websocket: Any,
+        encoding: str = ws_codec.JSON,
+        deflate: bool = False,
+    ):
+        self.broadcaster = broadcaster
+        self.user_id = user_id
+        self.websocket = websocket
+        self.encoding = encoding
+        # permessage-deflate の圧縮自体は uvicorn が行う（ここでは集計用）
+        self.deflate = deflate
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=broadcaster.max_queue)
+        self.closed = False
+        self.latency = LatencyHistogram()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send_payload_nowait(self, payload: dict) -> bool:
+        return self.send_nowait(ws_codec.encode(payload, self.encoding))
+
+    def send_nowait(self, frame: ws_codec.Frame) -> bool:
+        """送信キューに積む。満杯ならオーバーフロー方針に従って破棄または切断"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((time.perf_counter(), frame))
+            return True
+        except asyncio.QueueFull:
+            self.broadcaster.overflows += 1
+            if self.broadcaster.overflow_policy == "disconnect":
+                print(f"🐢 送信キュー溢れのため切断: {self.user_id}")
+                self.stop()
+                self.broadcaster.spawn(self._close_socket(code=1013))
+            else:
+                self.broadcaster.dropped += 1
+            return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                enqueued_at, frame = await self.queue.get()
+                send = self.websocket.send_bytes if isinstance(frame, bytes) else self.websocket.send_text
+                try:
+                    await asyncio.wait_for(send(frame), timeout=self.broadcaster.send_timeout)
+                except Exception as e:
+                    self.broadcaster.send_failures += 1
+                    print(f"❌ 送信失敗 ({self.user_id}): {e}")
+                    await self.close()
+                    return
+                # キューに積んでから送信し終わるまでの時間
+                elapsed = time.perf_counter() - enqueued_at
+                self.latency.observe(elapsed)
+                self.broadcaster.latency.observe(elapsed)
+                self.broadcaster.sent += 1
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        """登録解除して書き込みタスクを止める（WebSocket自体は閉じない）"""
+        self.closed = True
+        self.broadcaster.unregister(self)
+        if asyncio.current_task() is not self._writer:
+            self._writer.cancel()
+
+    async def close(self, code: int = 1000):
+        """送信できなくなった接続をサーバー側から閉じる（受信ループもこれで終わる）"""
+        if self.closed:
+            return
+        self.stop()
+        await self._close_socket(code)
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            # すでに切断済み
+            pass
+
+
+class Broadcaster:
+    """
+    宛先ユーザーの全接続へ並行送信する。
+    ペイロードは1回だけシリアライズし、各接続の送信キューに積むだけなので送信側は待たない。
+    overflow_policy: "disconnect"（溢れたクライアントを切断）| "drop"（そのメッセージだけ破棄）
+
+    publish は pubsub 経由で全ワーカーに届き、各ワーカーが自分の持つ接続にだけ送る
+    （uvicorn の複数ワーカーや複数レプリカで動かす場合は unix / redis バックエンドを使う）。
+    publish したイベントにはユーザーごとの連番（seq）が付き、再接続時に取りこぼし分を再送する。
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 100,
+        overflow_policy: str = "disconnect",
+        send_timeout: float = 10.0,
+        pubsub=None,
+        replay_size: int = 50,
+        replay_max_users: int = 5000,
+    ):
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.pubsub = pubsub or InProcessPubSub()
+        self.replay = ReplayBuffer(size=replay_size, max_users=replay_max_users)
+        self.registry = ConnectionRegistry()
+        self._tasks = set()
+
+        # メトリクス
+        self.published = 0
+        self.sent = 0
+        self.dropped = 0
+        self.overflows = 0
+        self.send_failures = 0
+        self.latency = LatencyHistogram()
+
+    async def start(self):
+        await self.pubsub.start(self._on_published)
+
+    def register_metrics(self, metrics):
+        """接続数・送信件数・送信失敗・送信レイテンシを MetricsRegistry に登録（値は出力時に読む）"""
+        metrics.gauge(
+            "ws_connections",
+            "接続中のWebSocket（encoding 別）",
+            ("encoding",),
+            fn=lambda: {
+                (encoding,): count
+                for encoding, count in self.wire_formats().items()
+                if encoding != "deflate"
+            },
+        )
+        metrics.gauge("ws_connected_users", "WebSocketで接続中のユーザー数", fn=lambda: self.registry.stats()["users"])
+        metrics.gauge(
+            "ws_send_queue_frames",
+            "全接続の送信キューに溜まっているフレーム数",
+            fn=lambda: sum(connection.queue.qsize() for connection in self.registry.connections()),
+        )
+        metrics.counter("ws_published_total", "publish したイベント数", fn=lambda: self.published)
+        metrics.counter("ws_frames_sent_total", "送信し終えたフレーム数", fn=lambda: self.sent)
+        metrics.counter("ws_send_failures_total", "送信に失敗して閉じた接続の数", fn=lambda: self.send_failures)
+        metrics.counter("ws_queue_overflows_total", "送信キューが溢れた回数", fn=lambda: self.overflows)
+        metrics.counter("ws_frames_dropped_total", "送信キュー溢れで破棄したフレーム数", fn=lambda: self.dropped)
+        metrics.histogram(
+            "ws_send_latency_seconds",
+            "送信キューに積んでから送信し終わるまでの時間",
+            buckets=self.latency.buckets,
+            fn=lambda: self.latency,
+        )
+
+    async def stop(self):
+        await self.pubsub.stop()
+
+    def connect(
+        self,
+        user_id: str,
+        websocket: Any,
+        last_seq: Optional[int] = None,
+        epoch: Optional[str] = None,
+        encoding: str = ws_codec.JSON,
+        deflate: bool = False,
+    ) -> ClientConnection:
+        """
+        接続を登録する。last_seq なしなら現在の連番を hello で知らせ、
+        ありなら取りこぼしたイベントを再送（埋められなければ resync_required）する。
+        登録と再送の間に await を挟まないので、再送分はその後のイベントより必ず先に届く。
+        """
+        connection = ClientConnection(self, user_id, websocket, encoding, deflate)
+        self.registry.add(user_id, connection)
+        self.replay.track(user_id)
+
+        events = None if last_seq is None else self.replay.replay(user_id, last_seq, epoch)
+        if events is None:
+            kind = "hello" if last_seq is None else "resync_required"
+            connection.send_payload_nowait({
+                "type": kind,
+                "epoch": self.replay.epoch,
+                "seq": self.replay.current_seq(user_id),
+            })
+        elif encoding == ws_codec.JSON:
+            for text in events:
+                connection.send_nowait(text)
+        else:
+            for text in events:
+                connection.send_payload_nowait(json.loads(text))
+        return connection
+
+    def unregister(self, connection: ClientConnection):
+        self.registry.remove(connection.user_id, connection)
+
+    def disconnect(self, connection: ClientConnection):
+        """受信ループ終了時に呼ぶ（書き込みタスクも止める）"""
+        connection.stop()
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        # 実行中のタスクが GC されないよう保持
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def serialize(payload: dict) -> str:
+        return ws_codec.encode_json(payload)
+
+    async def publish(self, user_ids: Iterable[str], payload: dict) -> int:
+        """全ワーカーへ配信を依頼し、宛先ユーザー数を返す（接続を持つワーカーが送信する）"""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return 0
+        await self.pubsub.publish(encode_envelope(user_ids, self.serialize(payload)))
+        self.published += 1
+        return len(user_ids)
+
+    def _on_published(self, data: bytes):
+        user_ids, text = decode_envelope(data)
+        self._deliver(user_ids, text)
+
+    def deliver_local(self, user_ids: Iterable[str], payload: dict):
+        """
+        このワーカーの接続だけに連番付きで送る（pubsub を通さない）。
+        接続を持つワーカー自身が生成するイベント（Firestore リスナーの差分など）用。
+        """
+        self._deliver(list(dict.fromkeys(user_ids)), self.serialize(payload))
+
+    def _deliver(self, user_ids: List[str], text: str):
+        # msgpack の接続がいる場合だけ1回エンコードし、連番は差し込むだけにする
+        packed = None
+        for user_id in user_ids:
+            # このワーカーに接続したことのないユーザーは保持も送信もしない
+            stamped = self.replay.append(user_id, text)
+            if stamped is None:
+                continue
+            for connection in self.registry.sockets_for((user_id,)):
+                if connection.encoding == ws_codec.MSGPACK:
+                    if packed is None:
+                        packed = ws_codec.encode(json.loads(text), ws_codec.MSGPACK)
+                    seq = self.replay.current_seq(user_id)
+                    connection.send_nowait(ws_codec.stamp_msgpack(packed, seq, self.replay.epoch))
+                else:
+                    connection.send_nowait(stamped)
+
+    def is_connected(self, user_id: str) -> bool:
+        return self.registry.is_connected(user_id)
+
+    @property
+    def connection_count(self) -> int:
+        return self.registry.connection_count
+
+    def wire_formats(self) -> Dict[str, int]:
+        """エンコーディングごとの接続数と permessage-deflate を使う接続数"""
+        counts = {encoding: 0 for encoding in ws_codec.available_encodings()}
+        counts["deflate"] = 0
+        for connection in self.registry.connections():
+            counts[connection.encoding] = counts.get(connection.encoding, 0) + 1
+            counts["deflate"] += connection.deflate
+        return counts
+
+    def slowest_clients(self, limit: int = 5) -> List[dict]:
+        """平均送信レイテンシが大きい接続（クライアントごとのヒストグラムから）"""
+        connections = [
+            connection for connection in self.registry.connections()
+            if connection.latency.count
+        ]
+        connections.sort(key=lambda c: c.latency.total / c.latency.count, reverse=True)
+        return [
+            {
+                "user_id": connection.user_id,
+                "encoding": connection.encoding,
+                "queued": connection.queue.qsize(),
+                "avg_latency_seconds": connection.latency.total / connection.latency.count,
+                "send_latency_seconds": connection.latency.snapshot(),
+            }
+            for connection in connections[:limit]
+        ]
+
+    def stats(self) -> dict:
+        return {
+            **self.registry.stats(),
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "published": self.published,
+            "sent": self.sent,
+            "wire_formats": self.wire_formats(),
+            "dropped": self.dropped,
+            "overflows": self.overflows,
+            "send_failures": self.send_failures,
+            "send_latency_seconds": self.latency.snapshot(),
+            "slowest_clients": self.slowest_clients(),
+            "pubsub": self.pubsub.stats(),
+            "replay": self.replay.stats(),
+        }
@@ -0,0 +1,118 @@
+# managers/ws_codec.py
+import json
+import struct
+from typing import Any, Iterable, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # pyproject.toml の依存だが、入っていない環境では JSON のみ（要求されたらログに出す）
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+Frame = Union[str, bytes]
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return (MSGPACK, JSON) if msgpack is not None else (JSON,)
+
+
+def negotiate(requested: Optional[str], subprotocols: Iterable[str]) -> Tuple[str, Optional[str]]:
+    """
+    エンコーディングを決める。?encoding= を優先し、なければ Sec-WebSocket-Protocol の候補から選ぶ。
+    (エンコーディング, accept に返すサブプロトコル) を返す。対応できなければ JSON。
+    """
+    subprotocols = list(subprotocols)
+    if msgpack is None and MSGPACK in (requested, *subprotocols):
+        print("⚠️ msgpack が要求されましたが未インストールのため JSON で送ります（uv sync で msgpack を入れてください）")
+    if requested in available_encodings():
+        return requested, requested if requested in subprotocols else None
+    for protocol in subprotocols:
+        if protocol in available_encodings():
+            return protocol, protocol
+    return JSON, None
+
+
+def _uvicorn_protocol(send: Any, depth: int = 4) -> Any:
+    # starlette は ASGI の send をラップする（例外処理の sender）ので、
+    # クロージャをたどって uvicorn のプロトコルの asgi_send（バウンドメソッド）を探す
+    if send is None or depth < 0:
+        return None
+    owner = getattr(send, "__self__", None)
+    if owner is not None:
+        return owner
+    for cell in getattr(send, "__closure__", None) or ():
+        try:
+            inner = cell.cell_contents
+        except ValueError:
+            continue
+        if callable(inner):
+            found = _uvicorn_protocol(inner, depth - 1)
+            if found is not None:
+                return found
+    return None
+
+
+async def accepted_deflate(websocket: Any) -> Optional[bool]:
+    """
+    accept 後に、サーバー（uvicorn）が permessage-deflate を受け入れたかを返す。
+    Sec-WebSocket-Extensions リクエストヘッダーはクライアントの提示でしかなく、
+    uvicorn が --ws-per-message-deflate なしで起動していれば使われないので、合意した拡張を見る。
+    ASGI には合意した拡張を知る方法がないため、uvicorn の WebSocket 実装ごとに接続オブジェクトを読む。
+    判別できなければ None
+    """
+    protocol = _uvicorn_protocol(getattr(websocket, "_send", None))
+    conn = getattr(protocol, "conn", None)
+    if hasattr(protocol, "extensions"):
+        # websockets 実装（legacy）: accept はハンドシェイクを始めるだけなので、完了を待ってから読む
+        completed = getattr(protocol, "handshake_completed_event", None)
+        if completed is not None:
+            await completed.wait()
+        extensions = protocol.extensions
+    elif hasattr(conn, "extensions"):
+        # websockets-sansio 実装
+        extensions = conn.extensions
+    elif hasattr(conn, "handshake"):
+        # wsproto 実装: ハンドシェイク後の Connection が合意した拡張を持つ
+        proto = getattr(getattr(conn, "connection", None), "_proto", None)
+        if proto is None:
+            return None
+        extensions = [extension for extension in proto.extensions if extension.enabled()]
+    else:
+        return None
+    return any(getattr(extension, "name", "") == "permessage-deflate" for extension in extensions)
+
+
+def encode_json(payload: dict) -> str:
+    # starlette の send_json と同じ形式
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode(payload: dict, encoding: str) -> Frame:
+    if encoding == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return encode_json(payload)
+
+
+def stamp_msgpack(packed: bytes, seq: int, epoch: str) -> bytes:
+    """
+    msgpack の map の先頭に seq と epoch を差し込む（ReplayBuffer.stamp の msgpack 版、再エンコードしない）
+    """
+    head = packed[0]
+    if 0x80 <= head <= 0x8F:
+        size, body = head & 0x0F, packed[1:]
+    elif head == 0xDE:
+        size, body = struct.unpack(">H", packed[1:3])[0], packed[3:]
+    elif head == 0xDF:
+        size, body = struct.unpack(">I", packed[1:5])[0], packed[5:]
+    else:
+        raise ValueError("msgpack の map ではありません")
+    size += 2
+    if size <= 0x0F:
+        header = bytes([0x80 | size])
+    elif size <= 0xFFFF:
+        header = b"\xde" + struct.pack(">H", size)
+    else:
+        header = b"\xdf" + struct.pack(">I", size)
+    return header + msgpack.packb("seq") + msgpack.packb(seq) + msgpack.packb("epoch") + msgpack.packb(epoch) + body
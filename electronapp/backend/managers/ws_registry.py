@@ -0,0 +1,49 @@
+# managers/ws_registry.py
+from typing import Any, Dict, Iterable, List, Set
+
+
+class ConnectionRegistry:
+    """
+    WebSocket接続をSlackユーザーIDごとに管理する。
+    1人が複数のデスクトップクライアントから接続することもあるので、ユーザーID → 接続の集合で持つ。
+    チャンネル → 購読者は ChannelMemberCache のメンバー一覧を recipients として渡して引く。
+    """
+
+    def __init__(self):
+        self._by_user: Dict[str, Set[Any]] = {}
+
+    def add(self, user_id: str, websocket: Any):
+        self._by_user.setdefault(user_id, set()).add(websocket)
+
+    def remove(self, user_id: str, websocket: Any):
+        sockets = self._by_user.get(user_id)
+        if not sockets:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self._by_user[user_id]
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self._by_user
+
+    def sockets_for(self, user_ids: Iterable[str]) -> List[Any]:
+        """宛先ユーザーのうち接続中のユーザーの全接続（接続数全体ではなく宛先数に比例）"""
+        by_user = self._by_user
+        sockets: List[Any] = []
+        for user_id in set(user_ids):
+            if user_id in by_user:
+                sockets.extend(by_user[user_id])
+        return sockets
+
+    def connections(self) -> List[Any]:
+        return [socket for sockets in self._by_user.values() for socket in sockets]
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self._by_user.values())
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._by_user),
+            "connections": self.connection_count,
+        }
@@ -0,0 +1,94 @@
+# managers/ws_replay.py
+import secrets
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+
+class _UserLog:
+    __slots__ = ("seq", "events")
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=size)
+
+
+class ReplayBuffer:
+    """
+    ユーザーごとの連番と直近イベントのリングバッファ。
+    再接続時に last_seq を受け取り、取りこぼした分だけ再送する。
+    連番はプロセス（epoch）ごとなので、別ワーカーへ繋ぎ直した場合や
+    バッファから溢れた場合は resync_required を返し、クライアントに未読を取り直してもらう。
+    このワーカーに接続したことのあるユーザーだけを max_users 人まで保持する。
+    """
+
+    def __init__(self, size: int = 50, max_users: int = 5000):
+        self.size = size
+        self.max_users = max_users
+        self.epoch = secrets.token_hex(6)
+        self._logs: "OrderedDict[str, _UserLog]" = OrderedDict()
+
+        # メトリクス
+        self.appended = 0
+        self.replayed = 0
+        self.resyncs = 0
+        self.evictions = 0
+
+    def track(self, user_id: str):
+        """接続時に呼ぶ（以降このユーザー宛てのイベントを保持する）"""
+        if user_id not in self._logs:
+            self._logs[user_id] = _UserLog(self.size)
+            while len(self._logs) > self.max_users:
+                self._logs.popitem(last=False)
+                self.evictions += 1
+        self._logs.move_to_end(user_id)
+
+    def current_seq(self, user_id: str) -> int:
+        log = self._logs.get(user_id)
+        return log.seq if log else 0
+
+    def stamp(self, text: str, seq: int) -> str:
+        """シリアライズ済みのJSONオブジェクトの先頭に seq と epoch を差し込む（再シリアライズしない）"""
+        head = f'{{"seq":{seq},"epoch":"{self.epoch}"'
+        body = text[1:]
+        return head + ("," + body if body != "}" else body)
+
+    def append(self, user_id: str, text: str) -> Optional[str]:
+        """連番を振って保持し、連番付きのテキストを返す（保持対象外のユーザーは None）"""
+        log = self._logs.get(user_id)
+        if log is None:
+            return None
+        log.seq += 1
+        stamped = self.stamp(text, log.seq)
+        log.events.append((log.seq, stamped))
+        self.appended += 1
+        return stamped
+
+    def replay(self, user_id: str, last_seq: int, epoch: Optional[str]) -> Optional[List[str]]:
+        """last_seq より後のイベントを返す。取りこぼしを埋められない場合は None"""
+        log = self._logs.get(user_id)
+        seq = log.seq if log else 0
+        if epoch != self.epoch or last_seq > seq:
+            # 別ワーカー / 再起動前の連番
+            self.resyncs += 1
+            return None
+        if last_seq == seq:
+            return []
+        if not log.events or log.events[0][0] > last_seq + 1:
+            # バッファから溢れている
+            self.resyncs += 1
+            return None
+        events = [text for event_seq, text in log.events if event_seq > last_seq]
+        self.replayed += len(events)
+        return events
+
+    def stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "users": len(self._logs),
+            "size": self.size,
+            "max_users": self.max_users,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "resyncs": self.resyncs,
+            "evictions": self.evictions,
+        }
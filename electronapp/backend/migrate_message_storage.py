@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+users/{user_id}/messages の保存方式を移行する
+  --to shared: 本文のコピーを channels/{channel_id}/messages/{ts} に1回だけ書き、受信箱を参照と既読状態だけにする
+  --to copy  : 参照先の本文を受信箱に書き戻す（shared からの切り戻し。チャンネル側のドキュメントは残す）
+受信箱は読んだ時点の update_time を前提条件に更新するので、移行中に既読にされたものは上書きしない
+（競合したバッチは飛ばすので、もう一度実行すれば残りが移行される）。
+読み込み側はどちらの形式も扱えるので、サーバーを動かしたまま実行できる。
+先に MESSAGE_STORAGE_MODE を移行先に切り替えてから実行する。
+
+    $ uv run python migrate_message_storage.py --to shared --dry-run
+    $ uv run python migrate_message_storage.py --to shared
+    $ FIRESTORE_EMULATOR_HOST=localhost:8080 uv run python migrate_message_storage.py --to shared --user U0123
+"""
+
+import argparse
+import os
+import time
+
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud import firestore
+
+from managers.firebase_manager import (
+    CONTENT_FIELDS,
+    FIRESTORE_BATCH_LIMIT,
+    FirebaseManager,
+    message_content,
+)
+
+
+class Migration:
+    def __init__(self, manager: FirebaseManager, to: str, chunk_size: int, dry_run: bool):
+        self.manager = manager
+        self.db = manager.db
+        self.to = to
+        # 1件につき受信箱の更新1件 + （shared なら）チャンネル側の本文1件
+        self.per_batch = max(1, chunk_size // 2)
+        self.dry_run = dry_run
+        # 書き込み済みのチャンネル側ドキュメント（同じメッセージを受信者の数だけ書かない）
+        self.written = set()
+        self.stats = {"users": 0, "scanned": 0, "migrated": 0, "skipped": 0, "conflicts": 0,
+                      "content_writes": 0, "batches": 0}
+
+    def run(self, user_ids):
+        for user_id in user_ids:
+            self.migrate_user(user_id)
+            self.stats["users"] += 1
+
+    def migrate_user(self, user_id: str):
+        messages_ref = self.db.collection("users").document(user_id).collection("messages")
+        chunk = []
+        for snapshot in messages_ref.stream():
+            self.stats["scanned"] += 1
+            chunk.append(snapshot)
+            if len(chunk) >= self.per_batch:
+                self.migrate_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.migrate_chunk(chunk)
+        print(f"📦 {user_id}: {self.stats}")
+
+    def migrate_chunk(self, snapshots):
+        batch = self.db.batch()
+        content_paths = []
+        migrated = 0
+        if self.to == "shared":
+            for snapshot in snapshots:
+                data = snapshot.to_dict()
+                if "message_ref" in data or "text" not in data:
+                    self.stats["skipped"] += 1
+                    continue
+                channel_id = data.get("channel_id")
+                content_ref = self.manager.channel_message_ref(channel_id, snapshot.id)
+                if content_ref.path not in self.written:
+                    batch.set(content_ref, message_content(
+                        data.get("sender_id"),
+                        data.get("slack_message_id") or snapshot.id,
+                        channel_id,
+                        data.get("text"),
+                        data.get("is_ai", False),
+                        data.get("is_bot", False),
+                        data.get("channel_type", "im"),
+                        data.get("created_at") or data.get("timestamp"),
+                    ))
+                    content_paths.append(content_ref.path)
+                # 受信箱から本文側のフィールドを消して参照に置き換える（is_see はそのまま）
+                update = {field: firestore.DELETE_FIELD for field in (*CONTENT_FIELDS, "receiver_id") if field in data}
+                update["message_ref"] = content_ref
+                update["slack_message_id"] = data.get("slack_message_id") or snapshot.id
+                batch.update(
+                    snapshot.reference,
+                    update,
+                    option=self.db.write_option(last_update_time=snapshot.update_time),
+                )
+                migrated += 1
+        else:
+            shared = [s for s in snapshots if "message_ref" in s.to_dict()]
+            self.stats["skipped"] += len(snapshots) - len(shared)
+            refs = {s.get("message_ref").path: s.get("message_ref") for s in shared}
+            contents = {
+                content.reference.path: content.to_dict()
+                for content in self.db.get_all(list(refs.values()))
+                if content.exists
+            }
+            for snapshot in shared:
+                content = contents.get(snapshot.get("message_ref").path)
+                if content is None:
+                    # 参照先が無いものは戻せない
+                    self.stats["skipped"] += 1
+                    continue
+                user_id = snapshot.reference.parent.parent.id
+                update = {field: content[field] for field in CONTENT_FIELDS if field in content}
+                update["receiver_id"] = user_id
+                update["message_ref"] = firestore.DELETE_FIELD
+                batch.update(
+                    snapshot.reference,
+                    update,
+                    option=self.db.write_option(last_update_time=snapshot.update_time),
+                )
+                migrated += 1
+
+        if not migrated:
+            return
+        if not self.dry_run:
+            try:
+                batch.commit()
+            except FailedPrecondition:
+                # 読んだ後に既読化などで更新された。このチャンクは次回の実行で移行する
+                print(f"⚠️ 競合のため {migrated}件をスキップ（再実行で移行されます）")
+                self.stats["conflicts"] += migrated
+                return
+        self.written.update(content_paths)
+        self.stats["content_writes"] += len(content_paths)
+        self.stats["migrated"] += migrated
+        self.stats["batches"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--to", choices=["shared", "copy"], required=True)
+    parser.add_argument("--user", action="append", help="対象ユーザー（複数指定可、省略時は全員）")
+    parser.add_argument("--chunk-size", type=int, default=FIRESTORE_BATCH_LIMIT)
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに件数だけ数える")
+    parser.add_argument("--project", default="demo-fk2505", help="エミュレータ使用時のプロジェクトID")
+    args = parser.parse_args()
+
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        manager = FirebaseManager(firestore.Client(project=args.project))
+    else:
+        from firebasemanager import firebase_manager as manager
+
+    user_ids = args.user or [doc.id for doc in manager.db.collection("users").select(["user_id"]).stream()]
+    migration = Migration(manager, args.to, min(args.chunk_size, FIRESTORE_BATCH_LIMIT), args.dry_run)
+    started = time.perf_counter()
+    migration.run(user_ids)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {args.to} への移行{'（dry-run）' if args.dry_run else ''}: {migration.stats} ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -55,6 +55,9 @@ function App() {
   // Slackフグのサイズ管理
   const [slackFishScale, setSlackFishScale] = useState(1);
 
+  // Slackの未読件数（unread_update の差分で更新）
+  const [unreadCount, setUnreadCount] = useState(0);
+
   const inputRef = useRef<HTMLInputElement>(null);
   const buttonRef = useRef<HTMLButtonElement>(null);
 
@@ -122,20 +125,64 @@ function App() {
       }
     };
 
+    // 未読件数をサーバーのカウンタから取得
+    const refreshUnreadCount = async () => {
+      try {
+        setUnreadCount(await api.getUnreadCount());
+      } catch (error) {
+        console.error("❌ 未読件数の取得失敗:", error);
+      }
+    };
+    refreshUnreadCount();
+
     // 未読メッセージ更新を受信
     const handleUnreadUpdate = (data: any) => {
       console.log("📋 未読更新受信:", data);
+      // 件数の差分（新着 +1 / 既読 -n）
+      if (typeof data.delta === "number") {
+        setUnreadCount((prev) => Math.max(0, prev + data.delta));
+      }
       if (data.all_unread_messages) {
         setMessages(data.all_unread_messages);
       }
     };
 
+    // 未読の変更（サーバーのFirestoreリスナーから）: 追加分を先頭に足し、既読になった分を外す
+    const handleUnreadFeed = (data: { added: Message[]; removed: string[] }) => {
+      setAppMessages((prev) => {
+        const removed = new Set(data.removed || []);
+        const current = (prev.slack || []).filter(
+          (m: any) => !removed.has(m.id) && !removed.has(m.timestamp)
+        );
+        // 緊急メッセージは new_message でも届く（id は Slack ts、new_message 側は timestamp が ts）
+        const known = new Set(current.flatMap((m: any) => [m.id, m.timestamp]));
+        const added = (data.added || []).filter((m: any) => !known.has(m.id));
+        return { ...prev, slack: [...added, ...current] };
+      });
+    };
+
+    // 再接続時に取りこぼしを再送できなかった場合だけ未読を取り直す
+    const handleResyncRequired = async () => {
+      refreshUnreadCount();
+      try {
+        const unreadMessages = await api.getUnreadMessages("slack");
+        setAppMessages((prev) => ({
+          ...prev,
+          slack: unreadMessages,
+        }));
+      } catch (error) {
+        console.error("❌ 未読メッセージの再取得失敗:", error);
+      }
+    };
+
     // イベントリスナーを登録
     wsService.on("connected", handleConnected);
     wsService.on("disconnected", handleDisconnected);
     wsService.on("error", handleError);
     wsService.on("new_message", handleNewMessage);
     wsService.on("unread_update", handleUnreadUpdate);
+    wsService.on("resync_required", handleResyncRequired);
+    wsService.on("unread_feed", handleUnreadFeed);
 
     // 通知許可を要求
     if (Notification.permission === "default") {
@@ -150,6 +197,8 @@ function App() {
       wsService.off("error", handleError);
       wsService.off("new_message", handleNewMessage);
       wsService.off("unread_update", handleUnreadUpdate);
+      wsService.off("resync_required", handleResyncRequired);
+      wsService.off("unread_feed", handleUnreadFeed);
       wsService.disconnect();
     };
   }, [currentApp]); // currentAppを依存配列に追加
@@ -558,7 +607,9 @@ function App() {
           }}
         >
           <div className="slack-bubble">
-            <div className="slack-badge">💬 Slack</div>
+            <div className="slack-badge">
+              💬 Slack{unreadCount > 0 ? ` (${unreadCount})` : ""}
+            </div>
             <div className="slack-message-text">{newMessage.text}</div>
             <div className="slack-message-user">@{newMessage.user}</div>
           </div>
@@ -3,7 +3,50 @@ import axios from "axios";
 const API_BASE = "http://localhost:8000";
 const testUserId = "U09HETVRA6Q"; // 🔹 Firestore上のSlackユーザーID（本人）
 const testChannelId = "C09K9G97HJM"; // 🔹 テスト用SlackチャンネルID
+const UNREAD_PAGE_LIMIT = 500; // 🔹 未読一覧の1ページの件数（サーバーの上限）
+
+// 🔹 /ws の接続トークン（/register-user と /ws-token の応答を保存して使う）
+const WS_TOKEN_KEY = "ws_token";
+const WS_TOKEN_EXPIRES_KEY = "ws_token_expires_at";
+const WS_TOKEN_REFRESH_MARGIN = 24 * 60 * 60; // 期限までこの秒数を切ったら接続前に更新する
+
+const saveWsToken = (data: any) => {
+  if (!data?.ws_token) return;
+  localStorage.setItem(WS_TOKEN_KEY, data.ws_token);
+  localStorage.setItem(WS_TOKEN_EXPIRES_KEY, String(data.ws_token_expires_at ?? 0));
+};
+
 export const api = {
+  // ユーザー登録（Slack OAuth の認可コードなど）。応答の ws_token を保存して WebSocket 接続に使う
+  registerUser: async (user: {
+    real_name?: string;
+    display_name?: string;
+    email?: string;
+    slack_code?: string;
+  }) => {
+    const res = await axios.post(`${API_BASE}/register-user`, user);
+    saveWsToken(res.data);
+    return res.data;
+  },
+
+  // WebSocket 接続用の ws_token（期限が近ければ /ws-token で更新する。未登録なら環境変数の値）
+  getWsToken: async (userId: string): Promise<string> => {
+    const token = localStorage.getItem(WS_TOKEN_KEY) || process.env.REACT_APP_WS_TOKEN || "";
+    const expiresAt = Number(localStorage.getItem(WS_TOKEN_EXPIRES_KEY) || 0);
+    if (!token || !expiresAt || expiresAt - Date.now() / 1000 > WS_TOKEN_REFRESH_MARGIN) {
+      return token;
+    }
+    try {
+      const res = await axios.post(`${API_BASE}/ws-token`, { user_id: userId, ws_token: token });
+      saveWsToken(res.data);
+      return res.data.ws_token;
+    } catch (error: any) {
+      // 期限切れなら /register-user からやり直す必要がある
+      console.error("❌ ws_token 更新エラー:", error.response?.data || error.message);
+      return token;
+    }
+  },
+
   // 返信送信（モック版）
   sendReply: async (channel: string, text: string, threadTs?: string) => {
     console.log("🌐 HTTP POST (モック):", `${API_BASE}/slack/reply`, {
@@ -47,6 +90,12 @@ export const api = {
     }
   },
 
+  // 未読件数取得（サーバー側のカウンタを読むだけ、以降は unread_update の差分で更新）
+  getUnreadCount: async (): Promise<number> => {
+    const res = await axios.get(`${API_BASE}/messages/unread/${testUserId}/count`);
+    return res.data?.count ?? 0;
+  },
+
   // 未読メッセージ取得（モック版）
   getUnreadMessages: async (appId?: string) => {
     // --- テスト用にSlackなら固定ユーザーIDを設定 ---
@@ -62,12 +111,19 @@ export const api = {
 
     try {
       // --- 実際のバックエンド呼び出し ---
-      const res = await axios.get(endpoint);
-      console.log("✅ 未読メッセージ取得成功:", res.data);
-
-      // Firestore形式（{ count, messages }）に対応
-      if (res.data?.messages) return res.data.messages;
-      return res.data || [];
+      // ページ単位（{ count: 総数, page_count, messages, next_cursor }）なので next_cursor が無くなるまで続きを取る
+      const messages: any[] = [];
+      let cursor: string | null = null;
+      do {
+        const res: any = await axios.get(endpoint, {
+          params: { limit: UNREAD_PAGE_LIMIT, ...(cursor ? { cursor } : {}) },
+        });
+        if (!res.data?.messages) return res.data || [];
+        messages.push(...res.data.messages);
+        cursor = res.data.next_cursor ?? null;
+      } while (cursor);
+      console.log("✅ 未読メッセージ取得成功:", messages.length, "件");
+      return messages;
     } catch (error: any) {
       console.error(
         "❌ 未読メッセージ取得エラー:",
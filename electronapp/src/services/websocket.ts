@@ -1,13 +1,37 @@
+import { api } from "./api";
+
+// 🔹 Firestore上のSlackユーザーID（本人）。サーバーはこのユーザー宛てのメッセージだけを送る
+const slackUserId = process.env.REACT_APP_SLACK_USER_ID || "U09HETVRA6Q";
+
+// 🔹 ws_token は /register-user で発行されたもの（api.getWsToken が保存・更新する）
+// 🔹 再接続時は最後に受け取った seq / epoch を送り、取りこぼした分だけ再送してもらう
+const withUserParams = (url: string, wsToken: string, lastSeq: number | null, epoch: string | null) => {
+  const params = new URLSearchParams({ user_id: slackUserId });
+  if (wsToken) params.set("token", wsToken);
+  if (lastSeq !== null && epoch) {
+    params.set("last_seq", String(lastSeq));
+    params.set("epoch", epoch);
+  }
+  return `${url}${url.includes("?") ? "&" : "?"}${params.toString()}`;
+};
+
 class WebSocketService {
   private ws: WebSocket | null = null;
   private reconnectInterval: number = 5000;
   private reconnectTimer: NodeJS.Timeout | null = null;
   private listeners: Map<string, Function[]> = new Map();
+  private lastSeq: number | null = null;
+  private epoch: string | null = null;
+  // トークン取得中に disconnect された接続を開かないための世代
+  private generation: number = 0;
 
-  connect(url: string = process.env.REACT_APP_WS_URL || 'ws://localhost:8000') {
+  async connect(url: string = process.env.REACT_APP_WS_URL || 'ws://localhost:8000') {
     console.log('🔍 環境変数 REACT_APP_WS_URL:', process.env.REACT_APP_WS_URL);
-    console.log('🔌 WebSocket接続先:', url);
-    this.ws = new WebSocket(url);
+    console.log('🔌 WebSocket接続先:', url, 'last_seq:', this.lastSeq);
+    const generation = ++this.generation;
+    const wsToken = await api.getWsToken(slackUserId);
+    if (generation !== this.generation) return;
+    this.ws = new WebSocket(withUserParams(url, wsToken, this.lastSeq, this.epoch));
 
     this.ws.onopen = () => {
       console.log('🔌 WebSocket connected');
@@ -23,21 +47,41 @@ class WebSocketService {
     };
 
     this.ws.onmessage = (event) => {
-      console.log('📬 WebSocket RAW受信:', event.data);
       try {
         // pongメッセージの場合はJSON解析をスキップ
         if (event.data === 'pong') {
-          console.log('🏓 WebSocket pong受信');
           return;
         }
 
+        // 1回だけ解析し、ログは種別と連番のみ（本文を整形して何度も出さない）
         const data = JSON.parse(event.data);
-        console.log('📨 WebSocket JSON解析成功:', JSON.stringify(data, null, 2));
+
+        // 接続時の基準（hello）と再送できなかった場合（resync_required）は連番を取り直す
+        if (data.type === 'hello' || data.type === 'resync_required') {
+          this.epoch = data.epoch;
+          this.lastSeq = data.seq;
+          if (data.type === 'resync_required') {
+            console.log('🔄 取りこぼしを再送できないため未読を取り直します');
+            this.emit('resync_required', data);
+          }
+          return;
+        }
+
+        // 連番付きイベント: 受信済みの再送分は捨てる
+        if (typeof data.seq === 'number') {
+          if (data.epoch === this.epoch && this.lastSeq !== null && data.seq <= this.lastSeq) {
+            console.log('⏭️ 受信済みのイベントをスキップ:', data.seq);
+            return;
+          }
+          this.epoch = data.epoch;
+          this.lastSeq = data.seq;
+        }
+
         this.emit('message', data);
 
         // イベントタイプ別に配信
         if (data.type) {
-          console.log('📨 WebSocketイベント配信:', data.type, JSON.stringify(data.data, null, 2));
+          console.log('📨 WebSocket受信:', data.type, data.seq ?? '');
           this.emit(data.type, data.data);
         }
       } catch (e) {
@@ -100,6 +144,7 @@ class WebSocketService {
   }
 
   disconnect() {
+    this.generation++;
     if (this.reconnectTimer) {
       clearTimeout(this.reconnectTimer);
       this.reconnectTimer = null;
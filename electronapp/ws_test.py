@@ -1,10 +1,23 @@
 #!/usr/bin/env python3
 """
-WebSocketテストサーバー
-10秒ごとにダミーメッセージを送信
+WebSocketテストサーバー / 負荷テストハーネス
+
+    # テストサーバー: 一定間隔でダミーメッセージを送信
+    $ python ws_test.py [serve] [--interval 5]
+
+    # 負荷テスト: N本のクライアントで接続し、サーバーの Pub/Sub に緊急メッセージを発行して
+    # 発行(sent_at)から受信までの遅延を計測
+    # （サーバーは PUBSUB_BACKEND=unix か redis で起動し、同じマシンで実行すること。時刻を比較するため）
+    # （接続トークンはサーバーと同じ WS_AUTH_SECRET を環境変数か --ws-auth-secret で渡して作る）
+    $ PUBSUB_BACKEND=unix python ws_test.py load --url ws://localhost:8000/ws --clients 1000 --duration 60
 """
 
+import argparse
 import asyncio
+import os
+import random
+import statistics
+import sys
 import websockets
 import json
 import time
@@ -54,12 +67,12 @@ async def handle_client(websocket):
     finally:
         await unregister_client(websocket)
 
-async def send_periodic_messages():
+async def send_periodic_messages(interval: float = 5):
     """定期的にメッセージを送信"""
     message_count = 0
     
     while True:
-        await asyncio.sleep(5)  # 10秒待機
+        await asyncio.sleep(interval)
         
         if not connected_clients:
             print("⏳ 接続されたクライアントがありません")
@@ -76,46 +89,26 @@ async def send_periodic_messages():
                 "user": "U1234567890",
                 "text": f"テストメッセージ #{message_count} - {datetime.now().strftime('%H:%M:%S')}",
                 "timestamp": str(int(time.time()))
-            }
-        }
-        
-        # 未読更新メッセージも送信
-        unread_update = {
-            "type": "unread_update",
-            "data": {
-                "total_unread": message_count,
-                "latest_message": test_message["data"],
-                "all_unread_messages": [test_message["data"]],
-                "has_new_message": True
-            }
+            },
+            "sent_at": time.time()
         }
         
-        # 全クライアントに送信
-        disconnected_clients = set()
-        for client in connected_clients:
-            try:
-                # 新メッセージのみ送信（未読更新は重複するため削除）
-                await client.send(json.dumps(test_message))
-                print(f"📤 メッセージ送信完了: {message_count}件")
-            except websockets.exceptions.ConnectionClosed:
-                disconnected_clients.add(client)
-        
-        # 切断されたクライアントを削除
-        for client in disconnected_clients:
-            await unregister_client(client)
+        # 全クライアントに送信（シリアライズは1回、遅いクライアントは待たない）
+        websockets.broadcast(connected_clients, json.dumps(test_message, ensure_ascii=False))
+        print(f"📤 メッセージ送信完了: {message_count}件 ({len(connected_clients)}クライアント)")
 
-async def main():
-    """メイン関数"""
+async def serve(interval: float = 5):
+    """テストサーバーを起動"""
     print("🚀 WebSocketテストサーバー開始")
     print("📡 ポート: 8000")
-    print("🔄 10秒ごとにメッセージ送信")
+    print(f"🔄 {interval}秒ごとにメッセージ送信")
     print("=" * 50)
     
     # WebSocketサーバーを開始
     server = await websockets.serve(handle_client, "localhost", 8000)
     
     # 定期的なメッセージ送信タスクを開始
-    message_task = asyncio.create_task(send_periodic_messages())
+    message_task = asyncio.create_task(send_periodic_messages(interval))
     
     try:
         await server.wait_closed()
@@ -125,5 +118,148 @@ async def main():
         server.close()
         await server.wait_closed()
 
+
+# =========================================================
+# 📈 負荷テストハーネス
+# =========================================================
+def load_url(url: str, user_id: str, secret: str) -> str:
+    """接続URL（サーバーと同じ WS_AUTH_SECRET を渡せば ws_token を付ける）"""
+    separator = "&" if "?" in url else "?"
+    url = f"{url}{separator}user_id={user_id}"
+    if secret:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        from managers.ws_auth import issue_token
+        url += f"&token={issue_token(secret, user_id, 24 * 3600)}"
+    return url
+
+
+async def load_client(url: str, index: int, latencies: list, stop: asyncio.Event, counters: dict, secret: str = ""):
+    """1クライアント分: 接続して受信メッセージの sent_at から遅延を記録"""
+    try:
+        async with websockets.connect(load_url(url, f"ULOAD{index:05d}", secret), max_queue=None) as ws:
+            counters["connected"] += 1
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                received_at = time.time()
+                if raw == "pong":
+                    continue
+                data = json.loads(raw)
+                # hello / resync_required など sent_at のないフレームは数えない
+                if "sent_at" in data:
+                    latencies.append(received_at - data["sent_at"])
+                    counters["received"] += 1
+    except Exception as e:
+        counters["errors"] += 1
+        if counters["errors"] <= 5:
+            print(f"❌ クライアント{index} エラー: {e}")
+
+
+def create_publisher(args):
+    """サーバーと同じ Pub/Sub バックエンドに発行する Broadcaster（backend/ のモジュールを使う）"""
+    if args.pubsub_backend == "memory":
+        raise SystemExit("❌ PUBSUB_BACKEND=memory のサーバーには外から発行できません（unix か redis で起動してください）")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from managers.pubsub import create_pubsub
+    from managers.ws_broadcaster import Broadcaster
+
+    return Broadcaster(
+        pubsub=create_pubsub(args.pubsub_backend, args.pubsub_socket_dir, args.redis_url, args.pubsub_channel)
+    )
+
+
+async def publish_messages(publisher, user_ids: list, rate: float, recipients: int, stop: asyncio.Event, counters: dict):
+    """rate 件/秒で、接続中のユーザーから recipients 人を選んで緊急メッセージを発行する"""
+    count = 0
+    while not stop.is_set():
+        count += 1
+        payload = {
+            "type": "new_message",
+            "data": {
+                "id": f"load_msg_{count}",
+                "channel": "CLOADTEST",
+                "user": "ULOADSENDER",
+                "text": f"負荷テストメッセージ #{count}",
+                "timestamp": str(time.time()),
+                "urgency": "高",
+            },
+            "sent_at": time.time(),
+        }
+        counters["expected"] += await publisher.publish(random.sample(user_ids, min(recipients, len(user_ids))), payload)
+        counters["published"] += 1
+        await asyncio.sleep(1 / rate)
+
+
+async def load(args):
+    """clients 本の接続を張り、duration 秒間サーバーの Pub/Sub に発行して配信遅延を集計"""
+    url, clients, duration, ramp = args.url, args.clients, args.duration, args.ramp
+    publisher = create_publisher(args)
+    latencies = []
+    counters = {"connected": 0, "received": 0, "errors": 0, "published": 0, "expected": 0}
+    stop = asyncio.Event()
+
+    print(f"📈 負荷テスト開始: {url} に {clients}クライアント接続 ({duration}秒)")
+    tasks = []
+    for i in range(clients):
+        tasks.append(asyncio.create_task(load_client(url, i, latencies, stop, counters, args.ws_auth_secret)))
+        # 接続を少しずつ張る
+        await asyncio.sleep(ramp / clients)
+    print(f"🔌 接続済み: {counters['connected']}/{clients}")
+
+    user_ids = [f"ULOAD{i:05d}" for i in range(clients)]
+    publish_task = asyncio.create_task(
+        publish_messages(publisher, user_ids, args.rate, args.recipients, stop, counters)
+    )
+    await asyncio.sleep(duration)
+    stop.set()
+    await publish_task
+    # 発行済みの分が届くまで少し待ってから切断
+    await asyncio.sleep(1)
+    await asyncio.gather(*tasks)
+    await publisher.stop()
+
+    print("=" * 50)
+    print(
+        f"📊 接続 {counters['connected']} / 発行 {counters['published']}件（宛先のべ {counters['expected']}人） "
+        f"/ 受信 {counters['received']}件 / エラー {counters['errors']}"
+    )
+    if latencies:
+        latencies.sort()
+        pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+        print(
+            f"📊 配信遅延 p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms max={latencies[-1] * 1000:.1f}ms"
+        )
+    else:
+        print("⚠️ sent_at 付きのメッセージを受信できませんでした")
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="WebSocketテストサーバー / 負荷テスト")
+    parser.add_argument("mode", nargs="?", choices=["serve", "load"], default="serve")
+    parser.add_argument("--interval", type=float, default=5, help="serve: 送信間隔（秒）")
+    parser.add_argument("--url", default="ws://localhost:8000/ws", help="load: 接続先")
+    parser.add_argument("--clients", type=int, default=1000, help="load: 接続数")
+    parser.add_argument("--duration", type=float, default=60, help="load: 計測時間（秒）")
+    parser.add_argument("--ramp", type=float, default=10, help="load: 全接続を張り終えるまでの秒数")
+    parser.add_argument("--rate", type=float, default=10, help="load: 1秒あたりの発行数")
+    parser.add_argument("--recipients", type=int, default=100, help="load: 1メッセージの宛先数")
+    # サーバーと同じ署名鍵で ws_token を作る（サーバーが WS_AUTH_DISABLED=true なら不要）
+    parser.add_argument("--ws-auth-secret", default=os.getenv("WS_AUTH_SECRET", ""), help="load: ws_token の署名鍵")
+    # 発行先はサーバーと同じ Pub/Sub 設定（既定は環境変数から）
+    parser.add_argument("--pubsub-backend", default=os.getenv("PUBSUB_BACKEND", "unix"), help="load: unix / redis")
+    parser.add_argument("--pubsub-socket-dir", default=os.getenv("PUBSUB_SOCKET_DIR", "/tmp/fk_2505_pubsub"))
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    parser.add_argument("--pubsub-channel", default=os.getenv("PUBSUB_CHANNEL", "urgent-messages"))
+    args = parser.parse_args()
+
+    if args.mode == "load":
+        asyncio.run(load(args))
+    else:
+        asyncio.run(serve(args.interval))
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()